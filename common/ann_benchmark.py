@@ -0,0 +1,240 @@
+import json
+import time
+
+import numpy as np
+
+
+def normalize(vectors):
+    """L2-normalize rows as float32 (cosine similarity becomes a dot product)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def synthetic_vectors(num_vectors, dim, num_clusters=100, spread=0.35, seed=0):
+    """
+    Clustered random unit vectors standing in for real embeddings.
+
+    Uniform random vectors are nearly equidistant in high dimensions, which
+    makes ANN search look unrealistically hard; a Gaussian mixture has the
+    neighbourhood structure of real image embeddings.
+
+    Args:
+        num_vectors (int): Number of vectors
+        dim (int): Vector dimension
+        num_clusters (int): Number of mixture components
+        spread (float): Standard deviation around each (unit) cluster center
+        seed (int): Random seed
+
+    Returns:
+        numpy.ndarray: (num_vectors, dim) float32 unit vectors
+    """
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((num_clusters, dim)))
+    labels = rng.integers(num_clusters, size=num_vectors)
+    noise = rng.standard_normal((num_vectors, dim)).astype(np.float32) * (spread / np.sqrt(dim))
+    return normalize(centers[labels] + noise)
+
+
+def split_queries(vectors, num_queries, seed=0):
+    """
+    Hold out random rows as queries.
+
+    Args:
+        vectors (numpy.ndarray): Embedding set
+        num_queries (int): Number of rows to hold out
+        seed (int): Random seed
+
+    Returns:
+        tuple: (base vectors, query vectors)
+    """
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    return vectors[order[num_queries:]], vectors[order[:num_queries]]
+
+
+def brute_force_topk(base, queries, k, block_size=1024):
+    """
+    Exact cosine top-k by blocked matrix multiplication.
+
+    Args:
+        base (numpy.ndarray): (N, D) indexed vectors
+        queries (numpy.ndarray): (Q, D) query vectors
+        k (int): Neighbours per query
+        block_size (int): Queries per matmul block (bounds memory to block_size x N)
+
+    Returns:
+        numpy.ndarray: (Q, k) row indices into `base`, nearest first
+    """
+    base = normalize(base)
+    queries = normalize(queries)
+    k = min(k, len(base))
+    result = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), block_size):
+        scores = queries[start:start + block_size] @ base.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        result[start:start + block_size] = np.take_along_axis(top, order, axis=1)
+    return result
+
+
+def recall_at_k(found, ground_truth, k):
+    """
+    Mean fraction of the true top-k returned in the first k results.
+
+    Args:
+        found (list): Per query, the row indices returned by the index
+        ground_truth (numpy.ndarray): (Q, >=k) exact neighbours
+        k (int): Cutoff
+
+    Returns:
+        float: recall@k in [0, 1]
+    """
+    hits = 0
+    for ids, truth in zip(found, ground_truth):
+        hits += len(set(ids[:k]) & set(truth[:k].tolist()))
+    return hits / (k * len(ground_truth))
+
+
+def latency_stats(latencies):
+    """
+    Summarize per-query latencies.
+
+    Args:
+        latencies (list): Seconds per query
+
+    Returns:
+        dict: p50/p95/p99 and mean latency in milliseconds
+    """
+    ms = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def run_queries(search_fn, queries, top_k, warmup=10):
+    """
+    Run queries one at a time, as an online service would see them.
+
+    Args:
+        search_fn: Callable (query vector, top_k) -> list of row indices
+        queries (numpy.ndarray): Query vectors
+        top_k (int): Results per query
+        warmup (int): Untimed queries run first
+
+    Returns:
+        tuple: (results per query, latency per query in seconds, wall seconds)
+    """
+    for query in queries[:warmup]:
+        search_fn(query, top_k)
+
+    results, latencies = [], []
+    start = time.perf_counter()
+    for query in queries:
+        t0 = time.perf_counter()
+        results.append(search_fn(query, top_k))
+        latencies.append(time.perf_counter() - t0)
+    return results, latencies, time.perf_counter() - start
+
+
+def run_sweep(build_fn, search_fn, base, queries, builds, searches, top_k=10, ground_truth=None):
+    """
+    Measure recall@k, QPS, latency percentiles and build time over a parameter grid.
+
+    Args:
+        build_fn: Callable (base vectors, build params) building the index for them
+        search_fn: Callable (query vector, top_k, search params) -> list of row indices into `base`
+        base (numpy.ndarray): Indexed vectors
+        queries (numpy.ndarray): Query vectors
+        builds (list): (name, build params) pairs; each is built once
+        searches: Callable (build params) -> list of search params to sweep for that build
+        top_k (int): Results per query (recall is measured at this k)
+        ground_truth (numpy.ndarray): Exact neighbours; computed by brute force if None
+
+    Returns:
+        list: One result dict per (build, search params) combination
+    """
+    if ground_truth is None:
+        start = time.perf_counter()
+        ground_truth = brute_force_topk(base, queries, top_k)
+        print(f"Brute-force ground truth for {len(queries)} queries in {time.perf_counter() - start:.2f}s")
+
+    rows = []
+    for name, build_params in builds:
+        start = time.perf_counter()
+        build_fn(base, build_params)
+        build_seconds = time.perf_counter() - start
+        print(f"Built '{name}' in {build_seconds:.2f}s")
+
+        for search_params in searches(build_params):
+            results, latencies, elapsed = run_queries(
+                lambda query, k: search_fn(query, k, search_params), queries, top_k
+            )
+            row = {
+                "build": name,
+                "build_params": build_params,
+                "search_params": search_params,
+                "build_s": build_seconds,
+                f"recall@{top_k}": recall_at_k(results, ground_truth, top_k),
+                "qps": len(queries) / elapsed,
+                **latency_stats(latencies),
+            }
+            rows.append(row)
+            print(format_row(row, top_k))
+    return rows
+
+
+def format_row(row, top_k):
+    """One-line summary of a sweep result"""
+    return (
+        f"{row['build']:<16} {json.dumps(row['search_params']):<24} "
+        f"recall@{top_k} {row[f'recall@{top_k}']:.4f}  {row['qps']:8.1f} qps  "
+        f"p50 {row['p50_ms']:.2f}ms  p95 {row['p95_ms']:.2f}ms  p99 {row['p99_ms']:.2f}ms  "
+        f"build {row['build_s']:.1f}s"
+    )
+
+
+def load_vectors(args):
+    """
+    Load the benchmark embedding set from `--vectors`, or generate synthetic vectors.
+
+    Args:
+        args: Parsed arguments from a parser set up with `add_benchmark_arguments`
+
+    Returns:
+        tuple: (base vectors, query vectors), both unit-normalized float32
+    """
+    if args.vectors:
+        vectors = normalize(np.load(args.vectors, mmap_mode="r"))
+        print(f"Loaded {len(vectors)} x {vectors.shape[1]} vectors from {args.vectors}")
+    else:
+        vectors = synthetic_vectors(args.synthetic + args.num_queries, args.dim, seed=args.seed)
+        print(f"Generated {len(vectors)} synthetic {args.dim}-d vectors")
+
+    if args.queries:
+        return vectors, normalize(np.load(args.queries))
+    return split_queries(vectors, args.num_queries, seed=args.seed)
+
+
+def add_benchmark_arguments(parser):
+    """Add the embedding-set, query and report options shared by the benchmark scripts"""
+    parser.add_argument("--vectors", default=None,
+                        help="Stored embedding set (.npy, N x D); synthetic vectors when omitted")
+    parser.add_argument("--queries", default=None,
+                        help="Query vectors (.npy); by default --num_queries rows are held out of the set")
+    parser.add_argument("--num_queries", type=int, default=1000, help="Number of held-out queries")
+    parser.add_argument("--synthetic", type=int, default=100_000, help="Number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of synthetic vectors")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for synthetic data and query split")
+    parser.add_argument("--top_k", type=int, default=10, help="Results per query; recall is measured at this k")
+    parser.add_argument("--report", default=None, help="Write all results to this JSON file")
+
+
+def write_report(rows, path):
+    """Write sweep results to a JSON file"""
+    with open(path, "w") as f:
+        json.dump(rows, f, indent=2)
+    print(f"Wrote {len(rows)} results to {path}")
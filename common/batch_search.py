@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+
+from common.scanner import IMAGE_EXTENSIONS, scan_images
+
+
+def load_query_paths(source, extensions=IMAGE_EXTENSIONS):
+    """Resolve a query argument to a list of query image paths
+
+    A directory is scanned recursively, an image file is a single query, and
+    any other file is read as a list of image paths, one per line.
+
+    Args:
+        source (str): Image file, directory, or text file listing images
+        extensions (tuple): Lower-case image file extensions
+
+    Returns:
+        list: Query image paths
+    """
+    if os.path.isdir(source):
+        return scan_images(source, extensions=extensions)
+
+    if source.lower().endswith(extensions):
+        return [source]
+
+    with open(source) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def iter_batch_search(embedded_batches, search_batch_fn, search_batch_size=256):
+    """
+    Run searches for streamed query embeddings in multi-query batches.
+
+    Args:
+        embedded_batches (iterable): (paths, embeddings) batches, e.g. from an
+                                     embedder's `iter_embeddings`
+        search_batch_fn: Callable mapping a list of embeddings to one result
+                         list per embedding
+        search_batch_size (int): Queries sent to the database per call
+
+    Yields:
+        tuple: (query path, results) in the order the embeddings arrive
+    """
+    pending_paths, pending_vectors = [], []
+
+    def flush():
+        results = search_batch_fn(pending_vectors)
+        batch = list(zip(pending_paths, results))
+        pending_paths.clear()
+        pending_vectors.clear()
+        return batch
+
+    for paths, vectors in embedded_batches:
+        for path, vector in zip(paths, vectors):
+            pending_paths.append(path)
+            pending_vectors.append(vector)
+            if len(pending_vectors) >= search_batch_size:
+                yield from flush()
+
+    if pending_vectors:
+        yield from flush()
+
+
+def reserve_stdout(output):
+    """
+    Keep stdout for JSON Lines results when `output` is "-".
+
+    Everything printed afterwards (model loading, progress, status messages)
+    goes to stderr instead, so the results stream stays parseable.
+
+    Args:
+        output (str): Results file path, "-" for stdout, or None
+
+    Returns:
+        The stdout stream for "-" (pass it to `write_jsonl`), else `output`
+    """
+    if output != "-":
+        return output
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    return stdout
+
+
+def write_jsonl(records, output="-"):
+    """
+    Stream records to a JSON Lines file as they are produced.
+
+    Args:
+        records (iterable): JSON-serializable dicts
+        output: Output file path, "-" for stdout, or an open text stream
+
+    Returns:
+        int: Number of records written
+    """
+    if hasattr(output, "write"):
+        f = output
+    else:
+        f = sys.stdout if output == "-" else open(output, "w")
+    count = 0
+    try:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+            count += 1
+        f.flush()
+    finally:
+        if f is not output and f is not sys.stdout:
+            f.close()
+    return count
@@ -0,0 +1,377 @@
+import json
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from common.batch_search import write_jsonl
+from common.regions import is_region_path
+
+DEDUP_METHODS = ("exact", "ann")
+
+
+def export_vectors(store, directory, batch_size=10000, include_regions=False):
+    """
+    Copy every stored vector to a local flat file for offline jobs.
+
+    The export is `vectors.f32` (row-major float32, L2-normalized), `paths.txt`
+    (the stored path of each row, one per line) and `export.json`. Jobs read it
+    memory-mapped, so it can be larger than RAM.
+
+    Args:
+        store (VectorStore): Store to export (see `VectorStore.iter_vectors`)
+        directory (str): Export directory, created if needed
+        batch_size (int): Vectors fetched per request
+        include_regions (bool): Also export the `<path>#region<N>` records (see
+                                common.regions); without them an image is not
+                                reported as a duplicate of its own crops
+
+    Returns:
+        tuple: (paths, vectors) as returned by `load_export`
+    """
+    os.makedirs(directory, exist_ok=True)
+    count, dim = 0, None
+    store_count = store.count()
+    progress = tqdm(total=store_count, unit="vec", desc="Exporting")
+    with open(os.path.join(directory, "vectors.f32"), "wb") as vector_file, \
+            open(os.path.join(directory, "paths.txt"), "w") as path_file:
+        for paths, vectors in store.iter_vectors(batch_size):
+            vectors = np.asarray(vectors, dtype=np.float32)
+            progress.update(len(paths))
+            if not include_regions:
+                keep = [row for row, path in enumerate(paths) if not is_region_path(path)]
+                if len(keep) < len(paths):
+                    paths, vectors = [paths[row] for row in keep], vectors[keep]
+            if not len(paths):
+                continue
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            dim = vectors.shape[1]
+            vector_file.write(vectors.tobytes())
+            path_file.writelines(f"{path}\n" for path in paths)
+            count += len(paths)
+    progress.close()
+
+    with open(os.path.join(directory, "export.json"), "w") as f:
+        # The store's row count tells `run_dedup` when the export went stale
+        json.dump({"count": count, "dim": dim, "include_regions": include_regions, "store_count": store_count}, f)
+    print(f"Exported {count} vectors to {directory}")
+    return load_export(directory)
+
+
+def export_info(directory):
+    """Contents of an export's `export.json`, or None if there is no export"""
+    path = os.path.join(directory, "export.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_export(directory):
+    """
+    Open an export written by `export_vectors`.
+
+    Returns:
+        tuple: (list of paths, (N, dim) read-only float32 memory map)
+    """
+    info = export_info(directory)
+    with open(os.path.join(directory, "paths.txt")) as f:
+        paths = [line.rstrip("\n") for line in f]
+    if not info["count"]:
+        return paths, np.empty((0, info["dim"] or 0), dtype=np.float32)
+    vectors = np.memmap(
+        os.path.join(directory, "vectors.f32"), dtype=np.float32, mode="r",
+        shape=(info["count"], info["dim"])
+    )
+    return paths, vectors
+
+
+def exact_pairs(vectors, threshold, block_size=4096):
+    """
+    All pairs of rows with cosine similarity >= threshold, by blocked matrix multiplication.
+
+    Only blocks on or above the diagonal are scored, each pair once, and memory
+    is bounded by two blocks of rows and one block_size x block_size score matrix.
+
+    Args:
+        vectors (numpy.ndarray): (N, D) unit vectors, e.g. a memory-mapped export
+        threshold (float): Minimum cosine similarity of a pair
+        block_size (int): Rows per block
+
+    Yields:
+        tuple: (rows, cols, scores) arrays of the pairs found in one block, rows < cols
+    """
+    n = len(vectors)
+    progress = tqdm(total=n, unit="vec", desc="Exact self-join")
+    for i in range(0, n, block_size):
+        left = np.asarray(vectors[i:i + block_size], dtype=np.float32)
+        for j in range(i, n, block_size):
+            right = left if j == i else np.asarray(vectors[j:j + block_size], dtype=np.float32)
+            scores = left @ right.T
+            rows, cols = np.nonzero(scores >= threshold)
+            if j == i:
+                upper = cols > rows
+                rows, cols = rows[upper], cols[upper]
+            if len(rows):
+                yield rows + i, cols + j, scores[rows, cols]
+        progress.update(len(left))
+    progress.close()
+
+
+def ann_pairs(store, paths, vectors, threshold, neighbors=10, batch_size=1000, search_params=None):
+    """
+    Pairs of rows with cosine similarity >= threshold, by an ANN self-join.
+
+    Every vector is searched against the store's own index in multi-query
+    batches and its `neighbors` nearest results are kept when close enough.
+    Linear in N instead of quadratic, at the cost of missing pairs the index
+    misses and of groups larger than `neighbors` being linked only partially
+    (union-find still joins them through shared members).
+
+    Args:
+        store (VectorStore): Store the vectors were exported from
+        paths (list): Stored path of each row
+        vectors (numpy.ndarray): (N, D) unit vectors
+        threshold (float): Minimum cosine similarity of a pair
+        neighbors (int): Results per vector
+        batch_size (int): Vectors per search request
+        search_params (dict): Index search parameters, e.g. {"ef": 200}
+
+    Yields:
+        tuple: (rows, cols, scores) arrays of the pairs found in one batch; a pair
+               is usually found from both of its vectors
+    """
+    row_of = {path: row for row, path in enumerate(paths)}
+    progress = tqdm(total=len(vectors), unit="vec", desc="ANN self-join")
+    for start in range(0, len(vectors), batch_size):
+        queries = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+        # One extra result: each vector usually finds itself first
+        results = store.search_batch(queries, top_k=neighbors + 1, search_params=search_params)
+        rows, cols, scores = [], [], []
+        for offset, hits in enumerate(results):
+            row = start + offset
+            for hit in hits:
+                col = row_of.get(hit["image_path"])
+                if col is None or col == row or hit["distance"] < threshold:
+                    continue
+                rows.append(row)
+                cols.append(col)
+                scores.append(hit["distance"])
+        progress.update(len(queries))
+        if rows:
+            yield np.array(rows), np.array(cols), np.array(scores, dtype=np.float32)
+    progress.close()
+
+
+class UnionFind:
+    """Disjoint sets over rows 0..n-1, joined pair by pair into duplicate groups"""
+
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            # Path halving keeps the trees shallow without recursion
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def union_pairs(self, rows, cols):
+        for a, b in zip(rows.tolist(), cols.tolist()):
+            self.union(a, b)
+
+    def groups(self):
+        """
+        Group id of every row: 0..G-1 for rows in a group of two or more
+        (largest group first), -1 for rows without duplicates.
+        """
+        roots = self.parent.copy()
+        while True:
+            parents = roots[roots]
+            if np.array_equal(parents, roots):
+                break
+            roots = parents
+        unique, inverse, counts = np.unique(roots, return_inverse=True, return_counts=True)
+        order = np.argsort(-counts, kind="stable")
+        rank = np.full(len(unique), -1, dtype=np.int32)
+        multi = order[counts[order] > 1]
+        rank[multi] = np.arange(len(multi), dtype=np.int32)
+        return rank[inverse]
+
+
+def assign_clusters(vectors, centroids, block_size=65536):
+    """
+    Nearest centroid of every vector, in blocks.
+
+    Returns:
+        tuple: ((N,) int32 cluster ids, (N,) float32 cosine similarity to the centroid)
+    """
+    labels = np.empty(len(vectors), dtype=np.int32)
+    similarity = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), block_size):
+        scores = np.asarray(vectors[start:start + block_size], dtype=np.float32) @ centroids.T
+        labels[start:start + block_size] = scores.argmax(axis=1)
+        similarity[start:start + block_size] = scores.max(axis=1)
+    return labels, similarity
+
+
+def spherical_kmeans(vectors, k, iterations=20, sample_size=100_000, block_size=65536, seed=0):
+    """
+    Cluster unit vectors by cosine similarity (k-means with normalized centroids).
+
+    Centroids are fitted on a random sample, then every vector is assigned in
+    blocks, so the full set is only read once.
+
+    Args:
+        vectors (numpy.ndarray): (N, D) unit vectors
+        k (int): Number of clusters
+        iterations (int): Lloyd iterations on the sample
+        sample_size (int): Vectors the centroids are fitted on
+        block_size (int): Vectors assigned per matrix multiplication
+        seed (int): Random seed of the sample and the initial centroids
+
+    Returns:
+        tuple: ((k, D) centroids, (N,) int32 cluster ids, (N,) float32 similarity
+               of each vector to its centroid)
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False))
+    sample = np.asarray(vectors[rows], dtype=np.float32)
+    if k > len(sample):
+        raise ValueError(f"Cannot fit {k} clusters to {len(sample)} vectors")
+
+    centroids = sample[rng.choice(len(sample), k, replace=False)]
+    for _ in range(iterations):
+        labels, similarity = assign_clusters(sample, centroids, block_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=k)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            # Re-seed empty clusters with the sample points their centroids fit worst
+            sums[empty] = sample[np.argsort(similarity)[:len(empty)]]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+    labels, similarity = assign_clusters(vectors, centroids, block_size)
+    print(f"k-means: {k} clusters, mean similarity to centroid {similarity.mean():.4f}")
+    return centroids, labels, similarity
+
+
+def run_dedup(store, args):
+    """
+    Run the near-duplicate and clustering job configured by `add_dedup_arguments`.
+
+    Writes `args.output` (.npz) with the stored `paths`, the duplicate `group`
+    of each path (-1 for none) and, with --clusters, the `cluster` of each path,
+    its `cluster_similarity` and the `centroids` (see `load_dedup`). With
+    --groups_output the groups are also written as JSON Lines, largest first.
+    Region records are left out unless --include_regions is given.
+    """
+    info = export_info(args.export_dir)
+    # Exports written without the include_regions key may hold region records;
+    # a store that gained or lost rows since was re-indexed
+    if (info is not None and info.get("include_regions") == args.include_regions
+            and info.get("store_count") == store.count() and not args.refresh):
+        paths, vectors = load_export(args.export_dir)
+        print(f"Using {len(paths)} exported vectors from {args.export_dir}")
+    else:
+        paths, vectors = export_vectors(
+            store, args.export_dir, batch_size=args.export_batch_size, include_regions=args.include_regions
+        )
+
+    if args.method == "exact":
+        pairs = exact_pairs(vectors, args.threshold, block_size=args.block_size)
+    else:
+        store.load_collection()
+        pairs = ann_pairs(
+            store, paths, vectors, args.threshold, neighbors=args.neighbors,
+            batch_size=args.search_batch_size, search_params=args.search_params
+        )
+
+    sets = UnionFind(len(paths))
+    num_pairs = 0
+    for rows, cols, _ in pairs:
+        sets.union_pairs(rows, cols)
+        num_pairs += len(rows)
+    groups = sets.groups()
+    num_groups = int(groups.max()) + 1 if len(groups) else 0
+    duplicates = int((groups >= 0).sum()) - num_groups
+    print(f"Linked {num_pairs} pairs with similarity >= {args.threshold}: {num_groups} groups, "
+          f"{duplicates} images removable as duplicates")
+
+    # One UTF-8 byte string rather than a unicode array padded to the longest path
+    result = {"paths": np.frombuffer("\n".join(paths).encode(), dtype=np.uint8), "group": groups}
+    if args.clusters:
+        centroids, labels, similarity = spherical_kmeans(
+            vectors, args.clusters, iterations=args.kmeans_iterations,
+            sample_size=args.kmeans_sample, seed=args.seed
+        )
+        result.update(cluster=labels, cluster_similarity=similarity.astype(np.float16), centroids=centroids)
+
+    with open(args.output, "wb") as f:
+        np.savez_compressed(f, **result)
+    print(f"Wrote assignments of {len(paths)} images to {args.output}")
+
+    if args.groups_output:
+        members = {}
+        for row in np.flatnonzero(groups >= 0):
+            members.setdefault(int(groups[row]), []).append(paths[row])
+        written = write_jsonl(
+            ({"group": group, "size": len(images), "images": images}
+             for group, images in sorted(members.items())),
+            args.groups_output,
+        )
+        print(f"Wrote {written} duplicate groups to {args.groups_output}")
+
+
+def load_dedup(path):
+    """
+    Read a result file written by `run_dedup`.
+
+    Returns:
+        dict: "paths" as a list of stored paths, and the per-path arrays
+              ("group", and with clusters "cluster", "cluster_similarity")
+              and "centroids" as written
+    """
+    with np.load(path) as data:
+        result = {name: data[name] for name in data.files}
+    blob = result["paths"].tobytes().decode()
+    result["paths"] = blob.split("\n") if blob else []
+    return result
+
+
+def add_dedup_arguments(parser):
+    """Add the near-duplicate and clustering job options to a parser"""
+    parser.add_argument("--output", "-o", default="dedup.npz",
+                        help="Compact result file (.npz): paths, duplicate groups and cluster assignments")
+    parser.add_argument("--groups_output", default=None,
+                        help="Also write the duplicate groups as JSON Lines ('-' for stdout)")
+    parser.add_argument("--export_dir", default="dedup_export",
+                        help="Local copy of the stored vectors; reused when it exists")
+    parser.add_argument("--refresh", action="store_true", help="Export the vectors again even if --export_dir exists")
+    parser.add_argument("--include_regions", action="store_true",
+                        help="Also compare the annotated region records ('<image>#region<N>'), "
+                             "which otherwise would be reported as duplicates of their own images")
+    parser.add_argument("--export_batch_size", type=int, default=10000, help="Vectors fetched per export request")
+    parser.add_argument("--threshold", type=float, default=0.95,
+                        help="Cosine similarity at or above which two images are near-duplicates")
+    parser.add_argument("--method", choices=DEDUP_METHODS, default="exact",
+                        help="exact: blocked all-pairs matrix multiplication; "
+                             "ann: search every vector against the store's index (linear, approximate)")
+    parser.add_argument("--block_size", type=int, default=4096,
+                        help="Rows per block of the exact self-join (memory is about 4 * block_size^2 bytes)")
+    parser.add_argument("--neighbors", type=int, default=10, help="Results per vector in the ANN self-join")
+    parser.add_argument("--search_batch_size", type=int, default=1000,
+                        help="Vectors per search request in the ANN self-join")
+    parser.add_argument("--search_params", type=json.loads, default=None,
+                        help='Index search parameters of the ANN self-join as JSON, e.g. \'{"ef": 200}\'')
+    parser.add_argument("--clusters", type=int, default=0, help="Also assign every image to one of this many k-means clusters")
+    parser.add_argument("--kmeans_iterations", type=int, default=20, help="k-means iterations")
+    parser.add_argument("--kmeans_sample", type=int, default=100_000, help="Vectors the k-means centroids are fitted on")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the k-means sample")
@@ -0,0 +1,462 @@
+import io
+import itertools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import AutoConfig, AutoImageProcessor, AutoModel
+
+from common.embedding_cache import EmbeddingCache, cache_namespace
+from common.hashing import hash_bytes
+from common.image_metadata import image_metadata
+from common.inference import InferenceBackend
+from common.metrics import METRICS
+from common.patches import patch_vector_count, pool_patches
+from common.preprocessing import BatchPreprocessor
+from common.regions import region_path
+
+MODEL_NAMES = {
+    "small": "facebook/dinov2-small",
+    "base": "facebook/dinov2-base",
+    "large": "facebook/dinov2-large",
+    "giant": "facebook/dinov2-giant",
+}
+EMBEDDING_DIMENSIONS = {"small": 384, "base": 768, "large": 1024, "giant": 1536}
+
+def resolve_model_name(model):
+    """Map a model size ("small", "base", ...) to its Hugging Face name; other names pass through"""
+    return MODEL_NAMES.get(model, model)
+
+def embedding_dimension(model_name):
+    """Embedding dimension of a DINOv2 model, read from its config without loading weights"""
+    return AutoConfig.from_pretrained(resolve_model_name(model_name)).hidden_size
+
+class _ClsEmbedding(torch.nn.Module):
+    """Maps pixel values straight to [CLS] token embeddings of a HF DINOv2 model"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).last_hidden_state[:, 0]
+
+class _PatchEmbedding(torch.nn.Module):
+    """Maps pixel values to the [CLS] embedding followed by pooled patch tokens, in one row"""
+
+    def __init__(self, model, pooling="mean", num_vectors=4):
+        super().__init__()
+        self.model = model
+        self.pooling = pooling
+        self.num_vectors = num_vectors
+        # Register tokens (DINOv2 with registers) sit between [CLS] and the patches
+        self.first_patch = 1 + getattr(model.config, "num_register_tokens", 0)
+
+    def forward(self, pixel_values):
+        hidden = self.model(pixel_values=pixel_values).last_hidden_state
+        pooled = pool_patches(hidden[:, self.first_patch:], self.pooling, self.num_vectors)
+        return torch.cat([hidden[:, :1], pooled], dim=1).flatten(1)
+
+class DINOv2Embedder:
+    """DINOv2 [CLS] token embeddings, L2-normalized, shared by every vector store backend"""
+
+    def __init__(self, model_name="facebook/dinov2-base", cache_dir=None, cache_max_entries=1_000_000,
+                 backend="eager", onnx_path=None, device=None, normalize=True, patch_pooling=None,
+                 patch_vectors=4):
+        """
+        Initialize the DINOv2 model for creating image embeddings.
+
+        Args:
+            model_name (str): Model name from Hugging Face model hub, or just its size
+                              Options: "facebook/dinov2-base", "facebook/dinov2-small",
+                              "facebook/dinov2-large", "facebook/dinov2-giant"
+            cache_dir (str): Directory for the persistent embedding cache. Images whose
+                             content was embedded before with the same model and
+                             preprocessing skip the model entirely. None disables it.
+            cache_max_entries (int): Maximum number of vectors kept in the cache
+            backend (str): Inference backend: "eager", "bf16", "int8", "compile" or "onnx"
+                           (see common.inference.InferenceBackend)
+            onnx_path (str): Where to store the exported model for the "onnx" backend
+            device (str): Device to run the model on (default: cuda if available)
+            normalize (bool): L2-normalize embeddings, so cosine similarity is a dot
+                              product and vectors are comparable across stores
+            patch_pooling (str): Also keep the patch tokens, pooled by "mean", "gem" or
+                                 "kmeans" (see common.patches). Each embedding is then
+                                 the [CLS] vector followed by the pooled patch vectors,
+                                 each normalized on its own, as one row; None keeps
+                                 the [CLS] vector only.
+            patch_vectors (int): k-means centroids kept per image with "kmeans"
+        """
+        model_name = resolve_model_name(model_name)
+        self.model_name = model_name
+        self.normalize = normalize
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        print(f"Using device: {self.device}")
+
+        self.processor = AutoImageProcessor.from_pretrained(model_name)
+        self.preprocessor = self._get_preprocessor(self.processor)
+        self.model = AutoModel.from_pretrained(model_name).to(self.device)
+        self.model.eval()
+        hidden_size = self.model.config.hidden_size
+        self.patch_pooling = patch_pooling
+        self.patch_vectors = 0
+        module = _ClsEmbedding(self.model)
+        if patch_pooling is not None:
+            self.patch_vectors = patch_vector_count(patch_pooling, patch_vectors)
+            module = _PatchEmbedding(self.model, patch_pooling, patch_vectors)
+        # Width of the rows this embedder returns: [CLS], then any patch vectors
+        self.vector_dim = hidden_size * (1 + self.patch_vectors)
+        self.backend = InferenceBackend(
+            module, backend=backend, device=self.device,
+            onnx_path=onnx_path, input_size=self.preprocessor.crop
+        )
+
+        self.cache = None
+        if cache_dir is not None:
+            config = {**self.preprocessor.config(), "normalize": normalize}
+            if patch_pooling is not None:
+                # Only patch rows get a new namespace; existing [CLS] caches stay valid
+                config.update(patch_pooling=patch_pooling, patch_vectors=self.patch_vectors)
+            self.cache = EmbeddingCache(
+                cache_dir,
+                cache_namespace(f"{model_name}@{backend}", config),
+                dim=self.vector_dim,
+                max_entries=cache_max_entries,
+            )
+
+    def get_embedding_dimension(self):
+        """Return the embedding dimension of the loaded model (of the [CLS] part with patch pooling)"""
+        return self.model.config.hidden_size
+
+    def _get_preprocessor(self, processor):
+        """
+        Build a batched tensor preprocessor with the same settings as the HF image processor.
+
+        Args:
+            processor: The model's AutoImageProcessor (resize/crop/normalize config)
+
+        Returns:
+            BatchPreprocessor: Preprocessing that runs as batched tensor ops on self.device
+        """
+        crop_size = processor.crop_size
+        interpolation = "bicubic" if processor.resample == Image.Resampling.BICUBIC else "bilinear"
+        return BatchPreprocessor(
+            resize=processor.size["shortest_edge"],
+            crop=crop_size if isinstance(crop_size, int) else crop_size["height"],
+            mean=processor.image_mean,
+            std=processor.image_std,
+            interpolation=interpolation,
+            device=self.device,
+            crop_offset="floor",
+        )
+
+    def _forward(self, pixel_values):
+        """Run the model on preprocessed pixel values and return [CLS] embeddings as numpy"""
+        # Copying to the host waits for the device, so the forward time is complete
+        with METRICS.time("forward", len(pixel_values)), METRICS.profiled():
+            embeddings = self.backend(pixel_values).cpu().numpy()
+        if self.normalize:
+            with METRICS.time("normalize", len(embeddings)):
+                # [CLS] and each pooled patch vector are normalized separately
+                blocks = embeddings.reshape(len(embeddings), -1, self.model.config.hidden_size)
+                blocks /= np.maximum(np.linalg.norm(blocks, axis=2, keepdims=True), 1e-12)
+        return embeddings
+
+    def check_parity(self, image_paths):
+        """
+        Report how far the selected backend's embeddings deviate from fp32 eager.
+
+        Args:
+            image_paths (list): Representative images to compare on
+
+        Returns:
+            dict: Mean/min cosine similarity and max cosine deviation
+        """
+        images = [self.preprocessor.decode(path) for path in image_paths]
+        return self.backend.parity(self.preprocessor(images))
+
+    def embed_image(self, image_path):
+        """
+        Create embedding for a single image.
+
+        Args:
+            image_path (str): Path to the image file
+
+        Returns:
+            numpy.ndarray: Image embedding vector
+        """
+        try:
+            loaded = self._load_batch([image_path])
+            if not loaded[0]:
+                return None
+            return self._embed_loaded(*loaded)[0]
+        except Exception as e:
+            print(f"Error embedding image {image_path}: {str(e)}")
+            return None
+
+    def get_embedding(self, image_path):
+        """Alias of `embed_image`"""
+        return self.embed_image(image_path)
+
+    def get_embeddings(self, images):
+        """Alias of `embed_images`"""
+        return self.embed_images(images)
+
+    def embed_images(self, images):
+        """
+        Create embeddings for a list of images with a single forward pass.
+
+        Args:
+            images (list): Image file paths or encoded image bytes
+
+        Returns:
+            list: One embedding (numpy.ndarray) per image, None where it failed
+        """
+        embeddings = [None] * len(images)
+        loaded = self._load_batch(images)
+        if not loaded[0]:
+            return embeddings
+
+        vectors = self._embed_loaded(*loaded)
+        # valid_paths is an ordered subsequence of the input (same objects)
+        pos = 0
+        for idx, image in enumerate(images):
+            if pos < len(loaded[0]) and loaded[0][pos] is image:
+                embeddings[idx] = vectors[pos]
+                pos += 1
+        return embeddings
+
+    def _load_batch(self, batch_paths, with_metadata=False, regions=None, with_hashes=False):
+        """
+        Read, decode and preprocess one batch of images. Runs on a decode worker thread.
+
+        Each file is read once. With a cache, its content hash is looked up first
+        and cached images are not decoded at all. Images are decoded to uint8
+        tensors (large JPEGs at reduced scale) and resized, cropped and
+        normalized together as batched tensor ops. Metadata comes from the header
+        of the same in-memory copy, so it costs no extra open or stat.
+
+        With `regions`, the annotated regions of an image are cropped from the
+        same decoded pixels and join the batch as extra entries keyed
+        `<path>#region<N>` (see common.regions). Such images are decoded at
+        the scale their smallest region needs rather than the whole image's.
+
+        Args:
+            batch_paths (list): Image file paths in this batch (encoded image bytes
+                                are accepted too, e.g. for uploaded query images)
+            with_metadata (bool): Also describe each image (see common.image_metadata)
+            regions (RegionSource): Polygon lookup and cropping, or None
+            with_hashes (bool): Hash every file read, even without a cache
+
+        Returns:
+            tuple: (valid_paths, keys, cached, inputs, metadata) where keys are content
+                   hashes (None without a cache or `with_hashes`), cached holds a vector or None per
+                   valid path, inputs are the preprocessed pixel values of the cache
+                   misses (None if there are none) and metadata holds a dict per valid
+                   path (None unless `with_metadata`)
+        """
+        valid_paths = []
+        keys = []
+        cached = []
+        images = []
+        metadata = [] if with_metadata else None
+
+        for path in batch_paths:
+            stage = "read"
+            try:
+                start = time.perf_counter()
+                if isinstance(path, bytes):
+                    data = path
+                else:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                decode_start = time.perf_counter()
+                METRICS.record("read", decode_start - start, 1)
+                stage = "decode"
+
+                polygons = regions.polygons(path) if regions is not None else []
+
+                key = None
+                vector = None
+                region_keys = [None] * len(polygons)
+                region_vectors = [None] * len(polygons)
+                if self.cache is not None or with_hashes:
+                    key = hash_bytes(data)
+                if self.cache is not None:
+                    vector = self.cache.get(key)
+                    # A crop is identified by the image content and its polygon
+                    region_keys = [hash_bytes(f"{key}:{regions.signature(p)}".encode()) for p in polygons]
+                    region_vectors = [self.cache.get(k) for k in region_keys]
+                decode = vector is None or any(v is None for v in region_vectors)
+                img = None
+                if decode or with_metadata:
+                    # Parses the header only; pixels are decoded by the preprocessor
+                    img = Image.open(io.BytesIO(data))
+                if with_metadata:
+                    info = image_metadata(img, len(data))
+
+                region_images = [None] * len(polygons)
+                if decode:
+                    original_width = img.width
+                    draft_size = None
+                    if polygons:
+                        draft_size = regions.draft_size(img.size, polygons, self.preprocessor.resize)
+                    rgb = self.preprocessor.load(img, draft_size)
+                    if vector is None:
+                        images.append(self.preprocessor.to_tensor(rgb))
+                    for idx, polygon in enumerate(polygons):
+                        if region_vectors[idx] is not None:
+                            continue
+                        try:
+                            crop = regions.crop(rgb, polygon, scale=rgb.width / original_width)
+                            region_images[idx] = self.preprocessor.to_tensor(crop)
+                        except Exception as e:
+                            METRICS.count("failures", stage="region")
+                            print(f"Skipping region {idx} of {path}: {str(e)}")
+                if decode:
+                    METRICS.record("decode", time.perf_counter() - decode_start, 1)
+                else:
+                    METRICS.count("cache_hits")
+
+                valid_paths.append(path)
+                keys.append(key)
+                cached.append(vector)
+                if with_metadata:
+                    metadata.append(info)
+
+                for idx, polygon in enumerate(polygons):
+                    if region_vectors[idx] is None and region_images[idx] is None:
+                        continue
+                    if region_images[idx] is not None:
+                        images.append(region_images[idx])
+                    valid_paths.append(region_path(path, idx))
+                    keys.append(region_keys[idx])
+                    cached.append(region_vectors[idx])
+                    if with_metadata:
+                        width, height = regions.size(polygon)
+                        metadata.append({**info, "width": width, "height": height})
+            except Exception as e:
+                METRICS.count("failures", stage=stage)
+                name = "<image bytes>" if isinstance(path, bytes) else path
+                print(f"Error opening image {name}: {str(e)}")
+
+        inputs = None
+        if images:
+            with METRICS.time("preprocess", len(images)):
+                inputs = self.preprocessor(images)
+
+        return valid_paths, keys, cached, inputs, metadata
+
+    def _embed_loaded(self, valid_paths, keys, cached, inputs, metadata=None):
+        """Run the model on the cache misses of a loaded batch and merge with cached vectors"""
+        if inputs is not None:
+            fresh = iter(self._forward(inputs))
+            new_items = {}
+            for idx, vector in enumerate(cached):
+                if vector is None:
+                    cached[idx] = next(fresh)
+                    if self.cache is not None:
+                        new_items[keys[idx]] = cached[idx]
+            if new_items:
+                self.cache.put_many(new_items)
+        if self.cache is not None:
+            self.cache.flush_hits()
+
+        return np.stack(cached)
+
+    def iter_embeddings(self, image_paths, batch_size=16, num_workers=4, prefetch=2, with_metadata=False,
+                        regions=None, with_hashes=False):
+        """
+        Stream embeddings batch by batch, decoding upcoming batches in the background.
+
+        A pool of `num_workers` threads decodes and preprocesses up to `prefetch`
+        batches ahead of the one currently running through the model, so PIL decode
+        overlaps with the forward pass instead of alternating with it.
+
+        Args:
+            image_paths (iterable): Image file paths (a list or any iterable)
+            batch_size (int): Number of images per forward pass
+            num_workers (int): Decode worker threads; 0 decodes inline on the caller's thread
+            prefetch (int): Maximum number of batches decoded ahead of the model
+            with_metadata (bool): Also yield each image's metadata, read from the same
+                                  file read as the pixels (see common.image_metadata)
+            regions (RegionSource): Also embed the annotated regions of each image in
+                                    its batch, yielded after it as `<path>#region<N>`
+            with_hashes (bool): Also yield the content hash of each file, taken from the
+                                same read as its pixels (see common.hashing.hash_bytes)
+
+        Yields:
+            tuple: (paths, embeddings) for each batch, embeddings being a numpy array
+                   with one row per path; (paths, embeddings, metadata) with
+                   `with_metadata`, metadata being one dict per path; the hashes
+                   (one per path) come last with `with_hashes`
+        """
+        def output(batch):
+            embedded = (batch[0], self._embed_loaded(*batch))
+            if with_metadata:
+                embedded += (batch[4],)
+            if with_hashes:
+                embedded += (list(batch[1]),)
+            return embedded
+
+        total = None
+        if hasattr(image_paths, "__len__"):
+            total = (len(image_paths) + batch_size - 1) // batch_size
+
+        paths_iter = iter(image_paths)
+        batches = iter(lambda: list(itertools.islice(paths_iter, batch_size)), [])
+
+        if num_workers <= 0:
+            loaded = (self._load_batch(batch_paths, with_metadata, regions, with_hashes) for batch_paths in batches)
+            for batch_num, batch in enumerate(loaded, start=1):
+                print(f"Processing batch {batch_num}/{total or '?'}")
+                if batch[0]:
+                    yield output(batch)
+            return
+
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            pending = deque(
+                pool.submit(self._load_batch, batch_paths, with_metadata, regions, with_hashes)
+                for batch_paths in itertools.islice(batches, max(prefetch, 1))
+            )
+            batch_num = 0
+            while pending:
+                batch = pending.popleft().result()
+                batch_num += 1
+
+                # Queue the next batch before running the model so decode overlaps it
+                next_paths = next(batches, None)
+                if next_paths is not None:
+                    pending.append(pool.submit(self._load_batch, next_paths, with_metadata, regions, with_hashes))
+
+                print(f"Processing batch {batch_num}/{total or '?'}")
+                if not batch[0]:
+                    continue
+
+                yield output(batch)
+
+    def embed_batch(self, image_paths, batch_size=16, num_workers=4, prefetch=2):
+        """
+        Create embeddings for a batch of images.
+
+        Args:
+            image_paths (list): List of image file paths
+            batch_size (int): Number of images to process at once
+            num_workers (int): Decode worker threads (see `iter_embeddings`)
+            prefetch (int): Maximum number of batches decoded ahead of the model
+
+        Returns:
+            dict: Dictionary mapping image paths to their embeddings
+        """
+        embeddings = {}
+
+        for paths, batch_embeddings in self.iter_embeddings(
+            image_paths, batch_size=batch_size, num_workers=num_workers, prefetch=prefetch
+        ):
+            for idx, path in enumerate(paths):
+                embeddings[path] = batch_embeddings[idx]
+
+        return embeddings
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def cache_namespace(model_name, preprocess_config):
+    """Build a cache namespace from the model and its preprocessing settings
+
+    Vectors are only reused when both match, so changing the model variant or
+    any resize/crop/normalize setting starts a fresh namespace.
+
+    Args:
+        model_name (str): Model identifier
+        preprocess_config: JSON-serializable description of the preprocessing
+
+    Returns:
+        str: Short hex namespace
+    """
+    payload = json.dumps(
+        {"model": model_name, "preprocess": preprocess_config},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache keyed by image content hash
+
+    The persistent tier is a memory-mapped float32 matrix (one row per cached
+    image) plus a SQLite index mapping content hash to row and last-use time.
+    Once `max_entries` rows are in use, the least recently used row is
+    overwritten. An in-process LRU dict of up to `memory_entries` vectors sits
+    in front of it so hot keys never touch disk. Hits on the persistent tier
+    only note their key; the last-use times are written in one statement by
+    `flush_hits` (once per embedded batch), the next `put_many` or `close`,
+    so lookups never wait on a SQLite write.
+
+    Each namespace (see `cache_namespace`) lives in its own subdirectory of
+    `cache_dir`, so different models and preprocessing configs never mix.
+    All methods are thread-safe, and several processes (e.g. indexing shards)
+    can share a namespace: slots are allocated inside a SQLite write
+    transaction and each process remaps the file when another one grew it.
+    """
+
+    _INITIAL_CAPACITY = 1024
+
+    def __init__(self, cache_dir, namespace, dim, max_entries=1_000_000, memory_entries=10_000):
+        """Open (or create) a cache namespace
+
+        Args:
+            cache_dir: Root directory for all cache namespaces
+            namespace (str): Namespace from `cache_namespace`
+            dim (int): Embedding dimension
+            max_entries (int): Maximum number of vectors kept on disk
+            memory_entries (int): Maximum number of vectors kept in the in-memory LRU
+        """
+        self.dim = dim
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.directory = os.path.join(str(cache_dir), namespace)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        # Keys read from disk since the last flush_hits, with the time of the hit
+        self._hits = {}
+
+        self._conn = sqlite3.connect(
+            os.path.join(self.directory, "index.sqlite"), timeout=60, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.commit()
+
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._vectors = None
+        self._capacity = 0
+        self._ensure_capacity(self._INITIAL_CAPACITY)
+
+    def _file_rows(self):
+        """Number of rows the backing file currently holds (possibly grown by another process)"""
+        if not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * self.dim)
+
+    def _ensure_capacity(self, rows):
+        """Map at least `rows` rows, growing the backing file (doubling, capped at max_entries)"""
+        if rows <= self._capacity:
+            return
+
+        capacity = self._file_rows()
+        if capacity < rows:
+            capacity = max(capacity, self._INITIAL_CAPACITY)
+            while capacity < rows:
+                capacity *= 2
+            capacity = max(min(capacity, self.max_entries), rows)
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+        )
+        self._capacity = capacity
+
+    def _remember(self, key, vector):
+        """Insert into the in-memory LRU tier, evicting the oldest entry if full"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Look up a cached embedding
+
+        Args:
+            key (str): Image content hash
+
+        Returns:
+            numpy.ndarray or None: Cached vector, or None on a miss
+        """
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                return vector
+
+            row = self._conn.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            self._ensure_capacity(row[0] + 1)
+            vector = np.array(self._vectors[row[0]])
+            self._hits[key] = time.time()
+            self._remember(key, vector)
+            return vector
+
+    def _write_hits(self):
+        """Write the noted last-use times; the caller holds the lock and commits"""
+        if self._hits:
+            self._conn.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._hits.items()],
+            )
+            self._hits = {}
+
+    def flush_hits(self):
+        """Record the last use of the keys read since the previous call, in one commit"""
+        with self._lock:
+            if self._hits:
+                self._write_hits()
+                self._conn.commit()
+
+    def put_many(self, items):
+        """Store several embeddings with one flush and one commit
+
+        Args:
+            items (dict): Mapping of content hash to embedding vector
+        """
+        if not items:
+            return
+        with self._lock:
+            # Take the SQLite write lock first so concurrent processes allocate distinct slots
+            self._conn.execute("BEGIN IMMEDIATE")
+            # Recent hits count before choosing which rows to evict
+            self._write_hits()
+            count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            now = time.time()
+            rows = []
+            for key, vector in items.items():
+                vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+                row = self._conn.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    slot = row[0]
+                elif count < self.max_entries:
+                    slot = count
+                    count += 1
+                else:
+                    # Full: overwrite the least recently used row
+                    slot, old_key = self._conn.execute(
+                        "SELECT slot, key FROM entries ORDER BY last_used LIMIT 1"
+                    ).fetchone()
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                    self._memory.pop(old_key, None)
+
+                self._ensure_capacity(slot + 1)
+                self._vectors[slot] = vector
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                    (key, slot, now),
+                )
+                rows.append((key, vector))
+
+            # Vectors must be on disk before the index points at them
+            self._vectors.flush()
+            self._conn.commit()
+            for key, vector in rows:
+                self._remember(key, vector)
+
+    def put(self, key, vector):
+        """Store a single embedding"""
+        self.put_many({key: vector})
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        """Flush vectors to disk and close the index"""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._write_hits()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,23 @@
+import hashlib
+
+
+def hash_bytes(data):
+    """Return a hex content hash for an in-memory byte string"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """Return a hex content hash of a file, read in chunks
+
+    Args:
+        file_path: Path to the file
+        chunk_size (int): Number of bytes read per call
+
+    Returns:
+        str: Hex digest, identical to `hash_bytes` over the whole file
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,56 @@
+import os
+
+from PIL import Image
+
+# EXIF tags kept with the image (tag id -> metadata key)
+EXIF_FIELDS = {
+    0x0112: "orientation",
+    0x0132: "datetime",
+    0x010F: "camera_make",
+    0x0110: "camera_model",
+}
+
+
+def image_metadata(img, num_bytes):
+    """
+    Describe an opened image without decoding its pixels.
+
+    Only the header PIL parsed on open is used, so this costs nothing next to the
+    decode. Call it before `draft()` or any conversion, which change the
+    reported size and mode.
+
+    Args:
+        img (PIL.Image.Image): Image as returned by `Image.open`
+        num_bytes (int): Size of the encoded file
+
+    Returns:
+        dict: width, height, format, mode and size_kb, plus the EXIF_FIELDS the
+              image carries
+    """
+    metadata = {
+        "width": img.width,
+        "height": img.height,
+        "format": img.format,
+        "mode": img.mode,
+        "size_kb": num_bytes / 1024,
+    }
+    try:
+        exif = img.getexif()
+    except Exception:
+        exif = {}
+    for tag, key in EXIF_FIELDS.items():
+        value = exif.get(tag)
+        if value is None:
+            continue
+        if isinstance(value, bytes):
+            value = value.decode(errors="replace")
+        metadata[key] = value.strip("\x00 ") if isinstance(value, str) else int(value)
+    return metadata
+
+
+def read_image_metadata(path):
+    """`image_metadata` of a file, with one open and one stat and no pixel decode"""
+    with open(path, "rb") as f:
+        num_bytes = os.fstat(f.fileno()).st_size
+        with Image.open(f) as img:
+            return image_metadata(img, num_bytes)
@@ -0,0 +1,156 @@
+import inspect
+import os
+import tempfile
+
+import numpy as np
+import torch
+
+BACKENDS = ("eager", "bf16", "int8", "compile", "onnx")
+
+
+class InferenceBackend:
+    """Runs an embedding model under a selectable inference backend
+
+    Backends:
+        eager:   fp32 PyTorch under `torch.inference_mode`
+        bf16:    bfloat16 autocast (CPU or CUDA) under `torch.inference_mode`
+        int8:    dynamic int8 quantization of every nn.Linear (CPU only)
+        compile: `torch.compile` of the fp32 model
+        onnx:    export to ONNX once and run with ONNX Runtime (needs `onnxruntime`)
+
+    The wrapped module must map a (N, 3, H, W) float tensor to (N, D) embeddings.
+    The fp32 module is kept as a reference so `parity` can report how far the
+    selected backend drifts from it.
+    """
+
+    def __init__(self, module, backend="eager", device="cpu", onnx_path=None, input_size=224):
+        """
+        Args:
+            module (torch.nn.Module): fp32 model returning one embedding per image
+            backend (str): One of BACKENDS
+            device (str): Device the PyTorch backends run on
+            onnx_path (str): Where to write (or reuse) the exported ONNX model.
+                             Defaults to a temporary file.
+            input_size (int): Image side used for the ONNX export trace
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        if backend == "int8" and device != "cpu":
+            raise ValueError("int8 dynamic quantization only runs on CPU")
+
+        self.backend = backend
+        self.device = device
+        self.reference = module.eval()
+        self.module = self.reference
+        self.session = None
+
+        if backend == "int8":
+            self.module = torch.ao.quantization.quantize_dynamic(
+                self.reference, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        elif backend == "compile":
+            self.module = torch.compile(self.reference)
+        elif backend == "onnx":
+            self.session = self._load_onnx(onnx_path, input_size)
+
+    def _load_onnx(self, onnx_path, input_size):
+        """Export the reference model to ONNX (unless already exported) and open a session"""
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx backend requires `pip install onnx onnxruntime`") from e
+
+        if onnx_path is None:
+            onnx_path = os.path.join(tempfile.mkdtemp(), "model.onnx")
+        if not os.path.exists(onnx_path):
+            print(f"Exporting model to ONNX: {onnx_path}")
+            example = torch.randn(1, 3, input_size, input_size, device=self.device)
+            # Newer PyTorch defaults to the dynamo exporter; keep the TorchScript one
+            export_kwargs = {}
+            if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+                export_kwargs["dynamo"] = False
+            torch.onnx.export(
+                self.reference,
+                (example,),
+                onnx_path,
+                input_names=["pixel_values"],
+                output_names=["embedding"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "embedding": {0: "batch"}},
+                **export_kwargs,
+            )
+
+        providers = ["CPUExecutionProvider"]
+        if self.device.startswith("cuda"):
+            providers.insert(0, "CUDAExecutionProvider")
+        return onnxruntime.InferenceSession(onnx_path, providers=providers)
+
+    def __call__(self, pixel_values):
+        """Embed a batch of preprocessed images
+
+        Args:
+            pixel_values (torch.Tensor): float tensor of shape (N, 3, H, W)
+
+        Returns:
+            torch.Tensor: float32 embeddings of shape (N, D)
+        """
+        if self.session is not None:
+            outputs = self.session.run(None, {"pixel_values": pixel_values.cpu().numpy()})
+            return torch.from_numpy(outputs[0])
+
+        pixel_values = pixel_values.to(self.device)
+        with torch.inference_mode():
+            if self.backend == "bf16":
+                device_type = "cuda" if self.device.startswith("cuda") else "cpu"
+                with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
+                    return self.module(pixel_values).float()
+            return self.module(pixel_values).float()
+
+    def parity(self, pixel_values):
+        """Compare this backend against fp32 eager on the same inputs
+
+        Args:
+            pixel_values (torch.Tensor): Representative preprocessed batch
+
+        Returns:
+            dict: mean and minimum cosine similarity to the fp32 embeddings, and
+                  the worst-case cosine deviation (1 - min cosine)
+        """
+        with torch.inference_mode():
+            reference = self.reference(pixel_values.to(self.device)).float().cpu().numpy()
+        candidate = self(pixel_values).cpu().numpy()
+
+        cosine = (reference * candidate).sum(axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+        )
+        return {
+            "backend": self.backend,
+            "mean_cosine": float(cosine.mean()),
+            "min_cosine": float(cosine.min()),
+            "max_deviation": float(1.0 - cosine.min()),
+        }
+
+
+def add_backend_arguments(parser):
+    """Add the --backend, --onnx_path and --check_parity CLI options to a parser"""
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="eager",
+        help="Inference backend (bf16/int8 speed up CPU inference)",
+    )
+    parser.add_argument(
+        "--onnx_path", default=None, help="Exported model file for --backend onnx"
+    )
+    parser.add_argument(
+        "--check_parity",
+        action="store_true",
+        help="Report cosine deviation of the backend against fp32 before running",
+    )
+
+
+def print_parity(report):
+    """Print a parity report returned by `InferenceBackend.parity`"""
+    print(
+        f"Backend '{report['backend']}' vs fp32: mean cosine {report['mean_cosine']:.6f}, "
+        f"max deviation {report['max_deviation']:.6f}"
+    )
@@ -0,0 +1,545 @@
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from common.metrics import METRICS
+from common.quantization import VECTOR_DTYPES, code_layout, decode, encode
+from common.vector_store import FILTER_FIELDS, RANGE_FILTERS, VectorStore, check_filters
+
+INDEX_TYPES = ("flat", "hnsw")
+
+
+class LocalImageDB(VectorStore):
+    """Embedded image vector store implementing the VectorStore interface
+
+    Needs no database server: vectors live in a memory-mapped matrix on disk,
+    one L2-normalized row per image, and a SQLite index maps rows to image
+    paths and tombstones deleted rows. Opening an existing store only maps the
+    file, so startup does not depend on its size.
+
+    Rows are stored as float32, or compressed as float16, bfloat16, int8 or
+    binary codes (see common.quantization) that are expanded block by block
+    while scoring. Binary rows are scored against the float query, which ranks
+    like a Hamming search but loses less; pair compressed stores with a float32
+    sidecar (common.reranking) to rerank candidates exactly.
+
+    The width, height and format of each image are kept in the SQLite index
+    and, for filtering, as in-memory columns next to the live mask, so a
+    filter is a vectorized mask applied inside the search.
+
+    Search is exact cosine top-k by blocked matrix multiplication, or, with
+    `index="hnsw"`, approximate through an hnswlib graph that is saved next to
+    the matrix on flush (needs `pip install hnswlib`).
+
+    Results use the Milvus COSINE convention: "distance" is the cosine
+    similarity, higher is closer.
+    """
+
+    _INITIAL_CAPACITY = 1024
+
+    def __init__(self, directory, dim=768, dtype="float32", index=None, hnsw_params=None,
+                 search_params=None, block_rows=65536):
+        """
+        Open (or create) a store.
+
+        Args:
+            directory: Directory holding the store files
+            dim (int): Embedding dimension
+            dtype (str): Storage precision, one of common.quantization.VECTOR_DTYPES:
+                         float16/bfloat16 halve the disk and page cache, int8 quarters
+                         it and binary needs one bit per dimension
+            index (str): "flat" for exact search or "hnsw" for an hnswlib graph
+                         (default: the store's current index, "flat" for a new store)
+            hnsw_params (dict): HNSW build parameters {"M": 16, "efConstruction": 200}
+            search_params (dict): Default search parameters, e.g. {"ef": 100} for HNSW
+            block_rows (int): Rows scored per matrix multiplication in exact search
+        """
+        if index not in INDEX_TYPES + (None,):
+            raise ValueError(f"Unknown index '{index}', expected one of {INDEX_TYPES}")
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown dtype '{dtype}', expected one of {VECTOR_DTYPES}")
+
+        self.directory = str(directory)
+        self.block_rows = block_rows
+        os.makedirs(self.directory, exist_ok=True)
+
+        config = {
+            "dim": dim,
+            "dtype": dtype,
+            "index": index or "flat",
+            "hnsw_params": {"M": 16, "efConstruction": 200, **(hnsw_params or {})},
+        }
+        config_path = os.path.join(self.directory, "config.json")
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                stored = json.load(f)
+            if (stored["dim"], stored["dtype"]) != (dim, dtype):
+                raise ValueError(
+                    f"Store '{self.directory}' holds {stored['dim']}-d {stored['dtype']} vectors, "
+                    f"not {dim}-d {dtype}"
+                )
+            requested = {**stored["hnsw_params"], **(hnsw_params or {})}
+            if index not in (None, stored["index"]) or requested != stored["hnsw_params"]:
+                print(f"Store '{self.directory}' has a '{stored['index']}' index; use rebuild_index() to switch")
+            config = stored
+        else:
+            with open(config_path, "w") as f:
+                json.dump(config, f)
+
+        self.dim = config["dim"]
+        self.dtype = config["dtype"]
+        self._code_dtype, self._code_width = code_layout(self.dtype, self.dim)
+        self.index = config["index"]
+        self.hnsw_params = config["hnsw_params"]
+        self.search_params = {"ef": 100, **(search_params or {})}
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(self.directory, "index.sqlite"), check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                row INTEGER PRIMARY KEY,
+                image_path TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_image_path ON entries (image_path)")
+        # Filterable metadata, added to stores created without it
+        columns = {name for _, name, *_ in self._conn.execute("PRAGMA table_info(entries)")}
+        for name, column_type in (("width", "INTEGER"), ("height", "INTEGER"), ("format", "TEXT")):
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE entries ADD COLUMN {name} {column_type}")
+        self._conn.commit()
+
+        # Row -> path, and a live mask; rows past the last committed one are unused
+        self._paths = []
+        deleted_rows = []
+        metadata = []
+        for row, image_path, deleted, width, height, image_format in self._conn.execute(
+            "SELECT row, image_path, deleted, width, height, format FROM entries ORDER BY row"
+        ):
+            self._paths.append(image_path)
+            metadata.append((width, height, image_format))
+            if deleted:
+                deleted_rows.append(row)
+
+        self._vectors_path = os.path.join(self.directory, f"vectors.{self.dtype}")
+        self._vectors = None
+        self._capacity = 0
+        self._hnsw = None
+        self._ensure_capacity(max(len(self._paths), self._file_rows(), self._INITIAL_CAPACITY))
+        self._live = np.zeros(self._capacity, dtype=bool)
+        self._live[:len(self._paths)] = True
+        self._live[deleted_rows] = False
+
+        # Filter columns: -1 for an unknown size, format as an index into _formats (-1 unknown)
+        self._formats = []
+        self._width = np.full(self._capacity, -1, dtype=np.int32)
+        self._height = np.full(self._capacity, -1, dtype=np.int32)
+        self._format = np.full(self._capacity, -1, dtype=np.int16)
+        self._set_metadata(0, metadata)
+
+        if self.index == "hnsw":
+            self._hnsw = self._open_hnsw()
+
+    @property
+    def _hnsw_path(self):
+        return os.path.join(self.directory, "index.hnsw")
+
+    def _file_rows(self):
+        """Number of rows the backing file currently holds"""
+        if not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (self._code_width * self._code_dtype.itemsize)
+
+    def _ensure_capacity(self, rows):
+        """Map at least `rows` rows, growing the backing file by doubling"""
+        if rows <= self._capacity:
+            return
+
+        capacity = max(self._capacity, self._file_rows(), self._INITIAL_CAPACITY)
+        while capacity < rows:
+            capacity *= 2
+        if capacity > self._file_rows():
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(capacity * self._code_width * self._code_dtype.itemsize)
+
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=self._code_dtype, mode="r+", shape=(capacity, self._code_width)
+        )
+        if self._capacity:
+            grow = capacity - self._capacity
+            self._live = np.concatenate([self._live, np.zeros(grow, dtype=bool)])
+            self._width = np.concatenate([self._width, np.full(grow, -1, dtype=np.int32)])
+            self._height = np.concatenate([self._height, np.full(grow, -1, dtype=np.int32)])
+            self._format = np.concatenate([self._format, np.full(grow, -1, dtype=np.int16)])
+            if self._hnsw is not None:
+                self._hnsw.resize_index(capacity)
+        self._capacity = capacity
+
+    def _new_hnsw(self, init=True):
+        """Create an empty hnswlib graph sized to the current capacity (uninitialized to load one)"""
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The hnsw index requires `pip install hnswlib`") from e
+
+        graph = hnswlib.Index(space="ip", dim=self.dim)
+        if not init:
+            return graph
+        graph.init_index(
+            max_elements=self._capacity,
+            M=self.hnsw_params["M"],
+            ef_construction=self.hnsw_params["efConstruction"],
+        )
+        return graph
+
+    def _open_hnsw(self):
+        """Load the saved graph, or build it from the stored vectors if it is missing or stale"""
+        if os.path.exists(self._hnsw_path):
+            graph = self._new_hnsw(init=False)
+            graph.load_index(self._hnsw_path, max_elements=self._capacity)
+            if graph.get_current_count() == len(self._paths):
+                return graph
+            print(f"HNSW graph of '{self.directory}' is out of date; rebuilding")
+
+        graph = self._new_hnsw()
+
+        rows = np.flatnonzero(self._live)
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            graph.add_items(self._decode(block), block)
+        # Keep labels aligned with rows: deleted rows exist in the graph as tombstones
+        for row in np.flatnonzero(~self._live[:len(self._paths)]):
+            graph.add_items(self._decode([row]), [row])
+            graph.mark_deleted(row)
+        return graph
+
+    def _set_metadata(self, start, metadata):
+        """Fill the filter columns of rows start.. from (width, height, format) tuples"""
+        if not metadata:
+            return
+        rows = slice(start, start + len(metadata))
+        widths, heights, formats = zip(*metadata)
+        self._width[rows] = [-1 if width is None else width for width in widths]
+        self._height[rows] = [-1 if height is None else height for height in heights]
+        codes = []
+        for image_format in formats:
+            if image_format is None:
+                codes.append(-1)
+                continue
+            if image_format not in self._formats:
+                self._formats.append(image_format)
+            codes.append(self._formats.index(image_format))
+        self._format[rows] = codes
+
+    def _decode(self, rows):
+        """Stored rows (an index array or slice) as float32 vectors"""
+        return decode(self._vectors[rows], self.dtype, self.dim)
+
+    def upsert(self, records, replace=True, flush=True):
+        """
+        Insert records, replacing vectors already stored for the same paths.
+
+        Args:
+            records (list): Dicts with "image_path", "vector" and optionally "metadata",
+                            whose width, height and format are kept for filtering
+            replace (bool): Tombstone existing rows of these paths first
+            flush (bool): Persist after inserting. Pass False when inserting many
+                          chunks in a row and call `flush()` once at the end.
+
+        Returns:
+            list: Always empty; local inserts do not fail per record
+        """
+        if not records:
+            print("No embeddings to insert")
+            return []
+
+        image_paths = [str(record["image_path"]) for record in records]
+        if replace:
+            self.delete_by_paths(image_paths, verbose=False)
+        vectors = np.asarray([record["vector"] for record in records], dtype=np.float32).reshape(-1, self.dim)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        metadata = [
+            tuple((record.get("metadata") or {}).get(name) for name in FILTER_FIELDS) for record in records
+        ]
+
+        with self._lock:
+            start = len(self._paths)
+            rows = np.arange(start, start + len(image_paths))
+            self._ensure_capacity(start + len(image_paths))
+            self._vectors[start:start + len(image_paths)] = encode(vectors, self.dtype)
+            self._conn.executemany(
+                "INSERT INTO entries (row, image_path, width, height, format) VALUES (?, ?, ?, ?, ?)",
+                [(row, path, *values) for row, path, values in zip(rows.tolist(), image_paths, metadata)],
+            )
+            self._set_metadata(start, metadata)
+            if self._hnsw is not None:
+                # The graph indexes what searches score: the stored, possibly compressed, vectors
+                self._hnsw.add_items(decode(encode(vectors, self.dtype), self.dtype, self.dim), rows)
+            self._paths.extend(image_paths)
+            self._live[rows] = True
+
+        if flush:
+            self.flush()
+        print(f"Inserted {len(image_paths)} embeddings into {self.directory}")
+        return []
+
+    def delete_by_paths(self, image_paths, chunk_size=1000, verbose=True):
+        """
+        Delete all vectors stored for the given image paths.
+
+        Args:
+            image_paths (list): Image paths whose vectors should be removed
+            chunk_size (int): Number of paths per delete statement
+            verbose (bool): Report how many paths were deleted
+        """
+        image_paths = [str(path) for path in image_paths]
+        with self._lock:
+            for i in range(0, len(image_paths), chunk_size):
+                chunk = image_paths[i:i + chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                rows = [
+                    row for (row,) in self._conn.execute(
+                        f"SELECT row FROM entries WHERE deleted = 0 AND image_path IN ({placeholders})",
+                        chunk,
+                    )
+                ]
+                self._conn.execute(
+                    f"UPDATE entries SET deleted = 1 WHERE image_path IN ({placeholders})", chunk
+                )
+                self._live[rows] = False
+                if self._hnsw is not None:
+                    for row in rows:
+                        self._hnsw.mark_deleted(row)
+            self._conn.commit()
+
+        if image_paths and verbose:
+            print(f"Deleted embeddings for {len(image_paths)} images")
+
+    def flush(self):
+        """Persist vectors, the path index and the HNSW graph"""
+        with self._lock:
+            self._vectors.flush()
+            self._conn.commit()
+            if self._hnsw is not None:
+                self._hnsw.save_index(self._hnsw_path)
+
+    def load_collection(self, wait=True, timeout=None):
+        """No-op: the matrix is memory-mapped and searchable as soon as the store is open"""
+
+    def wait_until_loaded(self, timeout=None):
+        """No-op, see `load_collection`"""
+
+    def rebuild_index(self, index="hnsw", hnsw_params=None):
+        """
+        Switch between exact search and an HNSW graph, or rebuild the graph.
+
+        Args:
+            index (str): "flat" or "hnsw"
+            hnsw_params (dict): HNSW build parameters {"M": ..., "efConstruction": ...}
+        """
+        if index not in INDEX_TYPES:
+            raise ValueError(f"Unknown index '{index}', expected one of {INDEX_TYPES}")
+        with self._lock:
+            self.index = index
+            self.hnsw_params = {**self.hnsw_params, **(hnsw_params or {})}
+            if os.path.exists(self._hnsw_path):
+                os.remove(self._hnsw_path)
+            self._hnsw = self._open_hnsw() if index == "hnsw" else None
+            with open(os.path.join(self.directory, "config.json"), "w") as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype, "index": self.index,
+                           "hnsw_params": self.hnsw_params}, f)
+        self.flush()
+        print(f"Rebuilt index of '{self.directory}' as '{index}'")
+
+    def _exact_topk(self, queries, k, mask):
+        """Exact cosine top-k over the rows selected by `mask`, scoring `block_rows` rows at a time"""
+        count = len(self._paths)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, count, self.block_rows):
+            stop = min(start + self.block_rows, count)
+            scores = queries @ self._decode(slice(start, stop)).T
+            scores[:, ~mask[start:stop]] = -np.inf
+
+            # Merge this block's candidates with the running top-k
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate(
+                [best_rows, np.broadcast_to(np.arange(start, stop), (len(queries), stop - start))], axis=1
+            )
+            top = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def _filter_mask(self, filters):
+        """Live rows that also pass the filters"""
+        filters = check_filters(filters)
+        mask = self._live
+        if not filters:
+            return mask
+
+        mask = mask.copy()
+        prefix = filters.get("path_prefix")
+        if prefix:
+            mask[:len(self._paths)] &= np.fromiter(
+                (path.startswith(prefix) for path in self._paths), dtype=bool, count=len(self._paths)
+            )
+        if "format" in filters:
+            code = self._formats.index(filters["format"]) if filters["format"] in self._formats else -2
+            mask &= self._format == code
+        columns = {"width": self._width, "height": self._height}
+        for key, (field, comparison) in RANGE_FILTERS.items():
+            if key not in filters:
+                continue
+            column = columns[field]
+            if comparison == ">=":
+                mask &= column >= filters[key]
+            else:
+                # Unknown sizes (-1) must not pass an upper bound
+                mask &= (column >= 0) & (column <= filters[key])
+        return mask
+
+    def _metadata(self, row):
+        """The filterable metadata kept for a row (only the known fields)"""
+        metadata = {}
+        if self._width[row] >= 0:
+            metadata["width"] = int(self._width[row])
+        if self._height[row] >= 0:
+            metadata["height"] = int(self._height[row])
+        if self._format[row] >= 0:
+            metadata["format"] = self._formats[self._format[row]]
+        return metadata
+
+    def search_batch(self, query_embeddings, top_k=5, filters=None, search_params=None, nq_per_request=1000):
+        """
+        Search for similar images of many queries at once.
+
+        Args:
+            query_embeddings (list): Embedding vectors of the query images
+            top_k (int): Number of similar images to return per query
+            filters (dict): Pre-filter conditions, e.g. {"path_prefix": "holidays/"}
+            search_params (dict): Search parameters overriding the defaults, e.g. {"ef": 200}
+            nq_per_request (int): Queries scored together (bounds memory of exact search)
+
+        Returns:
+            list: One list of result dictionaries per query, in query order
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        mask = self._filter_mask(filters)
+        k = min(top_k, int(mask.sum()))
+        if k == 0:
+            return [[] for _ in queries]
+
+        params = {**self.search_params, **(search_params or {})}
+        formatted_results = []
+        for i in range(0, len(queries), nq_per_request):
+            batch = queries[i:i + nq_per_request]
+            with METRICS.time("ann", len(batch)):
+                if self._hnsw is not None:
+                    self._hnsw.set_ef(max(params["ef"], k))
+                    if mask is self._live:
+                        rows, distances = self._hnsw.knn_query(batch, k=k)
+                    else:
+                        # Filtered graph search: hnswlib calls back per candidate, single-threaded
+                        rows, distances = self._hnsw.knn_query(
+                            batch, k=k, num_threads=1, filter=lambda row: bool(mask[row])
+                        )
+                    scores = 1.0 - distances  # hnswlib "ip" distance is 1 - dot product
+                else:
+                    rows, scores = self._exact_topk(batch, k, mask)
+
+            for query_rows, query_scores in zip(rows, scores):
+                formatted_results.append([
+                    {"image_path": self._paths[row], "distance": float(score), "metadata": self._metadata(row)}
+                    for row, score in zip(query_rows, query_scores)
+                    if mask[row]
+                ])
+
+        return formatted_results
+
+    def iter_vectors(self, batch_size=65536):
+        """Stream the live rows in row order as (image paths, float32 vectors) batches"""
+        rows = np.flatnonzero(self._live[:len(self._paths)])
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            yield [self._paths[row] for row in batch], self._decode(batch)
+
+    def fetch_embeddings(self, batch_size=65536):
+        """
+        Read every live embedding as float32.
+
+        Args:
+            batch_size (int): Rows converted at a time
+
+        Returns:
+            numpy.ndarray: (N, dim) float32 embeddings
+        """
+        rows = np.flatnonzero(self._live)
+        embeddings = np.empty((len(rows), self.dim), dtype=np.float32)
+        for start in range(0, len(rows), batch_size):
+            embeddings[start:start + batch_size] = self._decode(rows[start:start + batch_size])
+        return embeddings
+
+    def get_embeddings(self, image_paths, chunk_size=900):
+        """
+        Read the stored embeddings of the given image paths as float32.
+
+        Args:
+            image_paths (list): Image paths to look up
+            chunk_size (int): Paths per lookup statement (SQLite caps bound parameters)
+
+        Returns:
+            tuple: ((N, dim) float32 embeddings, (N,) bool mask of the paths found;
+                   rows of missing paths are zero)
+        """
+        image_paths = [str(path) for path in image_paths]
+        position = {path: i for i, path in enumerate(image_paths)}
+        rows = np.full(len(image_paths), -1, dtype=np.int64)
+        with self._lock:
+            for i in range(0, len(image_paths), chunk_size):
+                chunk = image_paths[i:i + chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                # Ascending rows: a path inserted twice resolves to its latest row
+                for row, image_path in self._conn.execute(
+                    f"SELECT row, image_path FROM entries WHERE deleted = 0 AND image_path IN ({placeholders}) "
+                    f"ORDER BY row",
+                    chunk,
+                ):
+                    rows[position[image_path]] = row
+
+        found = rows >= 0
+        embeddings = np.zeros((len(image_paths), self.dim), dtype=np.float32)
+        if found.any():
+            # Read in row order so the memory map is touched sequentially
+            order = np.argsort(rows[found])
+            targets = np.flatnonzero(found)[order]
+            embeddings[targets] = self._decode(rows[found][order])
+        return embeddings, found
+
+    def count(self):
+        """Number of stored (non-deleted) vectors"""
+        return int(self._live.sum())
+
+    def __len__(self):
+        return self.count()
+
+    def close(self):
+        """Persist everything and close the path index"""
+        self.flush()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+from common.hashing import hash_file
+
+ManifestPlan = namedtuple("ManifestPlan", ["new", "changed", "unchanged", "removed", "stats"])
+ManifestPlan.__doc__ = """Work left to do for one indexing run
+
+new: paths never indexed under this model
+changed: paths whose stored vectors are stale (content changed, or an
+    interrupted run left them pending) and must be deleted before re-insert
+unchanged: number of paths that can be skipped
+removed: previously indexed paths that no longer exist on disk
+stats: (size, mtime_ns) of the new and changed paths, keyed by str(path),
+    taken by the plan so `mark_pending` does not stat them again
+"""
+
+PENDING = "pending"
+DONE = "done"
+
+
+def _stat(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class IndexManifest:
+    """SQLite record of which files have been embedded and inserted, per model
+
+    Each row is keyed by (path, model) and stores the file size, mtime and a
+    content hash. A file is only re-embedded when its size or mtime changed
+    *and* its content hash differs, so touched or copied files are skipped.
+
+    Rows are marked pending before their vectors are inserted and done after
+    the insert returns. Pending rows left behind by a crash are reported as
+    changed on the next run, so their possibly half-inserted vectors are
+    deleted before they are inserted again.
+
+    Each row also records how many region records (`<path>#region<N>`, see
+    common.regions) were inserted with the image, so they can be deleted
+    with it even after its polygon file is gone.
+    """
+
+    def __init__(self, manifest_path, model_name):
+        """Open (or create) a manifest
+
+        Args:
+            manifest_path: Path to the SQLite file
+            model_name (str): Model identifier rows are recorded under
+        """
+        self.manifest_path = str(manifest_path)
+        self.model_name = model_name
+        self.conn = sqlite3.connect(self.manifest_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT NOT NULL,
+                model TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                regions INTEGER,
+                PRIMARY KEY (path, model)
+            )
+            """
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        if "regions" not in columns:
+            # Manifests written before regions were tracked: NULL means unknown
+            self.conn.execute("ALTER TABLE files ADD COLUMN regions INTEGER")
+        self.conn.commit()
+
+    def _rows_under(self, root):
+        """Load manifest rows for this model, optionally limited to a directory"""
+        rows = self.conn.execute(
+            "SELECT path, size, mtime_ns, content_hash, status FROM files WHERE model = ?",
+            (self.model_name,),
+        )
+        if root is None:
+            return {row[0]: row[1:] for row in rows}
+        # Compared as absolute paths, so "./imgs/a.jpg" is found under root "imgs"
+        prefix = os.path.join(os.path.abspath(root), "")
+        return {row[0]: row[1:] for row in rows if os.path.abspath(row[0]).startswith(prefix)}
+
+    def plan(self, image_paths, root=None):
+        """Compare the files on disk with the manifest
+
+        Args:
+            image_paths: Paths found by the current scan
+            root: Directory that was scanned. Only manifest rows under it are
+                  considered for removal, so several directories can share one
+                  manifest.
+
+        Returns:
+            ManifestPlan: Paths to embed, to replace, and to delete
+        """
+        known = self._rows_under(root)
+        new, changed, touched = [], [], []
+        stats = {}
+        unchanged = 0
+
+        for path in image_paths:
+            key = str(path)
+            row = known.pop(key, None)
+            st = os.stat(path)
+            if row is None:
+                new.append(path)
+                stats[key] = (st.st_size, st.st_mtime_ns)
+                continue
+
+            size, mtime_ns, content_hash, status = row
+            if status == DONE and st.st_size == size and st.st_mtime_ns == mtime_ns:
+                unchanged += 1
+            elif status == DONE and st.st_size == size and content_hash == hash_file(path):
+                # Touched or copied but identical content: keep the vectors
+                touched.append((st.st_mtime_ns, time.time(), key, self.model_name))
+                unchanged += 1
+            else:
+                changed.append(path)
+                stats[key] = (st.st_size, st.st_mtime_ns)
+
+        if touched:
+            self.conn.executemany(
+                "UPDATE files SET mtime_ns = ?, updated_at = ? WHERE path = ? AND model = ?",
+                touched,
+            )
+            self.conn.commit()
+
+        return ManifestPlan(new, changed, unchanged, list(known), stats)
+
+    def mark_pending(self, image_paths, stats=None, region_counts=None):
+        """Record that vectors for these paths are about to be inserted
+
+        Args:
+            image_paths: Paths about to be inserted
+            stats (dict): (size, mtime_ns) by str(path), e.g. `ManifestPlan.stats`;
+                          paths missing from it are stat'ed here
+            region_counts (dict): Region records inserted with each path (highest
+                                  region index + 1) by str(path); missing paths have none
+        """
+        stats = stats or {}
+        region_counts = region_counts or {}
+        now = time.time()
+        rows = []
+        for path in image_paths:
+            size, mtime_ns = stats.get(str(path)) or _stat(path)
+            rows.append((str(path), self.model_name, size, mtime_ns, PENDING, now, region_counts.get(str(path), 0)))
+        self.conn.executemany(
+            """
+            INSERT INTO files (path, model, size, mtime_ns, content_hash, status, updated_at, regions)
+            VALUES (?, ?, ?, ?, NULL, ?, ?, ?)
+            ON CONFLICT (path, model) DO UPDATE SET
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                content_hash = NULL,
+                status = excluded.status,
+                updated_at = excluded.updated_at,
+                regions = excluded.regions
+            """,
+            rows,
+        )
+        self.conn.commit()
+
+    def mark_done(self, image_paths, content_hashes=None):
+        """Record that vectors for these paths were inserted successfully
+
+        Args:
+            image_paths: Paths whose insert returned
+            content_hashes (dict): Precomputed hashes by path, e.g. from the embedder's
+                                   read of each file (`iter_embeddings(with_hashes=True)`).
+                                   Missing hashes are computed from the files.
+        """
+        content_hashes = content_hashes or {}
+        now = time.time()
+        rows = [
+            (content_hashes.get(path) or hash_file(path), DONE, now, str(path), self.model_name)
+            for path in image_paths
+        ]
+        self.conn.executemany(
+            "UPDATE files SET content_hash = ?, status = ?, updated_at = ? WHERE path = ? AND model = ?",
+            rows,
+        )
+        self.conn.commit()
+
+    def region_counts(self, image_paths):
+        """
+        Region records inserted with each path, as recorded by `mark_pending`.
+
+        Returns:
+            dict: Count by path; None for rows written before regions were tracked
+        """
+        counts = {}
+        paths = [str(path) for path in image_paths]
+        # Stay below SQLite's limit on bound parameters
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            counts.update(self.conn.execute(
+                f"SELECT path, regions FROM files WHERE model = ? AND path IN ({', '.join('?' * len(chunk))})",
+                (self.model_name, *chunk),
+            ))
+        return {path: counts.get(str(path)) for path in image_paths}
+
+    def forget(self, image_paths):
+        """Drop manifest rows, e.g. after deleting vectors for removed files"""
+        self.conn.executemany(
+            "DELETE FROM files WHERE path = ? AND model = ?",
+            [(str(path), self.model_name) for path in image_paths],
+        )
+        self.conn.commit()
+
+    def close(self):
+        """Close the SQLite connection"""
+        self.conn.close()
@@ -0,0 +1,309 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stages timed by the indexing and search code paths, in pipeline order
+INDEX_STAGES = ("scan", "read", "decode", "preprocess", "forward", "normalize", "insert", "flush")
+SEARCH_STAGES = ("embed", "load", "ann", "fetch")
+
+METRICS_PREFIX = "dinov2"
+
+
+class Metrics:
+    """Process-wide per-stage timers and counters
+
+    Every stage keeps the number of calls, the seconds spent and the items
+    (images, queries, records) handled. Stages that run on several threads at
+    once (decode workers, scanner threads) add up their threads' time, so a
+    stage total can exceed the wall-clock time. Counters are named totals,
+    optionally split by stage, e.g. failures by the stage they happened in.
+
+    Worker processes (see common.sharding) send their snapshots back to the
+    parent, which adds them to its own, so the numbers cover the whole job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start_time = time.time()
+        self._stages = {}
+        self._counters = {}
+        self._children = {}
+        self.profile_batch = None
+        self.profile_path = None
+        self._forward_calls = 0
+
+    def record(self, stage, seconds, items=0):
+        """Add one timed call of a stage"""
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += items
+
+    @contextmanager
+    def time(self, stage, items=0):
+        """Time the enclosed block as one call of `stage` handling `items` items"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, items)
+
+    def timed(self, iterable, stage):
+        """Yield from `iterable`, timing the production of each (paths, ...) batch as `stage`"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self.record(stage, time.perf_counter() - start, len(batch[0]))
+            yield batch
+
+    def count(self, name, value=1, stage=None):
+        """Increase a counter, e.g. `count("failures", stage="decode")`"""
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[stage or ""] = counter.get(stage or "", 0) + value
+
+    def merge_child(self, key, snapshot):
+        """Replace the latest snapshot of a worker process (cumulative on its side)"""
+        with self._lock:
+            self._children[key] = snapshot
+
+    def snapshot(self, include_children=True):
+        """
+        Current totals as a JSON-serializable dict.
+
+        Returns:
+            dict: {"uptime_s": ..., "stages": {stage: {"calls", "seconds", "items"}},
+                   "counters": {name: {stage or "": value}}}
+        """
+        with self._lock:
+            stages = {
+                stage: {"calls": calls, "seconds": seconds, "items": items}
+                for stage, (calls, seconds, items) in self._stages.items()
+            }
+            counters = {name: dict(values) for name, values in self._counters.items()}
+            children = list(self._children.values()) if include_children else []
+
+        for child in children:
+            for stage, entry in child["stages"].items():
+                total = stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "items": 0})
+                for field in total:
+                    total[field] += entry[field]
+            for name, values in child["counters"].items():
+                counter = counters.setdefault(name, {})
+                for label, value in values.items():
+                    counter[label] = counter.get(label, 0) + value
+        return {"uptime_s": time.time() - self.start_time, "stages": stages, "counters": counters}
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        """Current totals in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for field, help_text in (
+            ("seconds", "Seconds spent per stage, summed over threads"),
+            ("calls", "Timed calls per stage"),
+            ("items", "Items handled per stage"),
+        ):
+            name = f"{prefix}_stage_{field}_total"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for stage, entry in sorted(snapshot["stages"].items()):
+                lines.append(f'{name}{{stage="{stage}"}} {entry[field]}')
+        for counter, values in sorted(snapshot["counters"].items()):
+            name = f"{prefix}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            for label, value in sorted(values.items()):
+                lines.append(f'{name}{{stage="{label}"}} {value}' if label else f"{name} {value}")
+
+        uptime = snapshot["uptime_s"]
+        images = sum(snapshot["counters"].get("images", {}).values())
+        lines += [
+            f"# TYPE {prefix}_uptime_seconds gauge",
+            f"{prefix}_uptime_seconds {uptime}",
+            f"# TYPE {prefix}_images_per_second gauge",
+            f"{prefix}_images_per_second {images / max(uptime, 1e-9)}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def profiled(self):
+        """
+        Run the enclosed model call under the torch profiler if it is the sampled
+        one (see `configure_profiler`), and write its Chrome trace.
+        """
+        with self._lock:
+            index = self._forward_calls
+            self._forward_calls += 1
+        if self.profile_batch is None or index != self.profile_batch:
+            yield
+            return
+
+        import torch
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        with torch.profiler.profile(activities=activities, record_shapes=True) as profiler:
+            yield
+        profiler.export_chrome_trace(self.profile_path)
+        print(f"Wrote torch profiler trace of batch {index} to {self.profile_path}")
+
+    def configure_profiler(self, batch, path):
+        """Profile the `batch`-th model call (0-based) and write its trace to `path`"""
+        self.profile_batch = batch
+        self.profile_path = path
+
+
+# Shared by the embedder, pipeline, scanner and stores of this process
+METRICS = Metrics()
+
+
+def _rates(snapshot, previous):
+    """Images per second over the whole run and since the previous snapshot"""
+    images = sum(snapshot["counters"].get("images", {}).values())
+    rates = {"images_per_second": images / max(snapshot["uptime_s"], 1e-9)}
+    if previous is not None:
+        done = images - sum(previous["counters"].get("images", {}).values())
+        rates["recent_images_per_second"] = done / max(snapshot["uptime_s"] - previous["uptime_s"], 1e-9)
+    return rates
+
+
+class MetricsReporter:
+    """Appends a JSON line with the metrics snapshot every `interval` seconds
+
+    One more line is written on `close()`, so short runs are reported too.
+    """
+
+    def __init__(self, metrics=METRICS, path="-", interval=30.0):
+        """
+        Args:
+            metrics (Metrics): Registry to report
+            path (str): JSON lines file to append to, or "-" for stderr
+            interval (float): Seconds between lines
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._previous = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _write(self):
+        snapshot = self.metrics.snapshot()
+        line = json.dumps({"time": time.time(), **snapshot, **_rates(snapshot, self._previous)})
+        self._previous = snapshot
+        if self.path == "-":
+            print(line, file=sys.stderr)
+        else:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def close(self):
+        """Stop reporting and write the final line"""
+        self._stop.set()
+        self._thread.join()
+        self._write()
+
+
+def metrics_response(metrics=METRICS):
+    """(content type, body) of a Prometheus scrape of `metrics`"""
+    return "text/plain; version=0.0.4", metrics.to_prometheus().encode()
+
+
+def serve_metrics(port, host="127.0.0.1", metrics=METRICS):
+    """
+    Serve `GET /metrics` in the Prometheus text format on a background thread.
+
+    Returns:
+        ThreadingHTTPServer: Call `shutdown()` to stop it
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            content_type, body = metrics_response(metrics)
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+class _MetricsOutputs:
+    """The reporter and endpoint started from the command line options"""
+
+    def __init__(self, reporter=None, server=None):
+        self.reporter = reporter
+        self.server = server
+
+    def close(self):
+        if self.reporter is not None:
+            self.reporter.close()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def start_metrics(args):
+    """Start the metrics outputs selected by `add_metrics_arguments` options; close() when done"""
+    if getattr(args, "profile_batch", None) is not None:
+        METRICS.configure_profiler(args.profile_batch, args.profile_trace)
+    reporter = server = None
+    if getattr(args, "metrics_log", None):
+        reporter = MetricsReporter(METRICS, args.metrics_log, args.metrics_interval)
+    if getattr(args, "metrics_port", None):
+        server = serve_metrics(args.metrics_port)
+    return _MetricsOutputs(reporter, server)
+
+
+def add_metrics_arguments(parser, port=True):
+    """Add the metrics log, endpoint and profiler options to a parser"""
+    parser.add_argument(
+        "--metrics_log",
+        default=None,
+        help="Append per-stage timings, failure counts and images/sec as JSON lines to this file "
+             "('-' for stderr)",
+    )
+    parser.add_argument(
+        "--metrics_interval", type=float, default=30.0, help="Seconds between --metrics_log lines"
+    )
+    if port:
+        parser.add_argument(
+            "--metrics_port",
+            type=int,
+            default=None,
+            help="Serve the metrics in the Prometheus text format on http://127.0.0.1:PORT/metrics",
+        )
+    parser.add_argument(
+        "--profile_batch",
+        type=int,
+        default=None,
+        help="Record a torch profiler trace of this model call (0-based batch number)",
+    )
+    parser.add_argument(
+        "--profile_trace",
+        default="trace.json",
+        help="Chrome trace file written for --profile_batch",
+    )
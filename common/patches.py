@@ -0,0 +1,290 @@
+import json
+import os
+
+import numpy as np
+import torch
+
+from common.local_store import LocalImageDB
+from common.metrics import METRICS
+from common.quantization import VECTOR_DTYPES
+from common.vector_store import VectorStore
+
+PATCH_POOLINGS = ("mean", "gem", "kmeans")
+
+
+def patch_vector_count(pooling, num_vectors=4):
+    """Patch vectors kept per image: one for mean and GeM pooling, `num_vectors` for k-means"""
+    if pooling not in PATCH_POOLINGS:
+        raise ValueError(f"Unknown patch pooling '{pooling}', expected one of {PATCH_POOLINGS}")
+    return num_vectors if pooling == "kmeans" else 1
+
+
+def pool_patches(tokens, pooling="mean", num_vectors=4, gem_p=3.0, iterations=5):
+    """
+    Reduce the patch tokens of a batch to a few vectors per image.
+
+    Runs as batched tensor ops on the tokens' device, inside the model call,
+    so it needs no second pass over the images.
+
+    Args:
+        tokens (torch.Tensor): Patch tokens of shape (N, P, D)
+        pooling (str): "mean", "gem" (generalized mean, signed since DINOv2
+                       features are not rectified) or "kmeans" (spherical k-means
+                       over the patches of each image)
+        num_vectors (int): Centroids per image for "kmeans"
+        gem_p (float): GeM exponent; 1 is the mean, larger values approach max pooling
+        iterations (int): k-means iterations
+
+    Returns:
+        torch.Tensor: (N, K, D) pooled vectors, not normalized
+    """
+    if pooling == "mean":
+        return tokens.mean(dim=1, keepdim=True)
+    if pooling == "gem":
+        pooled = (tokens.sign() * tokens.abs().pow(gem_p)).mean(dim=1, keepdim=True)
+        return pooled.sign() * pooled.abs().pow(1.0 / gem_p)
+    if pooling != "kmeans":
+        raise ValueError(f"Unknown patch pooling '{pooling}', expected one of {PATCH_POOLINGS}")
+
+    tokens = torch.nn.functional.normalize(tokens, dim=-1)
+    # Deterministic start: patches spread evenly over the token grid
+    start = torch.linspace(0, tokens.shape[1] - 1, num_vectors, device=tokens.device).long()
+    centroids = tokens[:, start]
+    for _ in range(iterations):
+        assign = torch.bmm(tokens, centroids.transpose(1, 2)).argmax(dim=-1)
+        one_hot = torch.nn.functional.one_hot(assign, num_vectors).to(tokens.dtype)
+        sums = torch.bmm(one_hot.transpose(1, 2), tokens)
+        counts = one_hot.sum(dim=1).unsqueeze(-1)
+        # Empty clusters keep their previous centroid
+        centroids = torch.where(counts > 0, sums / counts.clamp(min=1), centroids)
+        centroids = torch.nn.functional.normalize(centroids, dim=-1)
+    return centroids
+
+
+def _normalized(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def maxsim(query_patches, doc_patches):
+    """
+    Late-interaction similarity of each query with each of its candidates.
+
+    Every query patch vector is matched with its most similar patch vector
+    of the candidate and the matches are averaged, so a query that shows
+    only part of an image still scores high against it.
+
+    Args:
+        query_patches (numpy.ndarray): (Q, Kq, D) L2-normalized query patch vectors
+        doc_patches (numpy.ndarray): (Q, C, Kd, D) L2-normalized patch vectors of
+                                     the C candidates of each query
+
+    Returns:
+        numpy.ndarray: (Q, C) scores in [-1, 1]
+    """
+    return np.einsum("qkd,qcld->qckl", query_patches, doc_patches).max(axis=-1).mean(axis=-1)
+
+
+class PatchRerankingStore(VectorStore):
+    """Two-stage search: [CLS] ANN candidates reranked by patch-level MaxSim
+
+    Embedders built with `patch_pooling` (see common.embedder) return the
+    [CLS] embedding followed by K pooled patch vectors in one row. This
+    wrapper stores the [CLS] part in the wrapped store, which answers the ANN
+    search, and the patch vectors in a local sidecar (a flat LocalImageDB,
+    float16 by default) keyed by the path the wrapped store reports. Each
+    search fetches `rerank_factor` times more candidates than requested and
+    rescores them with `maxsim` against the query's own patch vectors, which
+    come out of the same forward pass as its [CLS] embedding.
+    """
+
+    def __init__(self, store, sidecar, dim, rerank_factor=4):
+        """
+        Args:
+            store (VectorStore): Store of the [CLS] embeddings
+            sidecar (LocalImageDB): Patch vectors, K * dim wide per image
+            dim (int): [CLS] embedding dimension
+            rerank_factor (int): Candidates fetched per requested result
+        """
+        self.store = store
+        self.sidecar = sidecar
+        self.dim = dim
+        self.rerank_factor = rerank_factor
+
+    def __getattr__(self, name):
+        # Store-specific operations (rebuild_index, fetch_embeddings, ...) go to the wrapped store
+        return getattr(self.store, name)
+
+    def stored_path(self, image_path):
+        return self.store.stored_path(image_path)
+
+    def _split(self, vectors):
+        """([CLS] embeddings, (N, K, dim) normalized patch vectors) of packed rows"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        patches = vectors[:, self.dim:].reshape(len(vectors), vectors.shape[1] // self.dim - 1, self.dim)
+        return vectors[:, :self.dim], _normalized(patches)
+
+    def upsert(self, records, replace=True, flush=True):
+        """Insert the [CLS] embeddings into the store and the patch vectors into the sidecar"""
+        if not records:
+            return self.store.upsert(records, replace=replace, flush=flush)
+        cls, patches = self._split([record["vector"] for record in records])
+        failed = self.store.upsert(
+            [{**record, "vector": vector} for record, vector in zip(records, cls)],
+            replace=replace,
+            flush=flush,
+        )
+        rejected = set(failed)
+        self.sidecar.upsert(
+            [
+                {"image_path": self.store.stored_path(record["image_path"]), "vector": vectors.reshape(-1)}
+                for record, vectors in zip(records, patches)
+                if record["image_path"] not in rejected
+            ],
+            replace=replace,
+            flush=flush,
+        )
+        return failed
+
+    def search_batch(self, query_embeddings, top_k=5, filters=None, search_params=None):
+        """
+        Search the store with the [CLS] part of each query for `top_k * rerank_factor`
+        candidates and return the `top_k` with the highest MaxSim score. Candidates
+        missing from the sidecar keep their [CLS] score and rank after the others;
+        queries without patch vectors get the plain [CLS] results.
+        """
+        queries, query_patches = self._split(query_embeddings)
+        if query_patches.shape[1] == 0:
+            return self.store.search_batch(queries, top_k=top_k, filters=filters, search_params=search_params)
+        candidates = self.store.search_batch(
+            queries, top_k=top_k * self.rerank_factor, filters=filters, search_params=search_params
+        )
+
+        # One sidecar lookup for the candidates of the whole batch
+        paths = list({hit["image_path"] for hits in candidates for hit in hits})
+        if not paths:
+            return candidates
+        with METRICS.time("fetch", len(paths)):
+            vectors, found = self.sidecar.get_embeddings(paths)
+        doc_patches = _normalized(vectors.reshape(len(paths), -1, self.dim))
+        position = {path: i for i, path in enumerate(paths)}
+
+        # Candidate lists padded to one (Q, C) row matrix, scored in a single einsum
+        width = max((len(hits) for hits in candidates), default=0)
+        rows = np.zeros((len(candidates), width), dtype=np.int64)
+        valid = np.zeros((len(candidates), width), dtype=bool)
+        approximate = np.zeros((len(candidates), width), dtype=np.float32)
+        for i, hits in enumerate(candidates):
+            rows[i, :len(hits)] = [position[hit["image_path"]] for hit in hits]
+            valid[i, :len(hits)] = True
+            approximate[i, :len(hits)] = [hit["distance"] for hit in hits]
+        exact = valid & found[rows]
+        scores = np.where(exact, maxsim(query_patches, doc_patches[rows]), approximate)
+
+        reranked = []
+        for i, hits in enumerate(candidates):
+            n = len(hits)
+            order = np.lexsort((-scores[i, :n], ~exact[i, :n]))[:top_k]
+            reranked.append([{**hits[j], "distance": float(scores[i, j])} for j in order])
+        return reranked
+
+    def delete_by_paths(self, image_paths, verbose=True):
+        self.store.delete_by_paths(image_paths, verbose=verbose)
+        self.sidecar.delete_by_paths([self.store.stored_path(path) for path in image_paths], verbose=False)
+
+    def count(self):
+        return self.store.count()
+
+    def iter_vectors(self, batch_size=65536):
+        """Stream the [CLS] embeddings of the wrapped store"""
+        return self.store.iter_vectors(batch_size)
+
+    def flush(self):
+        self.store.flush()
+        self.sidecar.flush()
+
+    def load_collection(self, wait=True, timeout=None):
+        self.store.load_collection(wait=wait, timeout=timeout)
+
+    def wait_until_loaded(self, timeout=None):
+        self.store.wait_until_loaded(timeout=timeout)
+
+    def close(self):
+        self.store.close()
+        self.sidecar.close()
+
+
+def with_patch_reranking(store, patch_dir, dim, num_vectors=1, rerank_factor=4, dtype="float16"):
+    """
+    Wrap a store with patch-level MaxSim reranking from a sidecar directory, if one is given.
+
+    An existing sidecar keeps the width and precision it was created with, so
+    searches do not need to repeat the indexing options.
+
+    Args:
+        store (VectorStore): Store of the [CLS] embeddings
+        patch_dir (str): Directory of the patch vector sidecar, or None for no reranking
+        dim (int): [CLS] embedding dimension
+        num_vectors (int): Patch vectors per image of a new sidecar
+        rerank_factor (int): Candidates fetched per requested result
+        dtype (str): Storage precision of a new sidecar
+
+    Returns:
+        VectorStore: `store` itself, or a PatchRerankingStore around it
+    """
+    if patch_dir is None:
+        return store
+    config_path = os.path.join(patch_dir, "config.json")
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            config = json.load(f)
+        if config["dim"] % dim:
+            raise ValueError(f"Patch sidecar '{patch_dir}' holds {config['dim']}-d rows, not a multiple of {dim}")
+        sidecar = LocalImageDB(patch_dir, dim=config["dim"], dtype=config["dtype"])
+    else:
+        sidecar = LocalImageDB(patch_dir, dim=dim * num_vectors, dtype=dtype)
+    return PatchRerankingStore(store, sidecar, dim, rerank_factor=rerank_factor)
+
+
+def add_patch_arguments(parser):
+    """Add the patch feature and MaxSim reranking options to a parser"""
+    parser.add_argument(
+        "--patch_dir",
+        default=None,
+        help="Keep pooled patch-token vectors in this directory and rerank [CLS] candidates by "
+             "patch-level MaxSim; searches given the same option rerank against it",
+    )
+    parser.add_argument(
+        "--patch_pooling",
+        choices=PATCH_POOLINGS,
+        default="mean",
+        help="With --patch_dir, how patch tokens are reduced: one mean or GeM vector, "
+             "or --patch_vectors k-means centroids per image",
+    )
+    parser.add_argument(
+        "--patch_vectors",
+        type=int,
+        default=4,
+        help="k-means centroids kept per image with --patch_pooling kmeans",
+    )
+    parser.add_argument(
+        "--patch_factor",
+        type=int,
+        default=4,
+        help="With --patch_dir, [CLS] candidates fetched per requested result",
+    )
+    parser.add_argument(
+        "--patch_dtype",
+        choices=[dtype for dtype in VECTOR_DTYPES if dtype != "binary"],
+        default="float16",
+        help="Storage precision of a new patch sidecar",
+    )
+
+
+def patch_options(args):
+    """Embedder keyword arguments selected by the patch options (empty without --patch_dir)"""
+    if getattr(args, "patch_dir", None) is None:
+        return {}
+    if getattr(args, "reduction", None):
+        # A reduction is fitted on [CLS] vectors; it cannot map the packed rows
+        raise SystemExit("--patch_dir cannot be combined with --reduction")
+    return {"patch_pooling": args.patch_pooling, "patch_vectors": args.patch_vectors}
@@ -0,0 +1,175 @@
+import os
+
+from tqdm import tqdm
+
+from common.batch_search import iter_batch_search
+from common.metrics import METRICS
+from common.regions import is_region_path, region_path, split_region_path, with_parents
+
+
+def index_images(image_paths, embedder, store, manifest=None, root=None, batch_size=16,
+                 insert_batch_size=1000, with_metadata=False, metadata_fn=None, regions=None, **embed_kwargs):
+    """
+    Embed images and upsert them into a vector store.
+
+    Embeddings are streamed from the embedder and upserted in chunks of
+    `insert_batch_size` as they are produced, so memory stays bounded by the
+    chunk size rather than growing with the number of images. The same code
+    path feeds every store (see common.vector_store.VectorStore).
+
+    With a manifest, only new or changed files are embedded, vectors of changed
+    and removed files are deleted first, and an interrupted run resumes where
+    it stopped. The content hashes it records come from the embedder's read of
+    each file, so no file is read twice.
+
+    With `regions`, the polygons annotated on each image are cropped from its
+    decoded pixels and embedded in the same forward passes, stored as
+    `<image path>#region<N>` next to the image's own record. The manifest
+    tracks the image files only: re-index an image (or run without a
+    manifest) after editing its polygons. It records how many regions each
+    image had, so they are deleted with the image when it changes or is
+    removed.
+
+    Args:
+        image_paths (iterable): Images found by the scan; a lazy iterable (e.g. from
+                                common.scanner.iter_image_paths) is consumed while
+                                embedding, so the first batches start before the
+                                scan completes
+        embedder: Embedder with `iter_embeddings(paths, batch_size=...)`
+        store (VectorStore): Destination store
+        manifest (IndexManifest): Incremental indexing state, or None
+        root (str): Directory that was scanned (scopes the manifest's removals)
+        batch_size (int): Images per forward pass
+        insert_batch_size (int): Records per upsert (and manifest update)
+        with_metadata (bool): Store each image's width, height, format, mode, size and
+                              EXIF fields, read from the same file read as the pixels
+                              (see common.image_metadata)
+        metadata_fn: Callable mapping an image path to extra metadata stored with it
+        regions (RegionSource): Also embed the annotated regions of each image
+                                (see common.regions), or None
+        **embed_kwargs: Passed on to `iter_embeddings` (e.g. num_workers, prefetch)
+
+    Returns:
+        int: Number of images inserted (regions not counted)
+    """
+    stats = {}
+    if manifest is not None:
+        plan = manifest.plan(image_paths, root=root)
+        stats = plan.stats
+        print(f"Found {len(plan.new) + len(plan.changed) + plan.unchanged} images")
+        print(f"Manifest: {len(plan.new)} new, {len(plan.changed)} changed, "
+              f"{plan.unchanged} unchanged, {len(plan.removed)} removed")
+        stale = plan.changed + plan.removed
+        for path, count in manifest.region_counts(stale).items():
+            if count is None and regions is not None and os.path.exists(path):
+                # Indexed before the manifest counted regions: as far as the polygon file lists them
+                count = len(regions.polygons(path))
+            stale.extend(region_path(path, idx) for idx in range(count or 0))
+        store.delete_by_paths(stale)
+        manifest.forget(plan.removed)
+        image_paths = plan.new + plan.changed
+    elif hasattr(image_paths, "__len__"):
+        print(f"Found {len(image_paths)} images")
+
+    def flush_chunk(chunk, hashes):
+        # The manifest tracks image files; their region records ride along
+        paths = [record["image_path"] for record in chunk if not is_region_path(record["image_path"])]
+        if manifest is not None:
+            region_counts = {}
+            for record in chunk:
+                parent, idx = split_region_path(record["image_path"])
+                if idx is not None:
+                    region_counts[parent] = max(region_counts.get(parent, 0), idx + 1)
+            manifest.mark_pending(paths, stats, region_counts)
+        # Without a manifest a re-run may see the same paths again, so replace them
+        with METRICS.time("insert", len(chunk)):
+            failed = set(store.upsert(chunk, replace=manifest is None, flush=False))
+        if manifest is not None:
+            manifest.mark_done([path for path in paths if path not in failed], hashes)
+        failed_regions = sum(1 for path in failed if is_region_path(path))
+        if failed:
+            METRICS.count("failures", len(failed), stage="insert")
+        return len(failed) - failed_regions, failed_regions
+
+    chunk = []
+    # Content hashes of the chunk's files from the embedder's read, for the manifest
+    hashes = {}
+    total_failed = 0
+    total_regions = 0
+    failed_regions = 0
+    progress = tqdm(total=len(image_paths) if hasattr(image_paths, "__len__") else None, unit="img")
+    if with_metadata:
+        embed_kwargs["with_metadata"] = True
+    if regions is not None:
+        embed_kwargs["regions"] = regions
+    if manifest is not None:
+        embed_kwargs["with_hashes"] = True
+    for paths, vectors, *rest in embedder.iter_embeddings(image_paths, batch_size=batch_size, **embed_kwargs):
+        num_regions = sum(1 for path in paths if is_region_path(path))
+        total_regions += num_regions
+        progress.update(len(paths) - num_regions)
+        METRICS.count("images", len(paths) - num_regions)
+        if num_regions:
+            METRICS.count("regions", num_regions)
+        metadata = rest.pop(0) if with_metadata else [None] * len(paths)
+        if manifest is not None:
+            hashes.update(zip(paths, rest.pop(0)))
+        for path, vector, info in zip(paths, vectors, metadata):
+            record = {"image_path": path, "vector": vector}
+            if info is not None or metadata_fn is not None:
+                record["metadata"] = {**(info or {}), **(metadata_fn(path) if metadata_fn else {})}
+            chunk.append(record)
+
+        if len(chunk) >= insert_batch_size:
+            failed = flush_chunk(chunk, hashes)
+            total_failed += failed[0]
+            failed_regions += failed[1]
+            progress.set_postfix(failed=total_failed)
+            chunk = []
+            hashes = {}
+
+    if chunk:
+        failed = flush_chunk(chunk, hashes)
+        total_failed += failed[0]
+        failed_regions += failed[1]
+    progress.close()
+
+    with METRICS.time("flush"):
+        store.flush()
+    inserted = progress.n - total_failed
+    print(f"Created and inserted embeddings for {inserted} images")
+    if total_failed:
+        print(f"{total_failed} images could not be inserted")
+    if regions is not None:
+        print(f"Created and inserted embeddings for {total_regions - failed_regions} regions")
+    return inserted
+
+
+def search_images(query_paths, embedder, store, top_k=5, batch_size=16, search_batch_size=256,
+                  filters=None, search_params=None):
+    """
+    Embed query images in batches and search a vector store with them.
+
+    Args:
+        query_paths (list): Query image paths
+        embedder: Embedder with `iter_embeddings(paths, batch_size=...)`
+        store (VectorStore): Store to search
+        top_k (int): Results per query
+        batch_size (int): Query images per forward pass
+        search_batch_size (int): Query vectors per `search_batch` call
+        filters (dict): Pre-filter conditions (see common.vector_store.FILTER_KEYS)
+        search_params (dict): Index-specific search parameters
+
+    Yields:
+        tuple: (query path, results) for every query that could be embedded; region
+               hits carry their "parent_image" (see common.regions)
+    """
+    yield from iter_batch_search(
+        # Time spent waiting for each embedded batch: read, decode and forward of the queries
+        METRICS.timed(embedder.iter_embeddings(query_paths, batch_size=batch_size), "embed"),
+        lambda vectors: [
+            with_parents(results)
+            for results in store.search_batch(vectors, top_k=top_k, filters=filters, search_params=search_params)
+        ],
+        search_batch_size=search_batch_size
+    )
@@ -0,0 +1,162 @@
+import io
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class BatchPreprocessor:
+    """Batched resize / center-crop / normalize on uint8 image tensors
+
+    Replaces per-image PIL transforms (torchvision Compose, HF image
+    processors). Images are decoded straight to uint8 CHW tensors, with large
+    JPEGs decoded at a reduced scale via PIL's `draft()`. The resize runs as
+    one `interpolate` call per group of same-sized images, and crop and
+    normalize run once over the whole batch, on `device`.
+
+    Geometry matches torchvision `Resize(resize)` + `CenterCrop(crop)`: the
+    shorter side is scaled to `resize`, then the center `crop` x `crop`
+    region is kept. HF image processors floor the crop offset where
+    torchvision rounds it; `crop_offset` selects which to match.
+    """
+
+    def __init__(
+        self,
+        resize=256,
+        crop=224,
+        mean=IMAGENET_MEAN,
+        std=IMAGENET_STD,
+        interpolation="bilinear",
+        device="cpu",
+        use_draft=True,
+        crop_offset="round",
+    ):
+        """
+        Args:
+            resize (int): Target length of the shorter image side
+            crop (int): Side of the square center crop
+            mean (tuple): Per-channel normalization mean (0-1 scale)
+            std (tuple): Per-channel normalization std (0-1 scale)
+            interpolation (str): "bilinear" or "bicubic"
+            device (str): Device the batched ops run on
+            use_draft (bool): Decode JPEGs at a reduced scale when they are much
+                              larger than `resize`
+            crop_offset (str): "round" (torchvision) or "floor" (HF processors)
+        """
+        self.resize = resize
+        self.crop = crop
+        self.mean = tuple(mean)
+        self.std = tuple(std)
+        self.interpolation = interpolation
+        self.device = device
+        self.use_draft = use_draft
+        self.crop_offset = crop_offset
+
+        # (x / 255 - mean) / std folded into a single multiply-add
+        std_t = torch.tensor(self.std, dtype=torch.float32).view(1, 3, 1, 1)
+        mean_t = torch.tensor(self.mean, dtype=torch.float32).view(1, 3, 1, 1)
+        self._scale = (1.0 / (255.0 * std_t)).to(device)
+        self._shift = (-mean_t / std_t).to(device)
+
+    def config(self):
+        """Settings that affect the output, e.g. for cache namespaces"""
+        return {
+            "resize": self.resize,
+            "crop": self.crop,
+            "mean": self.mean,
+            "std": self.std,
+            "interpolation": self.interpolation,
+            "use_draft": self.use_draft,
+            "crop_offset": self.crop_offset,
+        }
+
+    def load(self, source, draft_size=None):
+        """Decode an image to an RGB PIL image, large JPEGs at reduced scale
+
+        Args:
+            source: Encoded image bytes, a path, or an already opened PIL image
+            draft_size (int): Side both image sides are kept at or above when
+                              decoding at reduced scale (default: `resize`)
+
+        Returns:
+            PIL.Image.Image: Decoded RGB image
+        """
+        if isinstance(source, (bytes, bytearray)):
+            img = Image.open(io.BytesIO(source))
+        elif isinstance(source, Image.Image):
+            img = source
+        else:
+            img = Image.open(source)
+
+        if self.use_draft and img.format == "JPEG":
+            # Let libjpeg downscale by 1/2, 1/4 or 1/8 while keeping both sides >= resize
+            size = draft_size or self.resize
+            img.draft("RGB", (size, size))
+
+        return img.convert("RGB")
+
+    @staticmethod
+    def to_tensor(img):
+        """RGB PIL image as a uint8 tensor of shape (3, H, W)"""
+        return torch.from_numpy(np.array(img, dtype=np.uint8)).permute(2, 0, 1)
+
+    def decode(self, source):
+        """Decode an image to an RGB uint8 tensor of shape (3, H, W)
+
+        Args:
+            source: Encoded image bytes, a path, or an already opened PIL image
+
+        Returns:
+            torch.Tensor: uint8 image tensor
+        """
+        return self.to_tensor(self.load(source))
+
+    def _resized_size(self, height, width):
+        """Output size of scaling the shorter side to `resize` (torchvision rounding)"""
+        if height <= width:
+            return self.resize, int(self.resize * width / height)
+        return int(self.resize * height / width), self.resize
+
+    def __call__(self, images):
+        """Preprocess a batch of decoded images
+
+        Args:
+            images (list): uint8 tensors of shape (3, H, W), sizes may differ
+
+        Returns:
+            torch.Tensor: float32 tensor of shape (N, 3, crop, crop) on `device`
+        """
+        groups = {}
+        for idx, image in enumerate(images):
+            groups.setdefault(tuple(image.shape[1:]), []).append(idx)
+
+        batch = torch.empty(
+            (len(images), 3, self.crop, self.crop), dtype=torch.float32, device=self.device
+        )
+        for (height, width), indices in groups.items():
+            group = torch.stack([images[i] for i in indices]).to(self.device).float()
+
+            out_h, out_w = self._resized_size(height, width)
+            if (out_h, out_w) != (height, width):
+                group = F.interpolate(
+                    group,
+                    size=(out_h, out_w),
+                    mode=self.interpolation,
+                    align_corners=False,
+                    antialias=True,
+                )
+
+            if self.crop_offset == "floor":
+                top = (out_h - self.crop) // 2
+                left = (out_w - self.crop) // 2
+            else:
+                top = int(round((out_h - self.crop) / 2.0))
+                left = int(round((out_w - self.crop) / 2.0))
+            group = group[:, :, top : top + self.crop, left : left + self.crop]
+            batch[indices] = group.clamp_(0, 255)
+
+        return batch.mul_(self._scale).add_(self._shift)
@@ -0,0 +1,121 @@
+import numpy as np
+
+VECTOR_DTYPES = ("float32", "float16", "bfloat16", "int8", "binary")
+
+
+def code_layout(dtype, dim):
+    """
+    How vectors of a storage dtype are laid out.
+
+    Args:
+        dtype (str): One of VECTOR_DTYPES
+        dim (int): Embedding dimension
+
+    Returns:
+        tuple: (numpy dtype of the stored codes, codes per vector)
+    """
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype '{dtype}', expected one of {VECTOR_DTYPES}")
+    if dtype == "binary":
+        return np.dtype(np.uint8), (dim + 7) // 8
+    # bfloat16 has no numpy dtype: its bit patterns are kept as uint16
+    return np.dtype({"float32": np.float32, "float16": np.float16, "bfloat16": np.uint16, "int8": np.int8}[dtype]), dim
+
+
+def bytes_per_vector(dtype, dim):
+    """Storage size of one vector in bytes"""
+    code_dtype, width = code_layout(dtype, dim)
+    return code_dtype.itemsize * width
+
+
+def to_bfloat16(vectors):
+    """Round float32 values to bfloat16 (nearest even), returned as uint16 bit patterns"""
+    bits = np.ascontiguousarray(vectors, dtype=np.float32).view(np.uint32)
+    return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+
+
+def from_bfloat16(codes):
+    """Expand bfloat16 bit patterns (uint16) to float32"""
+    return (np.asarray(codes, dtype=np.uint16).astype(np.uint32) << 16).view(np.float32)
+
+
+def encode(vectors, dtype):
+    """
+    Compress float vectors to a storage dtype.
+
+    int8 scales every vector by 127 / its largest component (a per-vector scale
+    keeps the direction, which is all cosine similarity needs). binary keeps the
+    sign of every component, packed 8 per byte.
+
+    Args:
+        vectors (numpy.ndarray): (N, D) float vectors
+        dtype (str): One of VECTOR_DTYPES
+
+    Returns:
+        numpy.ndarray: (N, codes per vector) codes, see `code_layout`
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors
+    if dtype == "float16":
+        return vectors.astype(np.float16)
+    if dtype == "bfloat16":
+        return to_bfloat16(vectors)
+    if dtype == "int8":
+        scale = 127.0 / np.maximum(np.abs(vectors).max(axis=1, keepdims=True), 1e-12)
+        return np.rint(vectors * scale).astype(np.int8)
+    if dtype == "binary":
+        return np.packbits(vectors > 0, axis=1)
+    raise ValueError(f"Unknown vector dtype '{dtype}', expected one of {VECTOR_DTYPES}")
+
+
+def decode(codes, dtype, dim):
+    """
+    Expand stored codes to float32 vectors for scoring.
+
+    int8 and binary codes come back as unit vectors, so a dot product with a
+    unit query is a cosine estimate. For binary codes that estimate is the query
+    against the sign vector; between two binary codes it is 1 - 2 * hamming / dim.
+
+    Args:
+        codes (numpy.ndarray): (N, codes per vector) stored codes
+        dtype (str): One of VECTOR_DTYPES
+        dim (int): Embedding dimension
+
+    Returns:
+        numpy.ndarray: (N, dim) float32 vectors
+    """
+    if dtype in ("float32", "float16"):
+        return np.asarray(codes, dtype=np.float32)
+    if dtype == "bfloat16":
+        return from_bfloat16(codes)
+    if dtype == "int8":
+        vectors = np.asarray(codes, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    if dtype == "binary":
+        signs = np.unpackbits(np.asarray(codes, dtype=np.uint8), axis=1, count=dim).astype(np.float32)
+        return (signs * 2 - 1) / np.sqrt(dim, dtype=np.float32)
+    raise ValueError(f"Unknown vector dtype '{dtype}', expected one of {VECTOR_DTYPES}")
+
+
+def add_compression_arguments(parser, dtypes=VECTOR_DTYPES):
+    """Add the --store_dtype, --rerank_dir and --rerank_factor CLI options to a parser"""
+    parser.add_argument(
+        "--store_dtype",
+        choices=dtypes,
+        default="float32",
+        help="Vector storage of a new collection/store: float16/bfloat16 halve it, int8 quarters it, "
+             "binary keeps one sign bit per dimension for a Hamming first pass",
+    )
+    parser.add_argument(
+        "--rerank_dir",
+        default=None,
+        help="Directory of a local full-precision copy of the vectors; search candidates are reranked "
+             "exactly against it",
+    )
+    parser.add_argument(
+        "--rerank_factor",
+        type=int,
+        default=4,
+        help="With --rerank_dir, candidates fetched per requested result",
+    )
@@ -0,0 +1,219 @@
+import os
+import random
+
+import numpy as np
+
+from common.hashing import hash_bytes
+
+REDUCTION_METHODS = ("pca", "pca_whiten", "random")
+
+
+class Reducer:
+    """Fitted linear dimensionality reduction applied between the embedder and the store
+
+    Maps a vector x to normalize((x - mean) @ components). The result is
+    L2-normalized again, so reduced vectors keep the cosine convention of the
+    stores. Saved as an .npz artifact so indexing and querying apply the exact
+    same map.
+    """
+
+    def __init__(self, method, mean, components):
+        """
+        Args:
+            method (str): One of REDUCTION_METHODS (informational)
+            mean (numpy.ndarray): (D,) vector subtracted before projecting
+            components (numpy.ndarray): (D, d) projection matrix
+        """
+        self.method = method
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+
+    @property
+    def input_dim(self):
+        return self.components.shape[0]
+
+    @property
+    def output_dim(self):
+        return self.components.shape[1]
+
+    @property
+    def fingerprint(self):
+        """Short identifier of this exact map, e.g. "pca256-1a2b3c4d" (for manifests)"""
+        digest = hash_bytes(self.mean.tobytes() + self.components.tobytes())[:8]
+        return f"{self.method}{self.output_dim}-{digest}"
+
+    def transform(self, vectors):
+        """
+        Reduce vectors.
+
+        Args:
+            vectors (numpy.ndarray): (N, D) or (D,) embeddings
+
+        Returns:
+            numpy.ndarray: (N, d) or (d,) L2-normalized float32 vectors
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        reduced = (vectors - self.mean) @ self.components
+        return reduced / np.maximum(np.linalg.norm(reduced, axis=-1, keepdims=True), 1e-12)
+
+    def save(self, path):
+        """Write the reducer to an .npz file"""
+        with open(path, "wb") as f:
+            np.savez(f, method=self.method, mean=self.mean, components=self.components)
+        print(f"Saved {self.method} reduction {self.input_dim} -> {self.output_dim} dims to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Read a reducer written by `save`"""
+        with np.load(path) as data:
+            return cls(str(data["method"]), data["mean"], data["components"])
+
+
+def fit_reducer(vectors, dim, method="pca", seed=0):
+    """
+    Fit a reduction to `dim` dimensions.
+
+    pca keeps the `dim` directions of largest variance of the sample;
+    pca_whiten also scales each by 1/sqrt(its variance) so all kept directions
+    weigh equally in the cosine; random is an orthonormal Gaussian projection,
+    which needs no representative sample.
+
+    Args:
+        vectors (numpy.ndarray): (N, D) sample embeddings (only D is used by random)
+        dim (int): Output dimension
+        method (str): One of REDUCTION_METHODS
+        seed (int): Seed of the random projection
+
+    Returns:
+        Reducer: The fitted reducer
+    """
+    if method not in REDUCTION_METHODS:
+        raise ValueError(f"Unknown reduction '{method}', expected one of {REDUCTION_METHODS}")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    input_dim = vectors.shape[1]
+    if not 0 < dim <= input_dim:
+        raise ValueError(f"Cannot reduce {input_dim}-d embeddings to {dim} dimensions")
+
+    if method == "random":
+        rng = np.random.default_rng(seed)
+        components, _ = np.linalg.qr(rng.standard_normal((input_dim, dim)))
+        return Reducer(method, np.zeros(input_dim, dtype=np.float32), components)
+
+    if len(vectors) < dim:
+        raise ValueError(f"PCA to {dim} dimensions needs at least {dim} sample vectors, got {len(vectors)}")
+    mean = vectors.mean(axis=0)
+    centered = (vectors - mean).astype(np.float64)
+    # Eigen-decomposition of the D x D covariance is cheaper than an SVD of the sample
+    eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered / max(len(vectors) - 1, 1))
+    order = np.argsort(eigenvalues)[::-1][:dim]
+    components = eigenvectors[:, order]
+    if method == "pca_whiten":
+        components = components / np.sqrt(np.maximum(eigenvalues[order], 1e-12))
+    explained = eigenvalues[order].sum() / eigenvalues.sum()
+    print(f"PCA keeps {explained:.1%} of the variance in {dim} of {input_dim} dimensions")
+    return Reducer(method, mean, components)
+
+
+class ReducedEmbedder:
+    """Wraps an embedder so every embedding it returns is reduced
+
+    Used for indexing and querying alike, so both sides of a search see the
+    same map. The embedding cache of the wrapped embedder still holds the
+    full vectors, so changing the reduction does not invalidate it.
+    """
+
+    def __init__(self, embedder, reducer):
+        self.embedder = embedder
+        self.reducer = reducer
+
+    def __getattr__(self, name):
+        return getattr(self.embedder, name)
+
+    def get_embedding_dimension(self):
+        return self.reducer.output_dim
+
+    def iter_embeddings(self, image_paths, batch_size=16, **kwargs):
+        for paths, vectors, *rest in self.embedder.iter_embeddings(image_paths, batch_size=batch_size, **kwargs):
+            yield (paths, self.reducer.transform(vectors), *rest)
+
+    def embed_image(self, image_path):
+        vector = self.embedder.embed_image(image_path)
+        return None if vector is None else self.reducer.transform(vector)
+
+    def get_embedding(self, image_path):
+        return self.embed_image(image_path)
+
+    def embed_images(self, images):
+        return [
+            None if vector is None else self.reducer.transform(vector)
+            for vector in self.embedder.embed_images(images)
+        ]
+
+    def get_embeddings(self, images):
+        return self.embed_images(images)
+
+
+def load_or_fit_reducer(path, embedder, image_paths, dim, method="pca", sample_size=10000, batch_size=16, seed=0):
+    """
+    Load a saved reducer, or fit one on a random sample of images and save it.
+
+    Args:
+        path (str): Reducer artifact (.npz)
+        embedder: Full-dimension embedder with `iter_embeddings`
+        image_paths (list): Images to sample from when fitting
+        dim (int): Output dimension when fitting
+        method (str): One of REDUCTION_METHODS when fitting
+        sample_size (int): Images embedded to fit PCA
+        batch_size (int): Images per forward pass while fitting
+        seed (int): Seed of the sample and the random projection
+
+    Returns:
+        Reducer: The loaded or fitted reducer
+    """
+    if os.path.exists(path):
+        reducer = Reducer.load(path)
+        print(f"Loaded {reducer.method} reduction {reducer.input_dim} -> {reducer.output_dim} dims from {path}")
+        return reducer
+    if dim is None:
+        raise ValueError(f"{path} does not exist; give the reduced dimension to fit it")
+
+    if method == "random":
+        sample = np.zeros((1, embedder.get_embedding_dimension()), dtype=np.float32)
+    else:
+        # Sorted first: the scan order is not deterministic, the seeded sample should be
+        image_paths = sorted(image_paths)
+        sample_paths = random.Random(seed).sample(image_paths, min(sample_size, len(image_paths)))
+        print(f"Fitting {method} reduction on {len(sample_paths)} sample images")
+        sample = np.concatenate(
+            [vectors for _, vectors in embedder.iter_embeddings(sample_paths, batch_size=batch_size)]
+        )
+    reducer = fit_reducer(sample, dim, method=method, seed=seed)
+    reducer.save(path)
+    return reducer
+
+
+def add_reduction_arguments(parser, fit=True):
+    """Add the --reduction options to a parser (only loading when `fit` is False)"""
+    parser.add_argument(
+        "--reduction",
+        default=None,
+        help="Dimensionality reduction artifact (.npz) applied to every embedding"
+             + ("; fitted on a sample of the indexed images if it does not exist" if fit else ""),
+    )
+    if not fit:
+        return
+    parser.add_argument(
+        "--reduced_dim", type=int, default=None, help="Output dimension when fitting --reduction"
+    )
+    parser.add_argument(
+        "--reduction_method",
+        choices=REDUCTION_METHODS,
+        default="pca",
+        help="How --reduction is fitted: PCA, PCA with whitening, or a random orthonormal projection",
+    )
+    parser.add_argument(
+        "--reduction_sample",
+        type=int,
+        default=10000,
+        help="Images embedded to fit --reduction",
+    )
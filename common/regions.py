@@ -0,0 +1,245 @@
+import json
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# Polygon files written by point_annotator, looked up next to each image by stem
+REGION_EXTENSIONS = (".txt", ".json")
+REGION_MODES = ("bbox", "perspective")
+
+# Region records are keyed "<image path>#region<N>", so every region carries its parent
+REGION_SEPARATOR = "#region"
+
+# Crops whose shorter side would be smaller than this are skipped
+MIN_REGION_SIZE = 8
+
+
+def region_path(image_path, index):
+    """Key of the `index`-th region of an image"""
+    return f"{image_path}{REGION_SEPARATOR}{index}"
+
+
+def split_region_path(path):
+    """(parent image path, region index) of a region key; (path, None) for a whole image"""
+    parent, sep, index = str(path).rpartition(REGION_SEPARATOR)
+    if sep and index.isdigit():
+        return parent, int(index)
+    return str(path), None
+
+
+def is_region_path(path):
+    """Whether a stored path is a region key rather than a whole image"""
+    return split_region_path(path)[1] is not None
+
+
+def with_parents(results):
+    """Search results with "parent_image" and "region" added to the region hits"""
+    annotated = []
+    for result in results:
+        parent, index = split_region_path(result["image_path"])
+        if index is not None:
+            result = {**result, "parent_image": parent, "region": index}
+        annotated.append(result)
+    return annotated
+
+
+def load_polygons(path):
+    """
+    Read a polygon file as written by point_annotator's "Save Points".
+
+    The file holds JSON: one polygon as a list of [x, y] points in original
+    image pixels, or a list of such polygons.
+
+    Returns:
+        list: One float64 array of shape (N, 2) per polygon
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if data and all(isinstance(value, (int, float)) for value in data[0]):
+        data = [data]
+
+    polygons = []
+    for points in data:
+        polygon = np.asarray(points, dtype=np.float64)
+        if polygon.ndim != 2 or polygon.shape[1] != 2 or len(polygon) < 3:
+            raise ValueError(f"{path}: a polygon needs at least 3 [x, y] points, got {points}")
+        polygons.append(polygon)
+    return polygons
+
+
+def order_corners(polygon):
+    """The 4 corners of a quadrilateral as top-left, top-right, bottom-right, bottom-left
+
+    Points are sorted by angle around their centroid (clockwise on screen,
+    where y grows downwards), so they may have been clicked in any order.
+    """
+    points = np.asarray(polygon, dtype=np.float64)
+    if len(points) != 4:
+        raise ValueError(f"Perspective rectification needs 4 points, got {len(points)}")
+    center = points.mean(axis=0)
+    points = points[np.argsort(np.arctan2(points[:, 1] - center[1], points[:, 0] - center[0]))]
+    return np.roll(points, -int(np.argmin(points.sum(axis=1))), axis=0)
+
+
+def perspective_coefficients(corners, width, height):
+    """
+    Coefficients of PIL's PERSPECTIVE transform mapping a `width` x `height`
+    output rectangle onto the quadrilateral `corners` (see `order_corners`).
+    """
+    target = ((0, 0), (width, 0), (width, height), (0, height))
+    rows, rhs = [], []
+    for (x, y), (u, v) in zip(target, corners):
+        rows.append([x, y, 1, 0, 0, 0, -u * x, -u * y])
+        rows.append([0, 0, 0, x, y, 1, -v * x, -v * y])
+        rhs.extend((u, v))
+    return np.linalg.solve(np.array(rows), np.array(rhs))
+
+
+class RegionSource:
+    """Finds the polygon file of an image and crops its regions from the decoded pixels
+
+    Plain attributes only, so it can be handed to shard worker processes
+    (see common.sharding.ShardedEmbedder).
+    """
+
+    def __init__(self, regions_dir=None, root=None, mode="bbox", min_size=MIN_REGION_SIZE):
+        """
+        Args:
+            regions_dir (str): Directory mirroring the image tree that holds the polygon
+                               files; None looks next to each image
+            root (str): Directory that was scanned, to mirror paths under `regions_dir`
+            mode (str): "bbox" crops the bounding box of each polygon, "perspective"
+                        rectifies its 4 corners to an upright rectangle
+            min_size (int): Smallest crop side kept, in original image pixels
+        """
+        if mode not in REGION_MODES:
+            raise ValueError(f"Unknown region mode {mode!r}; expected one of {REGION_MODES}")
+        self.regions_dir = regions_dir
+        self.root = root
+        self.mode = mode
+        self.min_size = min_size
+
+    def find(self, image_path):
+        """Path of the polygon file of an image, or None if it has none"""
+        image_path = Path(image_path)
+        if self.regions_dir is None:
+            base = image_path
+        elif self.root is not None:
+            try:
+                base = Path(self.regions_dir) / image_path.relative_to(self.root)
+            except ValueError:
+                base = Path(self.regions_dir) / image_path.name
+        else:
+            base = Path(self.regions_dir) / image_path.name
+        for extension in REGION_EXTENSIONS:
+            candidate = base.with_suffix(extension)
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def polygons(self, image_path):
+        """Polygons annotated on an image, in original pixels; [] if it has none"""
+        if isinstance(image_path, bytes):
+            return []
+        path = self.find(image_path)
+        if path is None:
+            return []
+        polygons = load_polygons(path)
+        if self.mode == "perspective":
+            # Only quadrilaterals can be rectified
+            for idx, polygon in enumerate(polygons):
+                if len(polygon) != 4:
+                    print(f"Skipping region {idx} of {image_path}: perspective mode needs 4 points")
+            polygons = [polygon for polygon in polygons if len(polygon) == 4]
+        return polygons
+
+    def size(self, polygon):
+        """(width, height) of the crop of a polygon, in the pixels it is given in"""
+        if self.mode == "perspective":
+            tl, tr, br, bl = order_corners(polygon)
+            width = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+            height = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+            return max(int(round(width)), 1), max(int(round(height)), 1)
+        x0, y0 = np.floor(polygon.min(axis=0))
+        x1, y1 = np.ceil(polygon.max(axis=0))
+        return int(x1 - x0), int(y1 - y0)
+
+    def signature(self, polygon):
+        """Text identifying a crop, mixed into its embedding cache key"""
+        return f"{self.mode}:{np.round(polygon, 2).tolist()}"
+
+    def crop(self, img, polygon, scale=1.0):
+        """
+        Crop one region from a decoded image.
+
+        Args:
+            img (PIL.Image.Image): Decoded RGB image
+            polygon (numpy.ndarray): Points in original image pixels
+            scale (float): Decoded size over original size (below 1 when the
+                           JPEG was decoded at reduced scale)
+
+        Returns:
+            PIL.Image.Image: The crop
+        """
+        width, height = self.size(polygon)
+        if min(width, height) < self.min_size:
+            raise ValueError(f"region of {width}x{height} px is smaller than {self.min_size} px")
+
+        polygon = polygon * scale
+        if self.mode == "perspective":
+            width, height = self.size(polygon)
+            coefficients = perspective_coefficients(order_corners(polygon), width, height)
+            return img.transform(
+                (width, height), Image.Transform.PERSPECTIVE, tuple(coefficients),
+                resample=Image.Resampling.BICUBIC,
+            )
+
+        x0, y0 = np.maximum(np.floor(polygon.min(axis=0)), 0)
+        x1, y1 = np.minimum(np.ceil(polygon.max(axis=0)), img.size)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError("region lies outside the image")
+        return img.crop((int(x0), int(y0), int(x1), int(y1)))
+
+    def draft_size(self, image_size, polygons, resize):
+        """
+        Smallest decode size at which every region still covers `resize` pixels
+        on its shorter side, so reduced-scale JPEG decoding does not blur them.
+        """
+        width, height = image_size
+        request = resize
+        for polygon in polygons:
+            region = min(self.size(polygon))
+            if region >= self.min_size:
+                request = max(request, math.ceil(resize * min(width, height) / region))
+        return request
+
+
+def add_region_arguments(parser):
+    """Add the region embedding options to an index parser"""
+    parser.add_argument(
+        "--regions",
+        action="store_true",
+        help="Also embed the polygons annotated with point_annotator (<image stem>.txt or .json "
+             "next to each image), stored as '<image>#region<N>'",
+    )
+    parser.add_argument(
+        "--regions_dir",
+        default=None,
+        help="Directory mirroring the image tree that holds the polygon files (implies --regions)",
+    )
+    parser.add_argument(
+        "--region_mode",
+        choices=REGION_MODES,
+        default="bbox",
+        help="Embed the bounding box of each polygon, or rectify its 4 corners to an upright rectangle",
+    )
+
+
+def regions_from_args(args, root=None):
+    """RegionSource selected on the command line, or None"""
+    if not (args.regions or args.regions_dir):
+        return None
+    return RegionSource(args.regions_dir, root=root, mode=args.region_mode)
@@ -0,0 +1,120 @@
+import numpy as np
+
+from common.local_store import LocalImageDB
+from common.metrics import METRICS
+from common.vector_store import VectorStore
+
+
+class RerankingStore(VectorStore):
+    """Compressed vector store whose candidates are reranked at full precision
+
+    The wrapped store holds compact vectors (float16, bfloat16, int8 or binary)
+    for the first-pass ANN search, while a local float32 sidecar
+    (a flat LocalImageDB, memory-mapped on disk) keeps the exact vectors keyed by
+    the path the wrapped store reports. Each search fetches `rerank_factor`
+    times more candidates than requested and re-scores them against the sidecar,
+    so only the candidates' rows of the full-precision file are ever paged in.
+    """
+
+    def __init__(self, store, sidecar, rerank_factor=4):
+        """
+        Args:
+            store (VectorStore): Store searched first, usually holding compressed vectors
+            sidecar (LocalImageDB): Full-precision copy of the vectors
+            rerank_factor (int): Candidates fetched per requested result
+        """
+        self.store = store
+        self.sidecar = sidecar
+        self.rerank_factor = rerank_factor
+
+    def __getattr__(self, name):
+        # Store-specific operations (rebuild_index, fetch_embeddings, ...) go to the wrapped store
+        return getattr(self.store, name)
+
+    def stored_path(self, image_path):
+        return self.store.stored_path(image_path)
+
+    def upsert(self, records, replace=True, flush=True):
+        """Insert into the store, then keep the sidecar copy of every accepted record"""
+        failed = self.store.upsert(records, replace=replace, flush=flush)
+        rejected = set(failed)
+        self.sidecar.upsert(
+            [
+                {"image_path": self.store.stored_path(record["image_path"]), "vector": record["vector"]}
+                for record in records
+                if record["image_path"] not in rejected
+            ],
+            replace=replace,
+            flush=flush,
+        )
+        return failed
+
+    def search_batch(self, query_embeddings, top_k=5, filters=None, search_params=None):
+        """
+        Search the store for `top_k * rerank_factor` candidates and return the
+        `top_k` closest by exact cosine similarity. Candidates missing from the
+        sidecar keep their approximate score and rank after the exact ones.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        candidates = self.store.search_batch(
+            queries, top_k=top_k * self.rerank_factor, filters=filters, search_params=search_params
+        )
+
+        # One sidecar lookup for the candidates of the whole batch
+        paths = list({hit["image_path"] for hits in candidates for hit in hits})
+        with METRICS.time("fetch", len(paths)):
+            vectors, found = self.sidecar.get_embeddings(paths)
+        position = {path: i for i, path in enumerate(paths)}
+
+        reranked = []
+        for query, hits in zip(queries, candidates):
+            rows = np.array([position[hit["image_path"]] for hit in hits], dtype=np.int64)
+            exact = found[rows]
+            scores = np.where(exact, vectors[rows] @ query, [hit["distance"] for hit in hits])
+            order = np.lexsort((-scores, ~exact))[:top_k]
+            reranked.append([{**hits[i], "distance": float(scores[i])} for i in order])
+        return reranked
+
+    def delete_by_paths(self, image_paths, verbose=True):
+        self.store.delete_by_paths(image_paths, verbose=verbose)
+        self.sidecar.delete_by_paths([self.store.stored_path(path) for path in image_paths], verbose=False)
+
+    def count(self):
+        return self.store.count()
+
+    def iter_vectors(self, batch_size=65536):
+        """Stream the full-precision sidecar copy instead of the compressed vectors"""
+        return self.sidecar.iter_vectors(batch_size)
+
+    def flush(self):
+        self.store.flush()
+        self.sidecar.flush()
+
+    def load_collection(self, wait=True, timeout=None):
+        self.store.load_collection(wait=wait, timeout=timeout)
+
+    def wait_until_loaded(self, timeout=None):
+        self.store.wait_until_loaded(timeout=timeout)
+
+    def close(self):
+        self.store.close()
+        self.sidecar.close()
+
+
+def with_reranking(store, rerank_dir, dim, rerank_factor=4):
+    """
+    Wrap a store with exact reranking from a sidecar directory, if one is given.
+
+    Args:
+        store (VectorStore): Store to wrap
+        rerank_dir (str): Directory of the float32 sidecar, or None for no reranking
+        dim (int): Embedding dimension
+        rerank_factor (int): Candidates fetched per requested result
+
+    Returns:
+        VectorStore: `store` itself, or a RerankingStore around it
+    """
+    if rerank_dir is None:
+        return store
+    return RerankingStore(store, LocalImageDB(rerank_dir, dim=dim), rerank_factor=rerank_factor)
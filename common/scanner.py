@@ -0,0 +1,166 @@
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from common.metrics import METRICS
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+
+# Leading bytes of each supported format; (offset, bytes) pairs must all match
+IMAGE_SIGNATURES = {
+    "JPEG": ((0, b"\xff\xd8\xff"),),
+    "PNG": ((0, b"\x89PNG\r\n\x1a\n"),),
+    "GIF": ((0, b"GIF8"),),
+    "BMP": ((0, b"BM"),),
+    "WEBP": ((0, b"RIFF"), (8, b"WEBP")),
+}
+SIGNATURE_BYTES = 12
+
+# Files whose signatures are read per task when checking signatures
+CHECK_CHUNK_SIZE = 256
+
+
+def sniff_format(header):
+    """Image format named by the leading bytes of a file, or None if unrecognized"""
+    for name, parts in IMAGE_SIGNATURES.items():
+        if all(header[offset:offset + len(magic)] == magic for offset, magic in parts):
+            return name
+    return None
+
+
+def has_image_signature(path):
+    """Whether a file starts with the signature of a supported image format
+
+    Reads only the first few bytes, unlike PIL's `verify`, which parses the
+    whole file; truncated or corrupt images are still caught when decoded.
+    """
+    try:
+        with open(path, "rb") as f:
+            return sniff_format(f.read(SIGNATURE_BYTES)) is not None
+    except OSError:
+        return False
+
+
+def _signed(paths):
+    return [path for path in paths if has_image_signature(path)]
+
+
+def _scan_dir(directory, extensions):
+    """List the image files and subdirectories of one directory"""
+    start = time.perf_counter()
+    files, subdirs = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    # d_type from the directory listing answers both checks without a stat
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(extensions) and entry.is_file():
+                        files.append(entry.path)
+                except OSError:
+                    continue
+    except OSError as e:
+        METRICS.count("failures", stage="scan")
+        print(f"Cannot scan {directory}: {e}")
+    METRICS.record("scan", time.perf_counter() - start, len(files))
+    return files, subdirs
+
+
+def _iter_file_list(file_list, directory, extensions):
+    """Paths listed one per line; relative entries are taken relative to `directory`"""
+    with open(file_list) as f:
+        for line in f:
+            path = line.strip()
+            if not path or not path.lower().endswith(extensions):
+                continue
+            if directory is not None and not os.path.isabs(path):
+                path = os.path.join(directory, path)
+            yield path
+
+
+def iter_image_paths(directory=None, file_list=None, extensions=IMAGE_EXTENSIONS, workers=16,
+                     check_signatures=False, recursive=True):
+    """
+    Stream the image paths under a directory, or listed in a file.
+
+    Directories are listed with `os.scandir` by a pool of threads, one task per
+    directory, so the subtrees of a dataset are scanned in parallel and paths
+    are yielded as soon as their directory has been listed. The order is not
+    deterministic; sort the paths if it matters.
+
+    Args:
+        directory (str): Directory to scan
+        file_list (str): Text file listing image paths, one per line, read
+                         instead of scanning `directory`
+        extensions (tuple): Lower-case image file extensions
+        workers (int): Scanning threads; on network filesystems listing and
+                       reading headers are latency-bound, so more threads help
+        check_signatures (bool): Drop files whose first bytes are not those of a
+                                 supported image format (see `has_image_signature`)
+        recursive (bool): Also scan subdirectories
+
+    Yields:
+        str: Image file paths
+    """
+    if directory is None and file_list is None:
+        raise ValueError("Give a directory to scan or a file list")
+    workers = max(workers, 1)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if file_list is not None:
+            paths = _iter_file_list(file_list, directory, extensions)
+            if not check_signatures:
+                yield from paths
+                return
+            chunks = iter(lambda: list(itertools.islice(paths, CHECK_CHUNK_SIZE)), [])
+            for signed in pool.map(_signed, chunks):
+                yield from signed
+            return
+
+        # future -> True for a directory listing, False for a signature check
+        pending = {pool.submit(_scan_dir, directory, extensions): True}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if not pending.pop(future):
+                        yield from future.result()
+                        continue
+                    files, subdirs = future.result()
+                    if recursive:
+                        for subdir in subdirs:
+                            pending[pool.submit(_scan_dir, subdir, extensions)] = True
+                    if not check_signatures:
+                        yield from files
+                        continue
+                    for i in range(0, len(files), CHECK_CHUNK_SIZE):
+                        pending[pool.submit(_signed, files[i:i + CHECK_CHUNK_SIZE])] = False
+        finally:
+            # A consumer that stops early should not wait for the rest of the tree
+            for future in pending:
+                future.cancel()
+
+
+def scan_images(directory=None, file_list=None, **scan_kwargs):
+    """Sorted list of the paths from `iter_image_paths`"""
+    return sorted(iter_image_paths(directory, file_list=file_list, **scan_kwargs))
+
+
+def add_scan_arguments(parser):
+    """Add the directory scanning options to a parser"""
+    parser.add_argument(
+        "--file_list",
+        default=None,
+        help="Text file listing the images to index, one per line, instead of scanning the directory "
+             "(relative entries are taken relative to the directory)",
+    )
+    parser.add_argument(
+        "--scan_workers", type=int, default=16, help="Threads listing directories and reading file headers"
+    )
+    parser.add_argument(
+        "--check_signatures",
+        action="store_true",
+        help="Skip files whose leading bytes are not a JPEG, PNG, GIF, BMP or WebP signature",
+    )
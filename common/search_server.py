@@ -0,0 +1,247 @@
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from common.metrics import METRICS, metrics_response
+from common.regions import with_parents
+
+
+class MicroBatcher:
+    """Groups concurrent embedding requests into single batched calls
+
+    Requests are queued; a background thread takes the first waiting request,
+    keeps collecting for up to `max_wait_ms` (or until `max_batch_size`
+    requests are waiting), then embeds them all with one `embed_fn` call.
+    """
+
+    def __init__(self, embed_fn, max_batch_size=32, max_wait_ms=5.0):
+        """
+        Args:
+            embed_fn: Callable mapping a list of images (paths or bytes) to a list
+                      of embeddings, None for images that failed
+            max_batch_size (int): Maximum images per forward pass
+            max_wait_ms (float): How long the first request waits for company
+        """
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        """Queue an image for embedding and return a Future for its vector"""
+        future = Future()
+        self._requests.put((image, future))
+        return future
+
+    def embed(self, image, timeout=None):
+        """Embed one image, blocking until its batch has run"""
+        return self.submit(image).result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self.embed_fn([image for image, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def resolve_query_path(path, path_root):
+    """
+    Resolve a JSON query path against the directory path queries may read.
+
+    Relative paths are taken relative to `path_root`; symlinks are resolved so
+    they cannot lead outside it.
+
+    Raises:
+        PermissionError: Path queries are disabled (no `path_root`) or the
+                         path is outside `path_root`
+    """
+    if path_root is None:
+        raise PermissionError("path queries are disabled; send the image bytes instead")
+    root = os.path.realpath(path_root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise PermissionError(f"{path} is outside the served directory")
+    return resolved
+
+
+def _make_handler(batcher, search_fn, default_top_k, path_root=None):
+    """Build the request handler class bound to a batcher and a search function"""
+
+    class SearchHandler(BaseHTTPRequestHandler):
+        def address_string(self):
+            # Unix socket peers have no (host, port) address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif path == "/metrics":
+                content_type, body = metrics_response()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/search":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            query = parse_qs(url.query)
+            try:
+                top_k = int(query.pop("top_k", [default_top_k])[0])
+                # Every other query parameter is a filter, e.g. ?format=JPEG&min_width=1024
+                filters = {key: values[0] for key, values in query.items()}
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    # {"path": "image/under/path_root.jpg", "top_k": 5, "filters": {...}}
+                    request = json.loads(body)
+                    image = resolve_query_path(request["path"], path_root)
+                    top_k = int(request.get("top_k", top_k))
+                    filters = request.get("filters", filters)
+                else:
+                    # Raw encoded image in the request body
+                    image = body
+                if top_k <= 0:
+                    raise ValueError(f"top_k must be positive, got {top_k}")
+            except PermissionError as e:
+                self._send_json(403, {"error": str(e)})
+                return
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {"error": f"bad request: {e}"})
+                return
+
+            start = time.perf_counter()
+            METRICS.count("queries")
+            try:
+                vector = batcher.embed(image)
+            except Exception as e:
+                # The whole micro-batch failed, e.g. the model ran out of memory
+                METRICS.count("failures", stage="embed")
+                self._send_json(503, {"error": f"embedding failed: {e}"})
+                return
+            embedded = time.perf_counter()
+            # Includes the wait for the micro-batch; "forward" has the model time alone
+            METRICS.record("embed", embedded - start, 1)
+            if vector is None:
+                METRICS.count("failures", stage="embed")
+                self._send_json(422, {"error": "could not embed query image"})
+                return
+
+            try:
+                results = with_parents(search_fn(vector, top_k, filters or None))
+            except ValueError as e:
+                # Unknown filter keys or values
+                METRICS.count("failures", stage="search")
+                self._send_json(400, {"error": f"bad request: {e}"})
+                return
+            except Exception as e:
+                # Database unreachable, timed out or otherwise failing
+                METRICS.count("failures", stage="search")
+                self._send_json(503, {"error": f"search failed: {e}"})
+                return
+            done = time.perf_counter()
+            self._send_json(200, {
+                "results": results,
+                "embed_ms": (embedded - start) * 1000,
+                "search_ms": (done - embedded) * 1000,
+            })
+
+    return SearchHandler
+
+
+def serve(embed_fn, search_fn, host="127.0.0.1", port=8000, socket_path=None,
+          max_batch_size=32, max_wait_ms=5.0, default_top_k=5, path_root=None):
+    """
+    Run a resident image search server until interrupted.
+
+    The caller loads the model and opens the database connection once; every
+    request reuses them. Concurrent query embeddings are micro-batched.
+
+    Endpoints:
+        GET  /health                 -> {"status": "ok"}
+        GET  /metrics                -> per-stage timings and counters in the
+                                     Prometheus text format (common.metrics)
+        POST /search?top_k=K&...     raw image bytes in the body, or JSON
+                                     {"path": ..., "top_k": ..., "filters": {...}}
+                                     (paths only with `path_root`)
+                                     -> {"results": [...], "embed_ms": ..., "search_ms": ...}
+                                     Other query parameters are search filters
+                                     (common.vector_store.FILTER_KEYS)
+                                     Bad requests get 400, paths outside `path_root` 403, unreadable images 422 and
+                                     failing embeddings or searches 503
+
+    Args:
+        embed_fn: Batched embedding function (see MicroBatcher)
+        search_fn: Callable (vector, top_k, filters) -> list of JSON-serializable results
+        host (str): TCP host to bind (ignored with socket_path)
+        port (int): TCP port to bind (ignored with socket_path)
+        socket_path (str): Serve on this Unix domain socket instead of TCP
+        max_batch_size (int): Maximum query images per forward pass
+        max_wait_ms (float): Maximum time a query waits to be batched
+        default_top_k (int): Results returned when the request gives no top_k
+        path_root (str): Directory JSON path queries may read images from; path
+                         queries are rejected without it, since any client could
+                         otherwise make the server open any file it can read
+    """
+    batcher = MicroBatcher(embed_fn, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    handler = _make_handler(batcher, search_fn, default_top_k, path_root)
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _ThreadingUnixHTTPServer(socket_path, handler)
+        print(f"Search server listening on unix:{socket_path}")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        print(f"Search server listening on http://{host}:{port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down search server")
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
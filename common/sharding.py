@@ -0,0 +1,237 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+
+from common.metrics import METRICS
+from common.regions import is_region_path
+
+# Seconds between the per-stage metrics a worker sends back to the parent
+METRICS_INTERVAL = 5.0
+
+
+def _available_cpus():
+    """CPU ids this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _iter_tasks(tasks, seen):
+    """Paths of the chunks taken from the shared task queue, until the end marker"""
+    for chunk in iter(tasks.get, None):
+        seen[0] += len(chunk)
+        yield from chunk
+
+
+def _shard_worker(shard_id, tasks, factory, factory_kwargs, threads, cpus, batch_size, iter_kwargs, results,
+                  profile=(None, None)):
+    """Embed path chunks from the task queue in a worker process and stream batches back"""
+    seen = [0]
+    try:
+        if profile[0] is not None:
+            METRICS.configure_profiler(*profile)
+        if cpus and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+
+        import torch
+
+        torch.set_num_threads(threads)
+
+        embedder = factory(**factory_kwargs)
+        embedded = 0
+        last_metrics = time.time()
+        paths = _iter_tasks(tasks, seen)
+        for batch_paths, *outputs in embedder.iter_embeddings(paths, batch_size=batch_size, **iter_kwargs):
+            # outputs: the embeddings, plus metadata when requested
+            results.put(("batch", shard_id, list(batch_paths), *outputs))
+            # Region records are extra rows, not extra images
+            embedded += sum(1 for path in batch_paths if not is_region_path(path))
+            if time.time() - last_metrics >= METRICS_INTERVAL:
+                results.put(("metrics", shard_id, METRICS.snapshot()))
+                last_metrics = time.time()
+        results.put(("metrics", shard_id, METRICS.snapshot()))
+        results.put(("done", shard_id, seen[0], embedded))
+    except Exception:
+        results.put(("error", shard_id, traceback.format_exc()))
+
+
+class ShardedEmbedder:
+    """Embeds a file list across several worker processes
+
+    Each worker process builds its own embedder with `factory(**factory_kwargs)`,
+    pins itself to a disjoint set of CPUs and limits PyTorch to that many
+    intra-op threads. A feeder thread reads the paths as the scan yields them
+    and hands them out in chunks over a bounded task queue, which the workers
+    take from as they become free, so embedding starts before the scan ends
+    and memory does not grow with the tree. Batches stream back over a bounded
+    queue to the calling process, which stays the single writer to the vector
+    database.
+
+    Exposes the same `iter_embeddings` generator as the embedders, so indexing
+    code does not need to know whether it is sharded.
+    """
+
+    def __init__(
+        self,
+        factory,
+        factory_kwargs=None,
+        num_shards=2,
+        threads_per_shard=None,
+        pin_cpus=True,
+        queue_size=16,
+        report_interval=10.0,
+        embedding_dim=None,
+    ):
+        """
+        Args:
+            factory: Picklable callable (e.g. an embedder class) building an embedder
+                     that has `iter_embeddings(paths, batch_size=..., **kwargs)`
+            factory_kwargs (dict): Keyword arguments for `factory`
+            num_shards (int): Number of worker processes
+            threads_per_shard (int): PyTorch threads per worker. Defaults to an
+                                     even split of the available CPUs.
+            pin_cpus (bool): Pin each worker to its own CPUs (Linux only)
+            queue_size (int): Maximum number of batches waiting for the writer
+            report_interval (float): Seconds between aggregated progress lines
+            embedding_dim (int): Embedding dimension, returned by
+                                 `get_embedding_dimension` without loading a model
+        """
+        self.factory = factory
+        self.factory_kwargs = factory_kwargs or {}
+        self.num_shards = num_shards
+        self.threads_per_shard = threads_per_shard
+        self.pin_cpus = pin_cpus
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self.embedding_dim = embedding_dim
+
+    def get_embedding_dimension(self):
+        """Embedding dimension given at construction"""
+        return self.embedding_dim
+
+    def _shard_cpus(self, threads):
+        """Split the available CPUs into one disjoint group per shard (None = no pinning)"""
+        cpus = _available_cpus()
+        if not self.pin_cpus or threads * self.num_shards > len(cpus):
+            return [None] * self.num_shards
+        return [cpus[i * threads:(i + 1) * threads] for i in range(self.num_shards)]
+
+    def iter_embeddings(self, image_paths, batch_size=16, **iter_kwargs):
+        """
+        Embed all paths across the worker processes.
+
+        Args:
+            image_paths (iterable): Image file paths, consumed lazily (e.g. the
+                                    generator of common.scanner.iter_image_paths)
+            batch_size (int): Images per forward pass inside each worker, and paths
+                              per chunk handed to a worker
+            **iter_kwargs: Passed through to each worker embedder's `iter_embeddings`
+
+        Yields:
+            tuple: (paths, embeddings) batches in completion order, or
+                   (paths, embeddings, metadata) with `with_metadata=True`
+        """
+        threads = self.threads_per_shard or max(1, len(_available_cpus()) // self.num_shards)
+        shard_cpus = self._shard_cpus(threads)
+
+        ctx = mp.get_context("spawn")
+        results = ctx.Queue(maxsize=self.queue_size)
+        # A few chunks per shard in flight keeps every worker busy without reading the scan ahead
+        tasks = ctx.Queue(maxsize=2 * self.num_shards)
+        stop = threading.Event()
+        # Paths handed out so far, and an exception raised by the scan
+        feed = {"paths": 0, "error": None}
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    tasks.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def feeder():
+            try:
+                paths_iter = iter(image_paths)
+                for chunk in iter(lambda: list(itertools.islice(paths_iter, batch_size)), []):
+                    if not put(chunk):
+                        return
+                    feed["paths"] += len(chunk)
+            except Exception as e:
+                feed["error"] = e
+            finally:
+                for _ in range(self.num_shards):
+                    put(None)
+
+        procs = []
+        for shard_id in range(self.num_shards):
+            proc = ctx.Process(
+                target=_shard_worker,
+                args=(
+                    shard_id, tasks, self.factory, self.factory_kwargs,
+                    threads, shard_cpus[shard_id], batch_size, iter_kwargs, results,
+                    # A sampled profiler trace comes from the first shard
+                    (METRICS.profile_batch, METRICS.profile_path) if shard_id == 0 else (None, None),
+                ),
+                daemon=True,
+            )
+            proc.start()
+            procs.append(proc)
+        feeder_thread = threading.Thread(target=feeder, daemon=True)
+        feeder_thread.start()
+        print(f"Started {self.num_shards} shards with {threads} threads each")
+
+        running = set(range(self.num_shards))
+        embedded = 0
+        failed = 0
+        start = last_report = time.time()
+        try:
+            while running:
+                if feed["error"] is not None:
+                    raise feed["error"]
+                try:
+                    message = results.get(timeout=5)
+                except queue.Empty:
+                    for shard_id in running:
+                        if not procs[shard_id].is_alive():
+                            raise RuntimeError(
+                                f"Shard {shard_id} exited with code {procs[shard_id].exitcode}"
+                            )
+                    continue
+
+                kind, shard_id = message[0], message[1]
+                if kind == "batch":
+                    embedded += sum(1 for path in message[2] if not is_region_path(path))
+                    yield tuple(message[2:])
+                elif kind == "metrics":
+                    # Read, decode and forward timings of the worker, merged into this process's
+                    METRICS.merge_child(f"shard{shard_id}", message[2])
+                elif kind == "done":
+                    failed += message[2] - message[3]
+                    running.discard(shard_id)
+                else:
+                    raise RuntimeError(f"Shard {shard_id} failed:\n{message[2]}")
+
+                now = time.time()
+                if now - last_report >= self.report_interval:
+                    print(f"[shards] {embedded}/{feed['paths']} embedded, {failed} failed, "
+                          f"{len(running)} running, {embedded / (now - start):.1f} img/s")
+                    last_report = now
+
+            elapsed = max(time.time() - start, 1e-9)
+            if feed["error"] is not None:
+                raise feed["error"]
+            print(f"[shards] done: {embedded}/{feed['paths']} embedded, {failed} failed, "
+                  f"{embedded / elapsed:.1f} img/s")
+        finally:
+            stop.set()
+            feeder_thread.join()
+            for proc in procs:
+                if proc.is_alive():
+                    proc.terminate()
+                proc.join()
@@ -0,0 +1,161 @@
+FILTER_KEYS = ("path_prefix", "format", "min_width", "max_width", "min_height", "max_height")
+
+# Image metadata fields every store keeps as indexed scalars, so they can be filtered on
+FILTER_FIELDS = ("width", "height", "format")
+
+# Range filter key -> (metadata field, comparison)
+RANGE_FILTERS = {
+    "min_width": ("width", ">="),
+    "max_width": ("width", "<="),
+    "min_height": ("height", ">="),
+    "max_height": ("height", "<="),
+}
+
+FORMAT_ALIASES = {"JPG": "JPEG", "TIF": "TIFF"}
+
+
+def check_filters(filters):
+    """
+    Validate filters and bring them to the form the stores compare against.
+
+    Unknown keys are rejected, so typos do not silently widen a search; unset
+    (None) conditions are dropped, and formats are upper-cased PIL format names
+    ("jpg" -> "JPEG").
+
+    Returns:
+        dict: The conditions to apply (empty for no filter)
+    """
+    unknown = set(filters or {}) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filters {sorted(unknown)}, expected some of {FILTER_KEYS}")
+    filters = {key: value for key, value in (filters or {}).items() if value not in (None, "")}
+    if "format" in filters:
+        name = str(filters["format"]).upper()
+        filters["format"] = FORMAT_ALIASES.get(name, name)
+    for key in RANGE_FILTERS:
+        if key in filters:
+            filters[key] = int(filters[key])
+    return filters
+
+
+def add_filter_arguments(parser):
+    """Add the metadata filter options of searches to a parser"""
+    group = parser.add_argument_group("filters", "Pre-filters applied inside the vector search")
+    group.add_argument("--path_prefix", default=None, help="Only images whose stored path starts with this")
+    group.add_argument("--format", default=None, help="Only images of this format, e.g. JPEG or PNG")
+    for key, (field, comparison) in RANGE_FILTERS.items():
+        bound = "at least" if comparison == ">=" else "at most"
+        group.add_argument(f"--{key}", type=int, default=None, help=f"Only images {bound} this many pixels in {field}")
+
+
+def filters_from_args(args):
+    """The filters given with the `add_filter_arguments` options (None for none)"""
+    return check_filters({key: getattr(args, key, None) for key in FILTER_KEYS}) or None
+
+
+class VectorStore:
+    """Interface shared by the vector database backends
+
+    Implementations: MilvusImageDB (milvus/milvus_setup.py), WeaviateImageDB
+    (weaviate/image_embedding/weaviate_store.py) and the embedded LocalImageDB
+    (common/local_store.py). The indexing and search pipeline in
+    common/pipeline.py only talks to this interface.
+
+    Records are dicts with "image_path", "vector" (L2-normalized) and optionally
+    "metadata". Search results are dicts with "image_path", "distance" (cosine
+    similarity, higher is closer) and "metadata" where the store keeps it.
+    Every store keeps the FILTER_FIELDS of the metadata as indexed scalar
+    fields; records without them match no metadata filter.
+
+    Filters are a dict of pre-filter conditions applied inside the ANN search,
+    so a selective filter still returns top_k results:
+        path_prefix (str): only images whose stored path starts with this prefix
+        format (str): only images of this PIL format, e.g. "JPEG"
+        min_width, max_width, min_height, max_height (int): pixel size bounds
+    """
+
+    def upsert(self, records, replace=True, flush=True):
+        """
+        Bulk insert records, replacing any already stored for the same image paths.
+
+        Args:
+            records (list): Record dicts (see class docstring)
+            replace (bool): Remove existing vectors for these paths first. Pass False
+                            when the paths are known to be new, to skip that work.
+            flush (bool): Persist after inserting
+
+        Returns:
+            list: Image paths of records the store rejected
+        """
+        raise NotImplementedError
+
+    def insert_embeddings(self, embeddings_dict, flush=True):
+        """
+        Insert embeddings given as a dict of image path to vector.
+
+        Args:
+            embeddings_dict (dict): Dictionary mapping image paths to their embeddings
+            flush (bool): Persist after inserting
+        """
+        self.upsert(
+            [{"image_path": str(path), "vector": vector} for path, vector in embeddings_dict.items()],
+            replace=False,
+            flush=flush,
+        )
+
+    def search_batch(self, query_embeddings, top_k=5, filters=None, search_params=None):
+        """
+        Search for the nearest stored images of many queries.
+
+        Args:
+            query_embeddings (list): Query vectors
+            top_k (int): Results per query
+            filters (dict): Pre-filter conditions (see class docstring)
+            search_params (dict): Index-specific search parameters, e.g. {"ef": 200}
+
+        Returns:
+            list: One list of result dicts per query, nearest first
+        """
+        raise NotImplementedError
+
+    def search(self, query_embedding, top_k=5, filters=None, search_params=None):
+        """Search for the nearest stored images of one query vector"""
+        return self.search_batch(
+            [query_embedding], top_k=top_k, filters=filters, search_params=search_params
+        )[0]
+
+    def stored_path(self, image_path):
+        """The path as this store keeps it and reports it in search results"""
+        return str(image_path)
+
+    def delete_by_paths(self, image_paths):
+        """Delete all vectors stored for the given image paths"""
+        raise NotImplementedError
+
+    def count(self):
+        """Number of stored vectors"""
+        raise NotImplementedError
+
+    def iter_vectors(self, batch_size=10000):
+        """
+        Stream every stored vector, e.g. for offline jobs over the whole collection.
+
+        Args:
+            batch_size (int): Vectors per batch
+
+        Yields:
+            tuple: (stored paths, (n, dim) float32 vectors) per batch
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """Persist pending writes"""
+
+    def load_collection(self, wait=True, timeout=None):
+        """Make the store searchable (no-op for stores that always are)"""
+
+    def wait_until_loaded(self, timeout=None):
+        """Block until `load_collection` has finished (no-op for stores that always are)"""
+
+    def close(self):
+        """Release resources held by the store"""
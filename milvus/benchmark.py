@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+from pymilvus import utility
+from milvus_setup import INDEX_PROFILES, MilvusImageDB, local_index_params
+
+# Add repository root to sys.path for shared modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_benchmark import (
+    add_benchmark_arguments, load_vectors, normalize, run_sweep, split_queries, write_report
+)
+from common.local_store import LocalImageDB
+from common.quantization import VECTOR_DTYPES, bytes_per_vector
+from common.reduction import REDUCTION_METHODS, Reducer, fit_reducer
+from common.reranking import RerankingStore
+
+# Search parameter values swept for each index type
+SEARCH_SWEEPS = {
+    "HNSW": {"ef": [16, 32, 64, 128, 256, 512]},
+    "IVF_FLAT": {"nprobe": [1, 4, 8, 16, 32, 64, 128]},
+    "IVF_SQ8": {"nprobe": [1, 4, 8, 16, 32, 64, 128]},
+    "IVF_PQ": {"nprobe": [1, 4, 8, 16, 32, 64, 128]},
+    "DISKANN": {"search_list": [16, 32, 64, 128, 256]},
+    "FLAT": {},
+}
+
+def search_grid(index_type, override=None):
+    """List the search parameter combinations to sweep for an index type"""
+    grid = []
+    for key, values in SEARCH_SWEEPS[index_type].items():
+        values = (override or {}).get(key, values)
+        grid.extend({key: value} for value in values)
+    return grid or [{}]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark of Milvus index profiles")
+    add_benchmark_arguments(parser)
+    parser.add_argument("--from_collection", default=None,
+                        help="Benchmark on the embeddings stored in this Milvus collection (of dimension --dim)")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(INDEX_PROFILES), default=None,
+                        help="Index profiles to build and sweep (default: HNSW and IVF profiles; "
+                             "HNSW and flat for --store local)")
+    parser.add_argument("--store", choices=["milvus", "local"], default="milvus",
+                        help="Benchmark a Milvus server, or the embedded store with no server or network")
+    parser.add_argument("--store_dtype", choices=VECTOR_DTYPES, default="float32",
+                        help="Vector storage to benchmark (int8 only with --store local)")
+    parser.add_argument("--rerank_factor", type=int, default=0,
+                        help="Rerank this many candidates per result exactly against a float32 sidecar (0 = off)")
+    parser.add_argument("--reduction_dims", type=int, nargs="+", default=None,
+                        help="Instead of index profiles, measure exact-search recall (against full-dimension "
+                             "ground truth) and query cost after reducing to each of these dimensions")
+    parser.add_argument("--reduction_methods", nargs="+", choices=REDUCTION_METHODS, default=list(REDUCTION_METHODS),
+                        help="Reductions compared by --reduction_dims")
+    parser.add_argument("--reduction_sample", type=int, default=10000,
+                        help="Stored vectors the reductions are fitted on")
+    parser.add_argument("--sweep", type=json.loads, default=None,
+                        help='Override swept search parameter values, e.g. \'{"ef": [50, 100, 200]}\'')
+    parser.add_argument("--collection", default="ann_benchmark",
+                        help="Scratch collection created for the benchmark and dropped afterwards")
+    return parser.parse_args()
+
+def reduction_sweep(args, base, queries):
+    """Recall@k and latency of exact search in each reduced space; needs no database"""
+    sample = base[np.random.default_rng(args.seed).permutation(len(base))[:args.reduction_sample]]
+    state = {}
+
+    def build(vectors, params):
+        # Build time: fitting the reduction and projecting the stored vectors
+        if params["method"] == "none":
+            reducer = Reducer("none", np.zeros(vectors.shape[1]), np.eye(vectors.shape[1]))
+        else:
+            reducer = fit_reducer(sample, params["dim"], method=params["method"], seed=args.seed)
+        state["reducer"], state["base"] = reducer, reducer.transform(vectors)
+
+    def search(query, top_k, search_params):
+        scores = state["base"] @ state["reducer"].transform(query)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        return top[np.argsort(-scores[top])].tolist()
+
+    dim = base.shape[1]
+    return run_sweep(
+        build, search, base, queries,
+        builds=[(f"none_{dim}", {"method": "none", "dim": dim})] + [
+            (f"{method}_{reduced}", {"method": method, "dim": reduced})
+            for reduced in sorted(args.reduction_dims, reverse=True)
+            for method in args.reduction_methods
+        ],
+        searches=lambda params: [{}],
+        top_k=args.top_k
+    )
+
+def main():
+    args = parse_args()
+
+    if args.from_collection:
+        source = MilvusImageDB(collection_name=args.from_collection, dim=args.dim)
+        vectors = normalize(source.fetch_embeddings())
+        base, queries = split_queries(vectors, args.num_queries, seed=args.seed)
+        print(f"Loaded {len(vectors)} embeddings from '{args.from_collection}'")
+    else:
+        base, queries = load_vectors(args)
+
+    if args.reduction_dims:
+        rows = reduction_sweep(args, base, queries)
+        if args.report:
+            write_report(rows, args.report)
+        return
+
+    local = args.store == "local"
+    profiles = args.profiles or (
+        ["hnsw_fast", "hnsw", "hnsw_accurate", "flat"] if local
+        else ["flat", "ivf_flat"] if args.store_dtype == "binary"
+        else ["hnsw_fast", "hnsw", "hnsw_accurate", "ivf_flat", "ivf_sq8", "ivf_pq"]
+    )
+    print(f"Storing {args.store_dtype} vectors: {bytes_per_vector(args.store_dtype, base.shape[1])} bytes each")
+
+    # Insert once; image_path holds the row index so results map back to the ground truth
+    store_dir = tempfile.mkdtemp(prefix="ann_benchmark_")
+    if local:
+        db = LocalImageDB(os.path.join(store_dir, "store"), dim=base.shape[1], dtype=args.store_dtype)
+    else:
+        if utility.has_collection(args.collection):
+            raise SystemExit(f"Collection '{args.collection}' already exists; pass another --collection")
+        db = MilvusImageDB(collection_name=args.collection, dim=base.shape[1], index_profile="flat",
+                           dtype=args.store_dtype)
+    if args.rerank_factor:
+        db = RerankingStore(db, LocalImageDB(os.path.join(store_dir, "rerank"), dim=base.shape[1]),
+                            rerank_factor=args.rerank_factor)
+    for start in range(0, len(base), 10_000):
+        rows = range(start, min(start + 10_000, len(base)))
+        db.insert_embeddings({str(row): base[row] for row in rows}, flush=False)
+    db.flush()
+
+    def build(vectors, profile):
+        # Index build time: building the ANN index over the stored data and loading it
+        if local:
+            index, hnsw_params, search_params = local_index_params(profile)
+            db.rebuild_index(index, hnsw_params)
+            db.search_params.update(search_params or {})
+        else:
+            db.rebuild_index(profile)
+        db.load_collection()
+
+    def search(query, top_k, search_params):
+        return [int(hit["image_path"]) for hit in db.search(query, top_k=top_k, search_params=search_params)]
+
+    try:
+        rows = run_sweep(
+            build, search, base, queries,
+            builds=[(profile, profile) for profile in profiles],
+            searches=lambda profile: search_grid(INDEX_PROFILES[profile]["index_type"], args.sweep),
+            top_k=args.top_k
+        )
+    finally:
+        if local:
+            db.close()
+        else:
+            db.collection.drop()
+        shutil.rmtree(store_dir)
+
+    if args.report:
+        write_report(rows, args.report)
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,28 @@
 import os
+import sys
+import json
 import argparse
-from dinov2_embedder import DINOv2Embedder
-from milvus_setup import MilvusImageDB
-
-def get_image_paths(directory, extensions=('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-    """Get all image paths from a directory"""
-    image_paths = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.lower().endswith(extensions):
-                image_paths.append(os.path.join(root, file))
-    return image_paths
-
-def embed_and_insert_images(directory, embedder, db):
-    """Embed all images in the directory and insert into Milvus"""
-    image_paths = get_image_paths(directory)
-    print(f"Found {len(image_paths)} images")
-
-    # Create embeddings for all images
-    embeddings_dict = embedder.embed_batch(image_paths)
-    print(f"Created embeddings for {len(embeddings_dict)} images")
-
-    # Insert the embeddings into Milvus
-    db.insert_embeddings(embeddings_dict)
+from milvus_setup import INDEX_PROFILES, MilvusImageDB, local_index_params
+
+# Add repository root to sys.path for shared modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.batch_search import load_query_paths, reserve_stdout, write_jsonl
+from common.dedup import add_dedup_arguments, run_dedup
+from common.embedder import DINOv2Embedder, embedding_dimension
+from common.inference import add_backend_arguments, print_parity
+from common.local_store import LocalImageDB
+from common.manifest import IndexManifest
+from common.metrics import add_metrics_arguments, start_metrics
+from common.patches import add_patch_arguments, patch_options, patch_vector_count, with_patch_reranking
+from common.pipeline import index_images, search_images
+from common.quantization import add_compression_arguments
+from common.reduction import ReducedEmbedder, Reducer, add_reduction_arguments, load_or_fit_reducer
+from common.regions import add_region_arguments, regions_from_args
+from common.reranking import with_reranking
+from common.scanner import add_scan_arguments, iter_image_paths
+from common.search_server import serve
+from common.sharding import ShardedEmbedder
+from common.vector_store import add_filter_arguments, filters_from_args
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Image Similarity Search with Milvus and DINOv2")
@@ -32,45 +32,266 @@ def parse_args():
     index_parser = subparsers.add_parser("index", help="Index images into Milvus")
     index_parser.add_argument("--directory", "-d", required=True, help="Directory containing images to index")
     index_parser.add_argument("--model", "-m", default="facebook/dinov2-base", help="DINOv2 model variant")
+    index_parser.add_argument("--batch_size", "-b", type=int, default=16, help="Number of images per forward pass")
+    index_parser.add_argument("--workers", type=int, default=4, help="Image decode worker threads (0 = decode inline)")
+    index_parser.add_argument("--prefetch", type=int, default=2, help="Number of batches decoded ahead of the model")
+    index_parser.add_argument("--insert_batch_size", type=int, default=1000, help="Number of embeddings per Milvus insert")
+    index_parser.add_argument("--shards", type=int, default=1,
+                              help="Worker processes embedding disjoint shards of the file list, each with its own model")
+    index_parser.add_argument("--threads_per_shard", type=int, default=None,
+                              help="PyTorch threads per shard (default: CPUs split evenly across shards)")
+    index_parser.add_argument("--cache_dir", default=None, help="Directory for the persistent embedding cache")
+    index_parser.add_argument("--manifest", default=None,
+                              help="SQLite manifest for incremental indexing; only new or changed files are embedded")
+    index_parser.add_argument("--index", choices=sorted(INDEX_PROFILES), default=None,
+                              help="ANN index profile used when the collection is created "
+                                   "(default: hnsw; flat for --store local)")
+    index_parser.add_argument("--rebuild_index", action="store_true",
+                              help="Drop the existing ANN index and rebuild it with --index after inserting")
+    add_scan_arguments(index_parser)
+    add_region_arguments(index_parser)
+    add_reduction_arguments(index_parser)
 
     # Search command
     search_parser = subparsers.add_parser("search", help="Search for similar images")
-    search_parser.add_argument("--query", "-q", required=True, help="Path to query image")
+    search_parser.add_argument("--query", "-q", required=True,
+                               help="Query image, directory of query images, or text file listing one image per line")
     search_parser.add_argument("--top_k", "-k", type=int, default=3, help="Number of similar images to return")
+    search_parser.add_argument("--output", "-o", default=None,
+                               help="Write one JSON line per query to this file ('-' for stdout)")
+    search_parser.add_argument("--batch_size", "-b", type=int, default=16, help="Number of query images per forward pass")
+    search_parser.add_argument("--search_batch_size", type=int, default=256,
+                               help="Number of query vectors per Milvus search request")
     search_parser.add_argument("--model", "-m", default="facebook/dinov2-base", help="DINOv2 model variant")
+    search_parser.add_argument("--cache_dir", default=None, help="Directory for the persistent embedding cache")
+    search_parser.add_argument("--load_fields", nargs="+", default=None,
+                               help="Only load these fields into memory (id, embedding and image_path are always loaded)")
+    search_parser.add_argument("--search_params", type=json.loads, default=None,
+                               help='Index search parameters as JSON, e.g. \'{"ef": 200}\' or \'{"nprobe": 64}\'')
+    add_filter_arguments(search_parser)
+    add_reduction_arguments(search_parser, fit=False)
+
+    # Serve command
+    serve_parser = subparsers.add_parser("serve", help="Run a resident search server with a warm model")
+    serve_parser.add_argument("--model", "-m", default="facebook/dinov2-base", help="DINOv2 model variant")
+    serve_parser.add_argument("--cache_dir", default=None, help="Directory for the persistent embedding cache")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Host to bind")
+    serve_parser.add_argument("--port", type=int, default=8000, help="Port to bind")
+    serve_parser.add_argument("--socket", default=None, help="Serve on this Unix socket instead of TCP")
+    serve_parser.add_argument("--max_batch_size", type=int, default=32, help="Maximum queries per forward pass")
+    serve_parser.add_argument("--max_wait_ms", type=float, default=5.0,
+                              help="Maximum time a query waits to be batched with others")
+    serve_parser.add_argument("--top_k", "-k", type=int, default=5, help="Default number of results per query")
+    serve_parser.add_argument("--path_root", default=None,
+                              help="Allow JSON path queries for images under this directory (default: image bytes only)")
+    serve_parser.add_argument("--load_fields", nargs="+", default=None,
+                              help="Only load these fields into memory (id, embedding and image_path are always loaded)")
+    serve_parser.add_argument("--search_params", type=json.loads, default=None,
+                              help='Index search parameters as JSON, e.g. \'{"ef": 200}\' or \'{"nprobe": 64}\'')
+    add_reduction_arguments(serve_parser, fit=False)
+
+    # Dedup command
+    dedup_parser = subparsers.add_parser(
+        "dedup", help="Find near-duplicate groups and cluster assignments over the whole collection"
+    )
+    dedup_parser.add_argument("--model", "-m", default="facebook/dinov2-base",
+                              help="DINOv2 model variant the collection was indexed with")
+    add_dedup_arguments(dedup_parser)
+    add_reduction_arguments(dedup_parser, fit=False)
+
+    for sub in (index_parser, search_parser, serve_parser):
+        add_backend_arguments(sub)
+        add_patch_arguments(sub)
+        # The search server answers GET /metrics itself
+        add_metrics_arguments(sub, port=sub is not serve_parser)
+
+    # Vector store options shared by all commands
+    for sub in (index_parser, search_parser, serve_parser, dedup_parser):
+        sub.add_argument("--store", choices=["milvus", "local"], default="milvus",
+                         help="Vector store: a Milvus server, or an embedded on-disk store needing no server")
+        sub.add_argument("--store_dir", default="local_store", help="Directory of the --store local data")
+        add_compression_arguments(sub)
 
     return parser.parse_args()
 
+def create_embedder(args, image_paths=None):
+    """
+    Create the embedder from CLI options, optionally reporting backend parity.
+
+    With --reduction the embedder is wrapped so it returns reduced vectors; when
+    indexing, a missing reduction is first fitted on a sample of `image_paths`.
+    """
+    embedder_kwargs = dict(
+        model_name=args.model, cache_dir=args.cache_dir,
+        backend=args.backend, onnx_path=args.onnx_path, **patch_options(args)
+    )
+    sharded = args.command == "index" and args.shards > 1
+
+    embedder = None
+    if args.check_parity or not sharded:
+        embedder = DINOv2Embedder(**embedder_kwargs)
+    if args.check_parity:
+        if args.command == "index":
+            print_parity(embedder.check_parity(image_paths[:16]))
+        elif args.command == "search":
+            print_parity(embedder.check_parity(load_query_paths(args.query)[:16]))
+        else:
+            print("--check_parity needs sample images; run it with index or search")
+
+    if sharded:
+        # Each shard process loads its own model copy; the parent only writes to Milvus
+        del embedder
+        embedder = ShardedEmbedder(
+            DINOv2Embedder, embedder_kwargs,
+            num_shards=args.shards, threads_per_shard=args.threads_per_shard,
+            embedding_dim=embedding_dimension(args.model)
+        )
+
+    if args.reduction:
+        if args.command == "index":
+            reducer = load_or_fit_reducer(
+                args.reduction, embedder, image_paths, args.reduced_dim, method=args.reduction_method,
+                sample_size=args.reduction_sample, batch_size=args.batch_size
+            )
+        else:
+            reducer = Reducer.load(args.reduction)
+        embedder = ReducedEmbedder(embedder, reducer)
+    return embedder
+
+def store_dimension(args):
+    """Dimension of the stored vectors: the model's, or the reduced one with --reduction"""
+    if getattr(args, "reduction", None):
+        if os.path.exists(args.reduction):
+            return Reducer.load(args.reduction).output_dim
+        if getattr(args, "reduced_dim", None):
+            return args.reduced_dim
+        raise SystemExit(f"Reduction {args.reduction} does not exist; fit it with index --reduced_dim")
+    return embedding_dimension(getattr(args, "model", "facebook/dinov2-base"))
+
+def create_db(args):
+    """Open the vector store selected on the command line, sized for the selected model"""
+    dim = store_dimension(args)
+    profile = getattr(args, "index", None)
+
+    if getattr(args, "store", "milvus") == "local":
+        index, hnsw_params, search_params = local_index_params(profile)
+        db = LocalImageDB(
+            args.store_dir, dim=dim, dtype=args.store_dtype,
+            index=index, hnsw_params=hnsw_params, search_params=search_params
+        )
+    else:
+        db = MilvusImageDB(
+            load_fields=getattr(args, "load_fields", None),
+            dim=dim,
+            # Binary vectors have no HNSW index in Milvus
+            index_profile=profile or ("ivf_flat" if args.store_dtype == "binary" else "hnsw"),
+            dtype=args.store_dtype
+        )
+    # Compressed vectors: rerank the candidates against a full-precision sidecar
+    db = with_reranking(db, args.rerank_dir, dim, args.rerank_factor)
+    if getattr(args, "patch_dir", None) is None:
+        return db
+    # [CLS] candidates reranked by patch-level MaxSim against the patch sidecar
+    return with_patch_reranking(
+        db, args.patch_dir, dim, patch_vector_count(args.patch_pooling, args.patch_vectors),
+        args.patch_factor, args.patch_dtype
+    )
+
 def main():
     args = parse_args()
+    # With "--output -" the results own stdout; everything else goes to stderr
+    results_output = reserve_stdout(getattr(args, "output", None))
 
-    # Initialize Milvus
-    db = MilvusImageDB()
+    # Initialize the vector store
+    db = create_db(args)
+    # Per-stage timings and counters: periodic JSON lines and/or a /metrics endpoint
+    metrics = start_metrics(args)
 
     if args.command == "index":
         print(f"Indexing images from {args.directory}")
-        embedder = DINOv2Embedder(model_name=args.model)
-        embed_and_insert_images(args.directory, embedder, db)
+        # Streamed: embedding starts while the rest of the tree is still being listed
+        image_paths = iter_image_paths(
+            args.directory, file_list=args.file_list, workers=args.scan_workers,
+            check_signatures=args.check_signatures
+        )
+        if args.check_parity or (args.reduction and not os.path.exists(args.reduction)):
+            # Parity samples the scan and a reduction is fitted on a sample of all of it
+            image_paths = list(image_paths)
+        embedder = create_embedder(args, image_paths)
+        # Vectors of another reduction are not comparable: key the manifest by it too
+        model_key = f"{args.model}+{embedder.reducer.fingerprint}" if args.reduction else args.model
+        manifest = IndexManifest(args.manifest, model_key) if args.manifest else None
+        try:
+            index_images(
+                image_paths, embedder, db, manifest=manifest, root=args.directory,
+                batch_size=args.batch_size, insert_batch_size=args.insert_batch_size,
+                # Width, height and format are stored for filtered search
+                with_metadata=True, regions=regions_from_args(args, root=args.directory),
+                num_workers=args.workers, prefetch=args.prefetch
+            )
+        finally:
+            if manifest is not None:
+                manifest.close()
+        if args.rebuild_index and args.store == "local":
+            index, hnsw_params, _ = local_index_params(args.index)
+            db.rebuild_index(index or db.index, hnsw_params)
+        elif args.rebuild_index:
+            db.rebuild_index(args.index)
         print("Indexing complete")
 
     elif args.command == "search":
-        print(f"Searching for images similar to {args.query}")
-        embedder = DINOv2Embedder(model_name=args.model)
+        query_paths = load_query_paths(args.query)
+        print(f"Searching for images similar to {len(query_paths)} queries from {args.query}")
+        # Load the collection in the background while the model loads
+        db.load_collection(wait=False)
+        embedder = create_embedder(args)
+
+        # Embed queries in batches and send them as multi-vector searches
+        matches = search_images(
+            query_paths, embedder, db, top_k=args.top_k, batch_size=args.batch_size,
+            search_batch_size=args.search_batch_size, filters=filters_from_args(args),
+            search_params=args.search_params
+        )
 
-        # Embed query image
-        query_embedding = embedder.embed_image(args.query)
+        if args.output:
+            written = write_jsonl(
+                ({"query": path, "results": results} for path, results in matches), results_output
+            )
+            print(f"Wrote results for {written}/{len(query_paths)} queries to {args.output}", file=sys.stderr)
+        else:
+            searched = 0
+            for path, results in matches:
+                searched += 1
+                print(f"\nFound {len(results)} images similar to {path}:")
+                for i, result in enumerate(results):
+                    print(f"{i+1}. {result['image_path']} (distance: {result['distance']:.4f})")
+                    if "parent_image" in result:
+                        print(f"   region {result['region']} of {result['parent_image']}")
+            if searched < len(query_paths):
+                print(f"Failed to embed {len(query_paths) - searched} query images")
 
-        if query_embedding is None:
-            print(f"Failed to embed query image {args.query}")
-            return
+    elif args.command == "serve":
+        # Load the collection in the background while the model loads
+        db.load_collection(wait=False)
+        embedder = create_embedder(args)
 
-        # Search for similar images
-        results = db.search(query_embedding, top_k=args.top_k)
+        # Be warm before accepting requests; every request reuses the model and connection
+        db.wait_until_loaded()
+        serve(
+            embedder.embed_images,
+            lambda vector, top_k, filters: db.search(
+                vector, top_k=top_k, filters=filters, search_params=args.search_params
+            ),
+            host=args.host, port=args.port, socket_path=args.socket,
+            max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+            default_top_k=args.top_k, path_root=args.path_root
+        )
 
-        print(f"\nFound {len(results)} similar images:")
-        for i, result in enumerate(results):
-            print(f"{i+1}. {result['image_path']} (distance: {result['distance']:.4f})")
+    elif args.command == "dedup":
+        # Exported once in bulk and joined offline, instead of one search per image
+        run_dedup(db, args)
 
+    metrics.close()
     db.close()
 
 if __name__ == "__main__":
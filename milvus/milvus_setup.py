@@ -1,8 +1,163 @@
 # milvus_setup.py
-from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
+import os
+import sys
+import json
 
-class MilvusImageDB:
-    def __init__(self, collection_name="image_collection", host="localhost", port="19530"):
+import numpy as np
+
+from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, MilvusException, utility
+from pymilvus.client.types import LoadState
+
+# Add repository root to sys.path for shared modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.metrics import METRICS
+from common.quantization import code_layout, decode, encode
+from common.vector_store import FILTER_FIELDS, RANGE_FILTERS, VectorStore, check_filters
+
+# Named ANN index profiles: build parameters and default search parameters.
+# HNSW: M = edges per node (memory/accuracy), efConstruction = build effort, ef = search effort.
+# IVF_*: nlist = number of clusters, nprobe = clusters scanned per query.
+# IVF_PQ: m = sub-quantizers (None = dim // 8, i.e. dim / 2 bytes per vector at nbits=8).
+# IVF_SQ8 stores 1 byte per dimension; DISKANN keeps the graph on disk.
+INDEX_PROFILES = {
+    "hnsw_fast": {
+        "index_type": "HNSW",
+        "params": {"M": 8, "efConstruction": 64},
+        "search_params": {"ef": 64},
+    },
+    "hnsw": {
+        "index_type": "HNSW",
+        "params": {"M": 16, "efConstruction": 200},
+        "search_params": {"ef": 100},
+    },
+    "hnsw_accurate": {
+        "index_type": "HNSW",
+        "params": {"M": 32, "efConstruction": 500},
+        "search_params": {"ef": 256},
+    },
+    "ivf_flat": {
+        "index_type": "IVF_FLAT",
+        "params": {"nlist": 1024},
+        "search_params": {"nprobe": 16},
+    },
+    "ivf_sq8": {
+        "index_type": "IVF_SQ8",
+        "params": {"nlist": 1024},
+        "search_params": {"nprobe": 16},
+    },
+    "ivf_pq": {
+        "index_type": "IVF_PQ",
+        "params": {"nlist": 1024, "m": None, "nbits": 8},
+        "search_params": {"nprobe": 32},
+    },
+    "diskann": {
+        "index_type": "DISKANN",
+        "params": {},
+        "search_params": {"search_list": 100},
+    },
+    "flat": {
+        "index_type": "FLAT",
+        "params": {},
+        "search_params": {},
+    },
+}
+
+# Search parameters for collections whose index was not built from the selected profile
+DEFAULT_SEARCH_PARAMS = {
+    profile["index_type"]: profile["search_params"]
+    for name, profile in INDEX_PROFILES.items()
+    if name not in ("hnsw_fast", "hnsw_accurate")
+}
+
+# Vector field type per storage dtype. int8 has no vector field before Milvus 2.6;
+# the ivf_sq8 profile quantizes float vectors to int8 inside the index instead.
+VECTOR_FIELD_TYPES = {
+    "float32": DataType.FLOAT_VECTOR,
+    "float16": DataType.FLOAT16_VECTOR,
+    "bfloat16": DataType.BFLOAT16_VECTOR,
+    "binary": DataType.BINARY_VECTOR,
+}
+
+# Binary vectors are searched by Hamming distance with the BIN_* index types
+BINARY_INDEX_TYPES = {"FLAT": "BIN_FLAT", "IVF_FLAT": "BIN_IVF_FLAT"}
+
+# Scalar indexes of the filterable fields: a trie serves path prefix matches,
+# sorted arrays serve numeric ranges and an inverted index serves format equality
+SCALAR_INDEX_TYPES = {"image_path": "Trie", "width": "STL_SORT", "height": "STL_SORT", "format": "INVERTED"}
+
+# Stored when a record carries no metadata; matches no metadata filter
+MISSING_METADATA = {"width": -1, "height": -1, "format": ""}
+
+def metric_type(dtype):
+    """Milvus metric for a storage dtype"""
+    return "HAMMING" if dtype == "binary" else "COSINE"
+
+def index_params(profile, dim, dtype="float32"):
+    """
+    Build Milvus index parameters for a named profile.
+
+    Args:
+        profile (str): Key of INDEX_PROFILES
+        dim (int): Embedding dimension
+        dtype (str): Storage dtype of the vector field (see VECTOR_FIELD_TYPES)
+
+    Returns:
+        dict: Parameters for `Collection.create_index`
+    """
+    if profile not in INDEX_PROFILES:
+        raise ValueError(f"Unknown index profile '{profile}', expected one of {sorted(INDEX_PROFILES)}")
+
+    index_type = INDEX_PROFILES[profile]["index_type"]
+    if dtype == "binary":
+        if index_type not in BINARY_INDEX_TYPES:
+            raise ValueError(f"Binary vectors support the flat and ivf_flat profiles, not '{profile}'")
+        index_type = BINARY_INDEX_TYPES[index_type]
+
+    params = dict(INDEX_PROFILES[profile]["params"])
+    if "m" in params and params["m"] is None:
+        params["m"] = dim // 8
+    if "m" in params and dim % params["m"]:
+        raise ValueError(f"IVF_PQ m={params['m']} must divide the embedding dimension {dim}")
+
+    return {
+        "metric_type": metric_type(dtype),
+        "index_type": index_type,
+        "params": params,
+    }
+
+def local_index_params(profile):
+    """
+    Map an index profile onto the embedded store (common.local_store.LocalImageDB).
+
+    Args:
+        profile (str): Key of INDEX_PROFILES with an HNSW or FLAT index, or None
+
+    Returns:
+        tuple: (index, hnsw_params, search_params) for LocalImageDB; all None for no profile
+    """
+    if profile is None:
+        return None, None, None
+    settings = INDEX_PROFILES[profile]
+    if settings["index_type"] == "FLAT":
+        return "flat", None, None
+    if settings["index_type"] == "HNSW":
+        return "hnsw", dict(settings["params"]), dict(settings["search_params"])
+    raise ValueError(f"The local store supports HNSW and FLAT profiles, not '{profile}'")
+
+def like_prefix(prefix):
+    """LIKE pattern matching strings that start with `prefix` literally
+
+    Wildcards in the prefix are escaped, so "/data/img_2024" does not also
+    match "/data/imgX2024".
+    """
+    for char in ("\\", "%", "_"):
+        prefix = prefix.replace(char, "\\" + char)
+    return prefix + "%"
+
+
+class MilvusImageDB(VectorStore):
+    def __init__(self, collection_name="image_collection", host="localhost", port="19530", load_fields=None,
+                 dim=768, index_profile="hnsw", dtype="float32"):
         """
         Initialize connection to Milvus and create collection if it doesn't exist.
 
@@ -10,8 +165,28 @@ class MilvusImageDB:
             collection_name (str): Name of the Milvus collection
             host (str): Milvus server host
             port (str): Milvus server port
+            load_fields (list): Fields to load into memory for searching (default: all).
+                                The primary key, embedding and image_path fields are
+                                always loaded; filters on other unloaded fields are rejected.
+            dim (int): Embedding dimension of the model (768 for DINOv2-base)
+            index_profile (str): ANN index profile (see INDEX_PROFILES) for new collections
+            dtype (str): Vector storage of new collections: "float32", "float16", "bfloat16"
+                         (half the memory) or "binary" (one sign bit per dimension,
+                         searched by Hamming distance with the flat or ivf_flat profile)
         """
+        if dtype not in VECTOR_FIELD_TYPES:
+            raise ValueError(
+                f"Milvus stores {sorted(VECTOR_FIELD_TYPES)} vectors, not '{dtype}'; "
+                f"use the ivf_sq8 index profile for int8 quantization"
+            )
+
         self.collection_name = collection_name
+        self.dtype = dtype
+        # Results always carry image_path, which path prefix filters also need
+        self.load_fields = sorted({"id", "embedding", "image_path", *load_fields}) if load_fields else None
+        self.dim = dim
+        self.index_profile = index_profile
+        self._loaded = False
 
         # Connect to Milvus
         connections.connect(host=host, port=port)
@@ -21,6 +196,15 @@ class MilvusImageDB:
             self._create_collection()
 
         self.collection = Collection(self.collection_name)
+        self._check_dimension()
+        self.search_params = self._default_search_params()
+
+        # Collections created before metadata filtering only have image_path
+        stored_fields = {field.name for field in self.collection.schema.fields}
+        self.metadata_fields = [name for name in FILTER_FIELDS if name in stored_fields]
+        self._output_fields = ["image_path"] + [
+            name for name in self.metadata_fields if load_fields is None or name in load_fields
+        ]
 
     def _create_collection(self):
         """Create a new collection with the appropriate schema"""
@@ -28,7 +212,10 @@ class MilvusImageDB:
         fields = [
             FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
             FieldSchema(name="image_path", dtype=DataType.VARCHAR, max_length=500),
-            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=768)  # DINOv2-base dim=768
+            FieldSchema(name="embedding", dtype=VECTOR_FIELD_TYPES[self.dtype], dim=self.dim),
+            FieldSchema(name="width", dtype=DataType.INT32),
+            FieldSchema(name="height", dtype=DataType.INT32),
+            FieldSchema(name="format", dtype=DataType.VARCHAR, max_length=16)
         ]
 
         # Create collection schema
@@ -37,96 +224,366 @@ class MilvusImageDB:
         # Create collection
         collection = Collection(name=self.collection_name, schema=schema)
 
-        # Create HNSW index on the embedding field
-        index_params = {
-            "metric_type": "COSINE",  # or "IP" for inner product
-            "index_type": "HNSW",
-            "params": {
-                "M": 16,  # Number of edges per node (higher = more accuracy but more memory)
-                "efConstruction": 500  # Higher values build more accurate indices but take longer
-            }
-        }
-
-        collection.create_index("embedding", index_params)
-        print(f"Created collection '{self.collection_name}' with HNSW index")
+        collection.create_index("embedding", index_params(self.index_profile, self.dim, self.dtype))
+        # Filters are evaluated against these indexes inside the vector search
+        for field_name, index_type in SCALAR_INDEX_TYPES.items():
+            collection.create_index(field_name, {"index_type": index_type}, index_name=f"{field_name}_index")
+        print(f"Created collection '{self.collection_name}' with {self.dtype} vectors and '{self.index_profile}' index")
         return collection
 
-    def insert_embeddings(self, embeddings_dict):
+    def _check_dimension(self):
+        """Fail early when the collection was created for a model of another size"""
+        for field in self.collection.schema.fields:
+            if field.name != "embedding":
+                continue
+            if field.params.get("dim") != self.dim:
+                raise ValueError(
+                    f"Collection '{self.collection_name}' stores {field.params.get('dim')}-d embeddings, "
+                    f"but the model produces {self.dim}-d embeddings"
+                )
+            # An existing collection keeps the storage dtype it was created with
+            stored = {field_type: dtype for dtype, field_type in VECTOR_FIELD_TYPES.items()}[field.dtype]
+            if stored != self.dtype:
+                print(f"Collection '{self.collection_name}' stores {stored} vectors, not {self.dtype}")
+                self.dtype = stored
+
+    def _index_type(self):
+        """Index type currently built on the embedding field, or None"""
+        for index in self.collection.indexes:
+            if index.field_name == "embedding":
+                return index.params.get("index_type")
+        return None
+
+    def _default_search_params(self):
+        """Search parameters of the selected profile, or defaults for the index actually built"""
+        profile = INDEX_PROFILES[self.index_profile]
+        index_type = self._index_type()
+        expected = profile["index_type"]
+        if self.dtype == "binary":
+            expected = BINARY_INDEX_TYPES.get(expected, expected)
+        if index_type is None or index_type == expected:
+            return dict(profile["search_params"])
+
+        print(f"Collection '{self.collection_name}' index type is {index_type}, not the '{self.index_profile}' profile; "
+              f"use rebuild_index() to switch")
+        return dict(DEFAULT_SEARCH_PARAMS.get(index_type.replace("BIN_", ""), {}))
+
+    def rebuild_index(self, index_profile=None):
+        """
+        Drop the ANN index and build it again from a profile.
+
+        Args:
+            index_profile (str): Profile to build (default: the one given at construction)
+        """
+        self.index_profile = index_profile or self.index_profile
+        self.collection.release()
+        self._loaded = False
+        # Only the vector index; the scalar indexes of the filter fields stay
+        for index in self.collection.indexes:
+            if index.field_name == "embedding":
+                index.drop()
+        self.collection.create_index("embedding", index_params(self.index_profile, self.dim, self.dtype))
+        self.search_params = dict(INDEX_PROFILES[self.index_profile]["search_params"])
+        print(f"Rebuilt index of '{self.collection_name}' with '{self.index_profile}' profile")
+
+    def upsert(self, records, replace=True, flush=True):
         """
-        Insert embeddings into Milvus.
+        Insert records into Milvus, replacing entities already stored for the same paths.
 
         Args:
-            embeddings_dict (dict): Dictionary mapping image paths to their embeddings
+            records (list): Dicts with "image_path", "vector" and optionally "metadata",
+                            whose width, height and format are stored for filtering
+            replace (bool): Delete existing entities of these paths first (auto-generated
+                            primary keys cannot be upserted directly)
+            flush (bool): Flush the collection after inserting. Pass False when inserting
+                          many chunks in a row and call `flush()` once at the end.
+
+        Returns:
+            list: Always empty; Milvus rejects whole inserts rather than single records
         """
-        if not embeddings_dict:
+        if not records:
             print("No embeddings to insert")
-            return
+            return []
 
         # Prepare data for insertion
-        image_paths = list(embeddings_dict.keys())
-        embedding_vectors = list(embeddings_dict.values())
+        image_paths = [str(record["image_path"]) for record in records]
+        embedding_vectors = self._field_vectors([record["vector"] for record in records])
+        if replace:
+            self.delete_by_paths(image_paths, verbose=False)
 
         # Insert the data
         entities = [
             image_paths,
             embedding_vectors
         ]
+        for name in self.metadata_fields:
+            entities.append([
+                (record.get("metadata") or {}).get(name) or MISSING_METADATA[name] for record in records
+            ])
 
         self.collection.insert(entities)
-        self.collection.flush()
+        if flush:
+            self.flush()
         print(f"Inserted {len(image_paths)} embeddings into collection")
+        return []
+
+    def _field_vectors(self, vectors):
+        """Convert float vectors to the values the embedding field takes"""
+        if self.dtype == "float32":
+            return list(vectors)
+        codes = encode(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1), self.dtype)
+        if self.dtype == "binary":
+            return [row.tobytes() for row in codes]
+        if self.dtype == "bfloat16":
+            # pymilvus takes bfloat16 vectors as ml_dtypes.bfloat16 arrays
+            try:
+                import ml_dtypes
+            except ImportError as e:
+                raise ImportError("bfloat16 vectors require `pip install ml_dtypes`") from e
+            codes = codes.view(ml_dtypes.bfloat16)
+        return list(codes)
+
+    def delete_by_paths(self, image_paths, chunk_size=1000, verbose=True):
+        """
+        Delete all vectors stored for the given image paths.
+
+        Args:
+            image_paths (list): Image paths whose entities should be removed
+            chunk_size (int): Number of paths per delete expression
+            verbose (bool): Report how many paths were deleted
+        """
+        image_paths = [str(path) for path in image_paths]
+        for i in range(0, len(image_paths), chunk_size):
+            # JSON string literals are valid Milvus expression string literals
+            expr = f"image_path in {json.dumps(image_paths[i:i+chunk_size])}"
+            self.collection.delete(expr)
+
+        if image_paths and verbose:
+            print(f"Deleted embeddings for {len(image_paths)} images")
+
+    def count(self):
+        """Number of stored entities (excluding deleted ones)"""
+        self.load_collection()
+        return self.collection.query(expr="", output_fields=["count(*)"])[0]["count(*)"]
 
-    def load_collection(self):
-        """Load collection into memory for searching"""
+    def iter_vectors(self, batch_size=1000):
+        """
+        Stream every stored embedding with its image path.
+
+        Args:
+            batch_size (int): Entities fetched per query request
+
+        Yields:
+            tuple: (image paths, (n, dim) float32 embeddings) per request
+        """
+        self.load_collection()
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size, output_fields=["image_path", "embedding"]
+        )
         try:
-            self.collection.load()
-            print(f"Collection '{self.collection_name}' loaded for searching")
-        except Exception as e:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                yield ([entity["image_path"] for entity in batch],
+                       self._field_to_float([entity["embedding"] for entity in batch]))
+        finally:
+            iterator.close()
+
+    def fetch_embeddings(self, batch_size=1000):
+        """
+        Read every stored embedding, e.g. to benchmark against exact search.
+
+        Args:
+            batch_size (int): Entities fetched per query request
+
+        Returns:
+            numpy.ndarray: (N, dim) float32 embeddings
+        """
+        batches = [vectors for _, vectors in self.iter_vectors(batch_size)]
+        if not batches:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.concatenate(batches)
+
+    def _field_to_float(self, embeddings):
+        """Embedding field values as returned by a query, decoded to float32 vectors"""
+        if self.dtype == "float32":
+            return np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+
+        # Compressed vectors come back as raw bytes (wrapped in a one-item list by some
+        # pymilvus versions) or as arrays of the field's element type
+        code_dtype, width = code_layout(self.dtype, self.dim)
+        raw = bytearray()
+        for value in embeddings:
+            if isinstance(value, list) and len(value) == 1 and isinstance(value[0], bytes):
+                value = value[0]
+            raw += value if isinstance(value, bytes) else np.asarray(value).tobytes()
+        return decode(np.frombuffer(bytes(raw), dtype=code_dtype).reshape(-1, width), self.dtype, self.dim)
+
+    def flush(self):
+        """Seal pending inserts so they are persisted and searchable"""
+        self.collection.flush()
+
+    def load_state(self):
+        """Current server-side load state of the collection (a pymilvus LoadState)"""
+        return utility.load_state(self.collection_name)
+
+    def load_collection(self, wait=True, timeout=None):
+        """
+        Load collection into memory for searching, unless it is already loaded.
+
+        Args:
+            wait (bool): Block until loading completes. With False the load runs
+                         in the background; call `wait_until_loaded()` before searching.
+            timeout (float): Seconds to wait for loading to complete
+        """
+        if self._loaded:
+            return
+
+        try:
+            state = self.load_state()
+            if state == LoadState.Loaded:
+                self._loaded = True
+                return
+
+            if state != LoadState.Loading:
+                load_kwargs = {}
+                if self.load_fields:
+                    # Partial load: only these fields are held in memory
+                    load_kwargs["load_fields"] = self.load_fields
+                self.collection.load(_async=True, **load_kwargs)
+                print(f"Loading collection '{self.collection_name}'")
+
+            if wait:
+                self.wait_until_loaded(timeout=timeout)
+        except MilvusException as e:
             print(f"Warning: {str(e)}")
 
-    def search(self, query_embedding, top_k=5):
+    def wait_until_loaded(self, timeout=None):
+        """
+        Block until the collection is fully loaded.
+
+        Args:
+            timeout (float): Maximum seconds to wait (default: no limit)
+        """
+        if self._loaded:
+            return
+        with METRICS.time("load"):
+            utility.wait_for_loading_complete(self.collection_name, timeout=timeout)
+        self._loaded = True
+        print(f"Collection '{self.collection_name}' loaded for searching")
+
+    def search_batch(self, query_embeddings, top_k=5, filters=None, search_params=None, nq_per_request=1000):
         """
-        Search for similar images.
+        Search for similar images of many queries with multi-vector requests.
 
         Args:
-            query_embedding (numpy.ndarray): Embedding vector of the query image
-            top_k (int): Number of similar images to return
+            query_embeddings (list): Embedding vectors of the query images
+            top_k (int): Number of similar images to return per query
+            filters (dict): Pre-filter conditions, e.g. {"path_prefix": "holidays/"}
+            search_params (dict): Index search parameters overriding the profile
+                                  defaults, e.g. {"ef": 200} or {"nprobe": 64}
+            nq_per_request (int): Maximum query vectors sent in one search request
 
         Returns:
-            list: List of dictionaries containing results
+            list: One list of result dictionaries per query, in query order
         """
-        # Always load the collection before searching
-        # This is safe to call multiple times - it's idempotent
+        # Only the first search pays for checking (and if needed waiting for) the load
         self.load_collection()
 
-        search_params = {
-            "metric_type": "COSINE",
-            "params": {"ef": 100}  # Higher ef means more accurate search but slower
-        }
-
-        results = self.collection.search(
-            data=[query_embedding],
-            anns_field="embedding",
-            param=search_params,
-            limit=top_k,
-            output_fields=["image_path"]
-        )
+        params = {**self.search_params, **(search_params or {})}
+        # HNSW ef and DiskANN search_list must cover top_k
+        for key in ("ef", "search_list"):
+            if key in params:
+                params[key] = max(params[key], top_k)
+        search_params = {"metric_type": metric_type(self.dtype), "params": params}
+        expr = self._filter_expr(filters)
 
-        # Format results
         formatted_results = []
-        for hits in results:
-            for hit in hits:
-                formatted_results.append({
-                    "image_path": hit.entity.get("image_path"),
-                    "distance": hit.distance
-                })
+        for i in range(0, len(query_embeddings), nq_per_request):
+            batch = query_embeddings[i:i+nq_per_request]
+            # The hits come back with their output fields: ANN and fetch are one round-trip
+            with METRICS.time("ann", len(batch)):
+                results = self._search_loaded(
+                    data=self._field_vectors(batch),
+                    anns_field="embedding",
+                    param=search_params,
+                    limit=top_k,
+                    expr=expr,
+                    output_fields=self._output_fields
+                )
+
+            # Format results, one list per query vector
+            for hits in results:
+                formatted_results.append([
+                    {
+                        "image_path": hit.entity.get("image_path"),
+                        "distance": self._similarity(hit.distance),
+                        "metadata": {name: hit.entity.get(name) for name in self._output_fields[1:]}
+                    }
+                    for hit in hits
+                ])
 
         return formatted_results
 
-    def close(self):
-        """Release collection and disconnect from Milvus"""
+    def _similarity(self, distance):
+        """Cosine similarity of a hit (for binary vectors: between the sign vectors)"""
+        if self.dtype == "binary":
+            return 1.0 - 2.0 * distance / self.dim
+        return distance
+
+    def _filter_expr(self, filters):
+        """Translate store filters into a Milvus boolean expression (None for no filter)"""
+        filters = check_filters(filters)
+        conditions = []
+        prefix = filters.get("path_prefix")
+        if prefix:
+            # JSON string literals are valid Milvus expression string literals
+            conditions.append(f"image_path like {json.dumps(like_prefix(prefix))}")
+
+        metadata_filters = set(filters) - {"path_prefix"}
+        if metadata_filters and not self.metadata_fields:
+            raise ValueError(
+                f"Collection '{self.collection_name}' was created without metadata fields; "
+                f"re-index it into a new collection to filter on {sorted(metadata_filters)}"
+            )
+        if self.load_fields:
+            fields = {"format" if key == "format" else RANGE_FILTERS[key][0] for key in metadata_filters}
+            unloaded = sorted(fields - set(self.load_fields))
+            if unloaded:
+                raise ValueError(f"Cannot filter on {unloaded}: not in the loaded fields {self.load_fields}")
+        if "format" in filters:
+            conditions.append(f"format == {json.dumps(filters['format'])}")
+        for key, (field, comparison) in RANGE_FILTERS.items():
+            if key in filters:
+                # Unknown sizes are stored as -1 and must not pass an upper bound
+                conditions.append(f"{field} {comparison} {filters[key]}")
+                if comparison == "<=":
+                    conditions.append(f"{field} >= 0")
+        return " and ".join(conditions) or None
+
+    def _search_loaded(self, **search_kwargs):
+        """Run a search, reloading once if the collection was released behind our back"""
         try:
-            self.collection.release()
-        except Exception as e:
-            print(f"Warning when releasing collection: {str(e)}")
+            return self.collection.search(**search_kwargs)
+        except MilvusException:
+            if self.load_state() == LoadState.Loaded:
+                raise
+            self._loaded = False
+            self.load_collection()
+            return self.collection.search(**search_kwargs)
+
+    def release(self):
+        """
+        Unload the collection from the query nodes.
+
+        This applies to every client of the server, so a resident search
+        server pays a full reload on its next query; `close` does not do it.
+        """
+        self.collection.release()
+        self._loaded = False
+
+    def close(self):
+        """Disconnect from Milvus, leaving the collection loaded for other clients"""
+        self._loaded = False
         connections.disconnect("default")
@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
 import json
+import os
 
 class ImagePolygonApp:
     def __init__(self, root):
@@ -375,10 +376,14 @@ class ImagePolygonApp:
         # Format points according to required schema
         points_data = [[round(x), round(y)] for x, y in self.points]
         
+        # Default to <image stem>.txt next to the image, where indexing with --regions looks
+        initial_dir, initial_name = os.path.split(self.image_path or "")
         file_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
             filetypes=[("Text files", "*.txt")],
-            title="Save Point Coordinates"
+            title="Save Point Coordinates",
+            initialdir=initial_dir or None,
+            initialfile=os.path.splitext(initial_name)[0] + ".txt" if initial_name else None
         )
         
         if file_path:
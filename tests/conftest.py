@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Repository root for the shared modules, and the Weaviate store module the scripts import by name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "weaviate", "image_embedding"))
+sys.path.append(os.path.join(ROOT, "milvus"))
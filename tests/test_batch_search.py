@@ -0,0 +1,42 @@
+import json
+import sys
+
+import numpy as np
+
+from common.batch_search import iter_batch_search, reserve_stdout, write_jsonl
+
+
+def test_stdout_output_carries_only_results(capsys, monkeypatch):
+    monkeypatch.setattr(sys, "stdout", sys.stdout)
+    results_output = reserve_stdout("-")
+    print("Using device: cpu")
+
+    def embedded_batches():
+        for batch in range(2):
+            print(f"Processing batch {batch + 1}/2")
+            yield [f"q{batch}a.jpg", f"q{batch}b.jpg"], np.eye(2, dtype=np.float32)
+
+    def search_batch(vectors):
+        print(f"Searching {len(vectors)} queries")
+        return [[{"image_path": "hit.jpg", "distance": float(v[0])}] for v in vectors]
+
+    matches = iter_batch_search(embedded_batches(), search_batch, search_batch_size=3)
+    written = write_jsonl(
+        ({"query": path, "results": results} for path, results in matches), results_output
+    )
+
+    captured = capsys.readouterr()
+    records = [json.loads(line) for line in captured.out.splitlines()]
+    assert written == 4
+    assert [record["query"] for record in records] == ["q0a.jpg", "q0b.jpg", "q1a.jpg", "q1b.jpg"]
+    assert "Processing batch 2/2" in captured.err
+    assert "Using device: cpu" in captured.err
+
+
+def test_file_output_leaves_stdout_alone(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    assert reserve_stdout(path) == path
+    assert reserve_stdout(None) is None
+    assert write_jsonl([{"query": "a.jpg", "results": []}], path) == 1
+    with open(path) as f:
+        assert json.loads(f.read()) == {"query": "a.jpg", "results": []}
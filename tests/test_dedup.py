@@ -0,0 +1,81 @@
+import argparse
+
+import numpy as np
+
+from common.dedup import UnionFind, add_dedup_arguments, exact_pairs, load_dedup, run_dedup, spherical_kmeans
+
+
+def test_union_find_groups_largest_first():
+    sets = UnionFind(7)
+    sets.union_pairs(np.array([0, 1, 5]), np.array([1, 2, 6]))
+    groups = sets.groups()
+    np.testing.assert_array_equal(groups, [0, 0, 0, -1, -1, 1, 1])
+
+
+def test_exact_pairs_across_blocks():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(10, 16)).astype(np.float32)
+    vectors[8] = vectors[1]
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    pairs = [(int(r), int(c)) for rows, cols, _ in exact_pairs(vectors, 0.99, block_size=3)
+             for r, c in zip(rows, cols)]
+    assert pairs == [(1, 8)]
+
+
+def test_spherical_kmeans_separates_clusters():
+    rng = np.random.default_rng(0)
+    centers = np.eye(8, dtype=np.float32)[:2]
+    vectors = np.repeat(centers, 20, axis=0) + rng.normal(scale=0.05, size=(40, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    _, labels, _ = spherical_kmeans(vectors, 2, seed=0)
+    assert len(set(labels[:20])) == 1 and len(set(labels[20:])) == 1 and labels[0] != labels[20]
+
+
+class ListStore:
+    def __init__(self, paths, vectors):
+        self.paths, self.vectors = paths, vectors
+
+    def count(self):
+        return len(self.paths)
+
+    def iter_vectors(self, batch_size):
+        yield list(self.paths), self.vectors.copy()
+
+
+def run(tmp_path, store, *flags):
+    parser = argparse.ArgumentParser()
+    add_dedup_arguments(parser)
+    args = parser.parse_args(["--export_dir", str(tmp_path / "export"), "-o", str(tmp_path / "dedup.npz"), *flags])
+    run_dedup(store, args)
+    return load_dedup(tmp_path / "dedup.npz")
+
+
+def test_regions_are_not_duplicates_of_their_images(tmp_path):
+    vectors = np.random.default_rng(0).normal(size=(4, 8)).astype(np.float32)
+    vectors[1] = vectors[0]
+    vectors[3] = vectors[2]
+    store = ListStore(["a.jpg", "a.jpg#region0", "b.jpg", "ü/c.jpg"], vectors)
+
+    result = run(tmp_path, store)
+    assert result["paths"] == ["a.jpg", "b.jpg", "ü/c.jpg"]
+    np.testing.assert_array_equal(result["group"], [-1, 0, 0])
+
+    # A different setting exports again instead of reusing the export
+    result = run(tmp_path, store, "--include_regions")
+    assert result["paths"] == store.paths
+    np.testing.assert_array_equal(result["group"], [0, 0, 1, 1])
+
+
+def test_export_is_redone_after_reindexing(tmp_path):
+    vectors = np.random.default_rng(1).normal(size=(3, 8)).astype(np.float32)
+    store = ListStore(["a.jpg", "b.jpg", "c.jpg"], vectors)
+    assert run(tmp_path, store)["paths"] == store.paths
+
+    # Unchanged store: the export is reused without reading the store again
+    store.iter_vectors = None
+    assert run(tmp_path, store)["paths"] == ["a.jpg", "b.jpg", "c.jpg"]
+
+    reindexed = ListStore(["a.jpg", "b.jpg", "c.jpg", "d.jpg"], np.vstack([vectors, vectors[:1]]))
+    result = run(tmp_path, reindexed)
+    assert result["paths"] == reindexed.paths
+    np.testing.assert_array_equal(result["group"], [0, -1, -1, 0])
@@ -0,0 +1,57 @@
+import numpy as np
+
+from common.embedding_cache import EmbeddingCache, cache_namespace
+
+
+def unit(seed, dim=4):
+    vector = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_namespace_depends_on_model_and_preprocessing():
+    base = cache_namespace("facebook/dinov2-small", {"resize": 256})
+    assert base == cache_namespace("facebook/dinov2-small", {"resize": 256})
+    assert base != cache_namespace("facebook/dinov2-base", {"resize": 256})
+    assert base != cache_namespace("facebook/dinov2-small", {"resize": 224})
+
+
+def test_hit_miss_and_reopen(tmp_path):
+    cache = EmbeddingCache(tmp_path, "ns", dim=4)
+    assert cache.get("a") is None
+    cache.put_many({"a": unit(0), "b": unit(1)})
+    np.testing.assert_array_equal(cache.get("a"), unit(0))
+    assert len(cache) == 2
+    cache.close()
+
+    reopened = EmbeddingCache(tmp_path, "ns", dim=4)
+    np.testing.assert_array_equal(reopened.get("b"), unit(1))
+    assert reopened.get("c") is None
+    reopened.close()
+
+
+def test_full_cache_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(tmp_path, "ns", dim=4, max_entries=2, memory_entries=0)
+    cache.put_many({"a": unit(0)})
+    cache.put_many({"b": unit(1)})
+    # Reading "a" makes "b" the least recently used row
+    assert cache.get("a") is not None
+    cache.put_many({"c": unit(2)})
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    np.testing.assert_array_equal(cache.get("a"), unit(0))
+    np.testing.assert_array_equal(cache.get("c"), unit(2))
+    cache.close()
+
+
+def test_hits_are_written_once_per_flush(tmp_path):
+    cache = EmbeddingCache(tmp_path, "ns", dim=4, memory_entries=0)
+    cache.put_many({"a": unit(0), "b": unit(1)})
+    before = dict(cache._conn.execute("SELECT key, last_used FROM entries"))
+    cache.get("a")
+    cache.get("b")
+    assert dict(cache._conn.execute("SELECT key, last_used FROM entries")) == before
+
+    cache.flush_hits()
+    after = dict(cache._conn.execute("SELECT key, last_used FROM entries"))
+    assert after["a"] > before["a"] and after["b"] > before["b"]
+    cache.close()
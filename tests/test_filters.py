@@ -0,0 +1,96 @@
+import re
+
+import numpy as np
+import pytest
+
+import weaviate_store
+from common.local_store import LocalImageDB
+from milvus_setup import MilvusImageDB, like_prefix
+
+
+def unit(seed, dim=8):
+    vector = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def record(path, seed, width=640, height=480, format="JPEG"):
+    return {"image_path": path, "vector": unit(seed),
+            "metadata": {"width": width, "height": height, "format": format}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalImageDB(tmp_path / "store", dim=8)
+    store.upsert([
+        record("holidays/2024/a.jpg", 0),
+        record("holidays/2024b/b.jpg", 1, width=1920, height=1080),
+        record("work/c.png", 2, format="PNG"),
+    ])
+    yield store
+    store.close()
+
+
+def test_directory_prefix_filter(store):
+    hits = store.search(unit(1), top_k=3, filters={"path_prefix": "holidays/2024/"})
+    assert [hit["image_path"] for hit in hits] == ["holidays/2024/a.jpg"]
+
+
+def test_metadata_filters(store):
+    assert [hit["image_path"] for hit in store.search(unit(0), top_k=3, filters={"format": "png"})] == ["work/c.png"]
+    wide = store.search(unit(0), top_k=3, filters={"min_width": 1000})
+    assert [hit["image_path"] for hit in wide] == ["holidays/2024b/b.jpg"]
+    with pytest.raises(ValueError):
+        store.search(unit(0), filters={"colour": "red"})
+
+
+def like_regex(pattern):
+    """Python regex equivalent of a LIKE pattern with backslash escapes"""
+    regex = ""
+    chars = iter(pattern)
+    for char in chars:
+        if char == "\\":
+            regex += re.escape(next(chars))
+        elif char == "%":
+            regex += ".*"
+        elif char == "_":
+            regex += "."
+        else:
+            regex += re.escape(char)
+    return re.compile(regex, re.DOTALL)
+
+
+@pytest.mark.parametrize("prefix, matching, other", [
+    ("/data/img_2024", "/data/img_2024/a.jpg", "/data/imgX2024/a.jpg"),
+    ("/data/100%", "/data/100%/a.jpg", "/data/1000/a.jpg"),
+    ("C:\\photos\\", "C:\\photos\\a.jpg", "C:Xphotos\\a.jpg"),
+])
+def test_prefix_wildcards_are_literal(prefix, matching, other):
+    pattern = like_regex(like_prefix(prefix))
+    assert pattern.fullmatch(matching)
+    assert not pattern.fullmatch(other)
+
+
+@pytest.mark.parametrize("prefix", ["photos/*/2024", "img?", "a*"])
+def test_weaviate_prefix_rejects_wildcards(prefix):
+    with pytest.raises(ValueError, match="cannot contain"):
+        weaviate_store.like_prefix(prefix)
+    assert weaviate_store.like_prefix("holidays/2024_%/") == "holidays/2024_%/*"
+
+
+def partially_loaded(load_fields):
+    """A MilvusImageDB as configured by __init__, without connecting to a server"""
+    db = object.__new__(MilvusImageDB)
+    db.collection_name = "image_collection"
+    db.metadata_fields = ["width", "height", "format"]
+    db.load_fields = sorted({"id", "embedding", "image_path", *load_fields})
+    return db
+
+
+def test_partial_load_rejects_filters_on_unloaded_fields():
+    db = partially_loaded(["width"])
+    assert "image_path" in db.load_fields
+    assert db._filter_expr({"path_prefix": "/data/", "min_width": 100}) == (
+        'image_path like "/data/%" and width >= 100'
+    )
+    with pytest.raises(ValueError, match="height"):
+        db._filter_expr({"max_height": 100})
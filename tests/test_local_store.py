@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from common.local_store import LocalImageDB
+
+
+def unit(seed, dim=8):
+    vector = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def record(path, seed, width=640, height=480, format="JPEG"):
+    return {"image_path": path, "vector": unit(seed),
+            "metadata": {"width": width, "height": height, "format": format}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalImageDB(tmp_path / "store", dim=8)
+    store.upsert([
+        record("holidays/2024/a.jpg", 0),
+        record("holidays/2024b/b.jpg", 1, width=1920, height=1080),
+        record("work/c.png", 2, format="PNG"),
+    ])
+    yield store
+    store.close()
+
+
+def test_search_returns_cosine_similarity(store):
+    results = store.search(unit(1), top_k=2)
+    assert results[0]["image_path"] == "holidays/2024b/b.jpg"
+    assert results[0]["distance"] == pytest.approx(1.0, abs=1e-5)
+    assert results[0]["metadata"] == {"width": 1920, "height": 1080, "format": "JPEG"}
+    assert len(results) == 2
+
+
+def test_upsert_replaces_and_delete_removes(store):
+    store.upsert([record("work/c.png", 3, format="PNG")])
+    assert store.count() == 3
+    assert store.search(unit(3), top_k=1)[0]["image_path"] == "work/c.png"
+
+    store.delete_by_paths(["work/c.png"])
+    assert store.count() == 2
+    assert all(hit["image_path"] != "work/c.png" for hit in store.search(unit(3), top_k=3))
+
+
+def test_reopen_keeps_rows_and_tombstones(tmp_path, store):
+    store.delete_by_paths(["work/c.png"])
+    store.flush()
+    reopened = LocalImageDB(tmp_path / "store", dim=8)
+    assert reopened.count() == 2
+    paths = [path for batch, _ in reopened.iter_vectors() for path in batch]
+    assert sorted(paths) == ["holidays/2024/a.jpg", "holidays/2024b/b.jpg"]
+    reopened.close()
+    with pytest.raises(ValueError):
+        LocalImageDB(tmp_path / "store", dim=16)
@@ -0,0 +1,101 @@
+import os
+
+from common.hashing import hash_bytes, hash_file
+from common.manifest import IndexManifest
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def index(manifest, plan, region_counts=None):
+    """Record the new and changed paths of a plan as indexed"""
+    paths = plan.new + plan.changed
+    manifest.mark_pending(paths, plan.stats, region_counts)
+    manifest.mark_done(paths)
+
+
+def test_plan_new_changed_unchanged_removed(tmp_path):
+    images = tmp_path / "images"
+    a = write(images / "a.jpg", b"a")
+    b = write(images / "b.jpg", b"b")
+    c = write(images / "c.jpg", b"c")
+    manifest = IndexManifest(tmp_path / "manifest.sqlite", "model")
+
+    plan = manifest.plan([a, b, c], root=images)
+    assert (plan.new, plan.changed, plan.unchanged, plan.removed) == ([a, b, c], [], 0, [])
+    index(manifest, plan)
+
+    write(images / "a.jpg", b"changed")
+    os.remove(c)
+    plan = manifest.plan([a, b], root=images)
+    assert (plan.new, plan.changed, plan.unchanged, plan.removed) == ([], [a], 1, [c])
+    assert set(plan.stats) == {a}
+    manifest.close()
+
+
+def test_touched_file_with_same_content_is_unchanged(tmp_path):
+    a = write(tmp_path / "a.jpg", b"a")
+    manifest = IndexManifest(tmp_path / "manifest.sqlite", "model")
+    index(manifest, manifest.plan([a]))
+
+    os.utime(a, ns=(1, 1))
+    plan = manifest.plan([a])
+    assert plan.unchanged == 1 and not plan.changed
+    # The new mtime is recorded, so the next plan does not hash it again
+    assert manifest.plan([a]).unchanged == 1
+    manifest.close()
+
+
+def test_pending_rows_are_reported_as_changed(tmp_path):
+    a = write(tmp_path / "a.jpg", b"a")
+    manifest = IndexManifest(tmp_path / "manifest.sqlite", "model")
+    plan = manifest.plan([a])
+    manifest.mark_pending(plan.new, plan.stats)
+    assert manifest.plan([a]).changed == [a]
+    manifest.close()
+
+
+def test_models_are_tracked_separately(tmp_path):
+    a = write(tmp_path / "a.jpg", b"a")
+    small = IndexManifest(tmp_path / "manifest.sqlite", "small")
+    index(small, small.plan([a]))
+    base = IndexManifest(tmp_path / "manifest.sqlite", "base")
+    assert base.plan([a]).new == [a]
+    small.close()
+    base.close()
+
+
+def test_removals_are_found_under_a_relative_root(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write(tmp_path / "imgs" / "a.jpg", b"a")
+    write(tmp_path / "imgs" / "b.jpg", b"b")
+    write(tmp_path / "other" / "c.jpg", b"c")
+    manifest = IndexManifest("manifest.sqlite", "model")
+    scanned = ["./imgs/a.jpg", "./imgs/b.jpg"]
+    index(manifest, manifest.plan(scanned, root="./imgs"))
+    index(manifest, manifest.plan(["./other/c.jpg"], root="./other"))
+
+    os.remove("imgs/b.jpg")
+    # The root normalizes to "imgs" while the scanned paths keep their "./"
+    plan = manifest.plan(scanned[:1], root=os.path.normpath("./imgs"))
+    assert plan.removed == ["./imgs/b.jpg"]
+    manifest.close()
+
+
+def test_precomputed_hashes_and_region_counts(tmp_path, monkeypatch):
+    a = write(tmp_path / "a.jpg", b"a")
+    manifest = IndexManifest(tmp_path / "manifest.sqlite", "model")
+    plan = manifest.plan([a])
+
+    def no_second_read(path):
+        raise AssertionError(f"{path} was read again")
+
+    monkeypatch.setattr("common.manifest.hash_file", no_second_read)
+    manifest.mark_pending(plan.new, plan.stats, region_counts={a: 3})
+    manifest.mark_done(plan.new, content_hashes={a: hash_bytes(b"a")})
+    assert manifest.conn.execute("SELECT content_hash FROM files").fetchone()[0] == hash_file(a)
+    assert manifest.region_counts([a, "unknown.jpg"]) == {a: 3, "unknown.jpg": None}
+    manifest.close()
@@ -0,0 +1,87 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from common.hashing import hash_bytes
+from common.local_store import LocalImageDB
+from common.manifest import IndexManifest
+from common.pipeline import index_images
+from common.regions import RegionSource, region_path
+
+
+class FakeEmbedder:
+    """Deterministic vectors per path, with the region and hash outputs of DINOv2Embedder"""
+
+    def iter_embeddings(self, image_paths, batch_size=16, regions=None, with_hashes=False):
+        paths, hashes = [], []
+        for path in image_paths:
+            with open(path, "rb") as f:
+                digest = hash_bytes(f.read())
+            paths.append(path)
+            hashes.append(digest)
+            polygons = regions.polygons(path) if regions is not None else []
+            paths += [region_path(path, idx) for idx in range(len(polygons))]
+            hashes += [None] * len(polygons)
+        if not paths:
+            return
+        vectors = np.stack([
+            np.random.default_rng(abs(hash(path)) % 2**32).normal(size=8).astype(np.float32) for path in paths
+        ])
+        yield (paths, vectors, hashes) if with_hashes else (paths, vectors)
+
+
+def live_paths(store):
+    return sorted(path for batch, _ in store.iter_vectors() for path in batch)
+
+
+@pytest.fixture
+def images(tmp_path):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    for name in ("a", "b"):
+        (directory / f"{name}.jpg").write_bytes(name.encode())
+    (directory / "a.json").write_text(json.dumps([[[0, 0], [50, 0], [50, 50]], [[10, 10], [90, 10], [90, 90]]]))
+    return directory
+
+
+def scan(directory):
+    return sorted(str(path) for path in directory.glob("*.jpg"))
+
+
+def test_removed_image_takes_its_regions_along(tmp_path, images, monkeypatch):
+    store = LocalImageDB(tmp_path / "store", dim=8)
+    manifest = IndexManifest(tmp_path / "manifest.sqlite", "fake")
+    a, b = scan(images)
+
+    def no_second_read(path):
+        raise AssertionError(f"{path} was read again")
+
+    monkeypatch.setattr("common.manifest.hash_file", no_second_read)
+    inserted = index_images(scan(images), FakeEmbedder(), store, manifest=manifest, root=images,
+                            regions=RegionSource())
+    assert inserted == 2
+    assert live_paths(store) == [a, region_path(a, 0), region_path(a, 1), b]
+
+    # The polygon file goes with the image, so the regions cannot be found from it
+    os.remove(a)
+    os.remove(images / "a.json")
+    index_images(scan(images), FakeEmbedder(), store, manifest=manifest, root=images, regions=RegionSource())
+    assert live_paths(store) == [b]
+    store.close()
+    manifest.close()
+
+
+def test_changed_image_replaces_its_regions(tmp_path, images):
+    store = LocalImageDB(tmp_path / "store", dim=8)
+    manifest = IndexManifest(tmp_path / "manifest.sqlite", "fake")
+    a, b = scan(images)
+    index_images(scan(images), FakeEmbedder(), store, manifest=manifest, root=images, regions=RegionSource())
+
+    (images / "a.jpg").write_bytes(b"new content")
+    (images / "a.json").write_text(json.dumps([[0, 0], [50, 0], [50, 50]]))
+    index_images(scan(images), FakeEmbedder(), store, manifest=manifest, root=images, regions=RegionSource())
+    assert live_paths(store) == [a, region_path(a, 0), b]
+    store.close()
+    manifest.close()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from common.local_store import LocalImageDB
+from common.quantization import VECTOR_DTYPES, bytes_per_vector, code_layout, decode, encode
+
+
+@pytest.fixture
+def vectors():
+    vectors = np.random.default_rng(0).normal(size=(16, 40)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("dtype", VECTOR_DTYPES)
+def test_codes_match_layout(vectors, dtype):
+    code_dtype, width = code_layout(dtype, 40)
+    codes = encode(vectors, dtype)
+    assert codes.dtype == code_dtype and codes.shape == (16, width)
+    assert bytes_per_vector(dtype, 40) == code_dtype.itemsize * width
+    assert decode(codes, dtype, 40).shape == (16, 40)
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 1e-6), ("float16", 1e-3), ("bfloat16", 1e-2), ("int8", 2e-2)])
+def test_round_trip_keeps_direction(vectors, dtype, tolerance):
+    decoded = decode(encode(vectors, dtype), dtype, 40)
+    cosine = (decoded * vectors).sum(axis=1) / np.linalg.norm(decoded, axis=1)
+    assert cosine.min() >= 1 - tolerance
+
+
+def test_binary_codes_keep_signs(vectors):
+    decoded = decode(encode(vectors, "binary"), "binary", 40)
+    np.testing.assert_array_equal(decoded > 0, vectors > 0)
+    np.testing.assert_allclose(np.linalg.norm(decoded, axis=1), 1.0, rtol=1e-6)
+
+
+def test_bfloat16_rounds_to_nearest():
+    values = np.array([[1.0, 1.00390625, -2.5]], dtype=np.float32)
+    np.testing.assert_array_equal(decode(encode(values, "bfloat16"), "bfloat16", 3), [[1.0, 1.0, -2.5]])
+
+
+def test_unknown_dtype_is_rejected(vectors):
+    with pytest.raises(ValueError):
+        encode(vectors, "int4")
+
+
+@pytest.mark.parametrize("dtype", ["float16", "bfloat16", "int8", "binary"])
+def test_compressed_store_finds_the_same_neighbour(tmp_path, dtype):
+    store = LocalImageDB(tmp_path / dtype, dim=64, dtype=dtype)
+    vectors = np.random.default_rng(0).normal(size=(20, 64)).astype(np.float32)
+    store.upsert([{"image_path": f"{i}.jpg", "vector": vector} for i, vector in enumerate(vectors)])
+    assert store.search(vectors[7], top_k=1)[0]["image_path"] == "7.jpg"
+    store.close()
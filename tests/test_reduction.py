@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from common.reduction import Reducer, fit_reducer
+
+
+@pytest.fixture
+def sample():
+    # Most of the variance lies in the first 3 of 16 dimensions
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 16)) * np.r_[10.0, 8.0, 6.0, np.full(13, 0.1)]
+    return vectors.astype(np.float32)
+
+
+def test_pca_keeps_the_directions_of_largest_variance(sample):
+    reducer = fit_reducer(sample, 3)
+    assert (reducer.input_dim, reducer.output_dim) == (16, 3)
+    # The kept components span the first 3 axes
+    np.testing.assert_allclose((reducer.components[:3] ** 2).sum(axis=0), 1.0, atol=1e-3)
+    reduced = reducer.transform(sample)
+    assert reduced.shape == (200, 3)
+    np.testing.assert_allclose(np.linalg.norm(reduced, axis=1), 1.0, rtol=1e-5)
+    assert reducer.transform(sample[0]).shape == (3,)
+
+
+def test_random_projection_is_orthonormal(sample):
+    reducer = fit_reducer(sample, 4, method="random", seed=1)
+    np.testing.assert_allclose(reducer.components.T @ reducer.components, np.eye(4), atol=1e-5)
+
+
+def test_save_and_load_apply_the_same_map(tmp_path, sample):
+    reducer = fit_reducer(sample, 3, method="pca_whiten")
+    reducer.save(tmp_path / "reduction.npz")
+    loaded = Reducer.load(tmp_path / "reduction.npz")
+    assert loaded.method == "pca_whiten"
+    assert loaded.fingerprint == reducer.fingerprint
+    np.testing.assert_allclose(loaded.transform(sample), reducer.transform(sample))
+
+
+def test_invalid_targets_are_rejected(sample):
+    with pytest.raises(ValueError):
+        fit_reducer(sample, 32)
+    with pytest.raises(ValueError):
+        fit_reducer(sample[:2], 3)
+    with pytest.raises(ValueError):
+        fit_reducer(sample, 3, method="umap")
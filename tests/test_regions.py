@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from common.regions import (
+    RegionSource,
+    is_region_path,
+    load_polygons,
+    order_corners,
+    region_path,
+    split_region_path,
+    with_parents,
+)
+
+
+def test_region_keys_carry_their_parent():
+    key = region_path("photos/a#b.jpg", 2)
+    assert key == "photos/a#b.jpg#region2"
+    assert split_region_path(key) == ("photos/a#b.jpg", 2)
+    assert split_region_path("photos/a.jpg") == ("photos/a.jpg", None)
+    assert is_region_path(key) and not is_region_path("photos/x#regionless.jpg")
+    hits = with_parents([{"image_path": key}, {"image_path": "b.jpg"}])
+    assert hits == [{"image_path": key, "parent_image": "photos/a#b.jpg", "region": 2}, {"image_path": "b.jpg"}]
+
+
+def test_load_one_or_many_polygons(tmp_path):
+    (tmp_path / "one.txt").write_text(json.dumps([[0, 0], [4, 0], [4, 3]]))
+    (tmp_path / "many.json").write_text(json.dumps([[[0, 0], [4, 0], [4, 3]], [[1, 1], [2, 1], [2, 2], [1, 2]]]))
+    (tmp_path / "bad.txt").write_text(json.dumps([[0, 0], [1, 1]]))
+    assert [p.shape for p in load_polygons(tmp_path / "one.txt")] == [(3, 2)]
+    assert [p.shape for p in load_polygons(tmp_path / "many.json")] == [(3, 2), (4, 2)]
+    with pytest.raises(ValueError):
+        load_polygons(tmp_path / "bad.txt")
+
+
+def test_corners_are_ordered_whatever_the_click_order():
+    corners = order_corners([[10, 90], [90, 10], [10, 10], [90, 90]])
+    np.testing.assert_array_equal(corners, [[10, 10], [90, 10], [90, 90], [10, 90]])
+
+
+def test_polygon_file_is_found_next_to_the_image_or_in_a_mirror(tmp_path):
+    image = tmp_path / "images" / "sub" / "a.jpg"
+    mirror = tmp_path / "polygons" / "sub" / "a.json"
+    image.parent.mkdir(parents=True)
+    mirror.parent.mkdir(parents=True)
+    mirror.write_text("[]")
+    assert RegionSource().find(image) is None
+    assert RegionSource(tmp_path / "polygons", root=tmp_path / "images").find(image) == mirror
+
+
+@pytest.fixture
+def image():
+    # Left half red, right half blue
+    pixels = np.zeros((100, 200, 3), dtype=np.uint8)
+    pixels[:, :100, 0] = 255
+    pixels[:, 100:, 2] = 255
+    return Image.fromarray(pixels)
+
+
+def test_bbox_crop_at_reduced_decode_scale(image):
+    regions = RegionSource()
+    polygon = np.array([[110.0, 20.0], [190.0, 20.0], [150.0, 80.0]])
+    crop = regions.crop(image, polygon)
+    assert crop.size == (80, 60)
+    assert np.asarray(crop)[..., 2].min() == 255
+    # The same polygon on an image decoded at half size
+    half = regions.crop(image.resize((100, 50)), polygon, scale=0.5)
+    assert half.size == (40, 30)
+
+
+def test_small_and_outside_regions_are_rejected(image):
+    regions = RegionSource()
+    with pytest.raises(ValueError):
+        regions.crop(image, np.array([[0.0, 0.0], [4.0, 0.0], [4.0, 4.0]]))
+    with pytest.raises(ValueError):
+        regions.crop(image, np.array([[300.0, 0.0], [400.0, 0.0], [400.0, 50.0]]))
+
+
+def test_perspective_crop_rectifies_a_quadrilateral(image):
+    regions = RegionSource(mode="perspective")
+    polygon = np.array([[20.0, 10.0], [80.0, 10.0], [80.0, 90.0], [20.0, 90.0]])
+    crop = regions.crop(image, polygon)
+    assert crop.size == (60, 80)
+    assert np.asarray(crop)[..., 0].min() == 255
+    with pytest.raises(ValueError):
+        regions.size(polygon[:3])
+
+
+def test_draft_size_keeps_small_regions_sharp():
+    regions = RegionSource()
+    polygon = np.array([[0.0, 0.0], [400.0, 0.0], [400.0, 400.0], [0.0, 400.0]])
+    assert regions.draft_size((4000, 3000), [polygon], 224) == 224 * 3000 // 400
+    assert regions.draft_size((4000, 3000), [], 224) == 224
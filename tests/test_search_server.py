@@ -0,0 +1,89 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from common.metrics import METRICS
+from common.search_server import MicroBatcher, _make_handler
+
+
+def search_ok(vector, top_k, filters):
+    return [{"image_path": "a.jpg", "top_k": top_k}]
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+
+    def start(search_fn=search_ok, path_root=None):
+        batcher = MicroBatcher(lambda images: [[1.0] for _ in images], max_wait_ms=1)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(batcher, search_fn, 5, path_root))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def server_url(start_server, tmp_path):
+    return start_server(path_root=str(tmp_path))
+
+
+def post(url, body=b"image", content_type="application/octet-stream"):
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_top_k_from_query_and_json(server_url):
+    status, body = post(server_url + "/search?top_k=2")
+    assert status == 200 and body["results"][0]["top_k"] == 2
+    status, body = post(server_url + "/search", json.dumps({"path": "q.jpg"}).encode(), "application/json")
+    assert status == 200 and body["results"][0]["top_k"] == 5
+
+
+@pytest.mark.parametrize("query, body, content_type", [
+    ("?top_k=abc", b"image", "application/octet-stream"),
+    ("?top_k=0", b"image", "application/octet-stream"),
+    ("", b'{"path": "q.jpg", "top_k": -1}', "application/json"),
+    ("", b'{"path": "q.jpg", "top_k": null}', "application/json"),
+    ("", b'{"top_k": 3}', "application/json"),
+])
+def test_bad_requests_get_400(server_url, query, body, content_type):
+    status, response = post(server_url + "/search" + query, body, content_type)
+    assert status == 400
+    assert response["error"].startswith("bad request")
+
+
+def test_search_failures_get_503(start_server):
+    def search_down(vector, top_k, filters):
+        raise ConnectionError("database unreachable")
+
+    url = start_server(search_down)
+    failures = METRICS.snapshot()["counters"].get("failures", {}).get("search", 0)
+    status, response = post(url + "/search")
+    assert status == 503
+    assert "database unreachable" in response["error"]
+    assert METRICS.snapshot()["counters"]["failures"]["search"] == failures + 1
+
+
+def test_path_queries_stay_under_path_root(start_server, tmp_path):
+    query = json.dumps({"path": "q.jpg"}).encode()
+    status, response = post(start_server() + "/search", query, "application/json")
+    assert status == 403 and "disabled" in response["error"]
+
+    url = start_server(path_root=str(tmp_path / "served"))
+    assert post(url + "/search", query, "application/json")[0] == 200
+    for path in ("../secret.jpg", "/etc/passwd"):
+        status, response = post(url + "/search", json.dumps({"path": path}).encode(), "application/json")
+        assert status == 403 and "outside" in response["error"]
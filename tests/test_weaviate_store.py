@@ -0,0 +1,72 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from weaviate.classes.config import Tokenization
+
+import weaviate_store
+from weaviate_store import WeaviateImageDB
+
+
+class FakeCollections:
+    """The collection management calls WeaviateImageDB makes, without a server"""
+
+    def __init__(self, path_tokenization=None):
+        self.created = None
+        self.existing = {}
+        if path_tokenization is not None:
+            self.existing["Image"] = path_tokenization
+
+    def list_all(self):
+        return dict(self.existing)
+
+    def create_from_dict(self, schema):
+        self.created = schema
+        path = next(prop for prop in schema["properties"] if prop["name"] == "path")
+        self.existing[schema["class"]] = path.get("tokenization", "word")
+
+    def get(self, name):
+        # The client reports tokenization as an enum member
+        properties = [SimpleNamespace(name="path", tokenization=Tokenization(self.existing[name]))]
+        config = SimpleNamespace(get=lambda: SimpleNamespace(properties=properties))
+        return SimpleNamespace(config=config)
+
+
+def open_store(collections, root=None):
+    return WeaviateImageDB(SimpleNamespace(collections=collections), embedding_dim=4, root=root)
+
+
+def test_new_collection_filters_path_as_one_field():
+    collections = FakeCollections()
+    store = open_store(collections)
+    path = next(prop for prop in collections.created["properties"] if prop["name"] == "path")
+    assert path["tokenization"] == "field"
+    assert path["indexFilterable"] is True
+
+    condition = store._filter({"path_prefix": "holidays/2024/"})
+    assert condition.target == "path"
+    assert condition.value == "holidays/2024/*"
+
+
+def test_word_tokenized_collection_refuses_path_prefix():
+    store = open_store(FakeCollections(path_tokenization="word"))
+    with pytest.raises(ValueError, match="tokenized as a field"):
+        store._filter({"path_prefix": "holidays/2024/"})
+    # Other filters do not depend on the path property
+    assert store._filter({"format": "jpg"}).value == "JPEG"
+
+
+def test_roots_sharing_a_layout_do_not_overwrite_each_other(tmp_path, monkeypatch):
+    inserted = []
+    monkeypatch.setattr(
+        weaviate_store, "insert_objects", lambda collection, objs, *args: inserted.extend(objs) or []
+    )
+    collections = FakeCollections()
+    for root in (tmp_path / "a", tmp_path / "b"):
+        store = open_store(collections, root=str(root))
+        store.upsert([{"image_path": str(root / "cats" / "1.jpg"), "vector": [0.0] * 4}])
+
+    assert [obj["properties"]["path"] for obj in inserted] == [os.path.join("cats", "1.jpg")] * 2
+    assert inserted[0]["uuid"] != inserted[1]["uuid"]
+    # Deletes address the object of the given file only
+    assert weaviate_store.image_uuid(tmp_path / "a" / "cats" / "1.jpg") == inserted[0]["uuid"]
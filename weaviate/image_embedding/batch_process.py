@@ -1,121 +1,33 @@
 #!/usr/bin/env python
 import argparse
 import os
+import sys
 from pathlib import Path
 
 import weaviate
-from dinov2_embedder import DINOv2Embedder
-from PIL import Image
-from tqdm import tqdm
 
-
-def get_image_metadata(image_path: Path) -> dict:
-    """Extract width, height, format, and size_kb for an image."""
-    try:
-        with Image.open(image_path) as img:
-            return {
-                "width": img.width,
-                "height": img.height,
-                "format": img.format,
-                "size_kb": os.path.getsize(image_path) / 1024,
-            }
-    except Exception as e:
-        print(f"⚠️ Metadata error for {image_path}: {e}")
-        return {}
-
-
-def ensure_collection_exists(
-    client: weaviate.WeaviateClient, embedding_dim: int
-) -> None:
-    """
-    Ensure that an 'Image' collection exists; if not, create it with:
-      - no vectorizer (vectors provided by us),
-      - hnsw index with optimized parameters,
-      - filename, path, metadata properties.
-    """
-    # List all existing collections
-    existing = client.collections.list_all()
-    if "Image" not in existing:
-        class_schema = {
-            "class": "Image",
-            "vectorizer": "none",
-            "vectorIndexType": "hnsw",
-            "vectorIndexConfig": {
-                "ef": 200,
-                "efConstruction": 128,
-                "maxConnections": 16,
-                "vectorCacheMaxObjects": 1000000,
-            },
-            "properties": [
-                {
-                    "name": "filename",
-                    "dataType": ["text"],  # list, not set
-                },
-                {
-                    "name": "path",
-                    "dataType": ["text"],  # list, not set
-                },
-                {
-                    "name": "metadata",
-                    "dataType": ["object"],  # list, not set
-                    "nestedProperties": [  # list, not set
-                        {"name": "width", "dataType": ["int"]},
-                        {"name": "height", "dataType": ["int"]},
-                        {"name": "format", "dataType": ["text"]},
-                        {"name": "size_kb", "dataType": ["number"]},
-                    ],
-                },
-            ],
-        }
-        # Create via v3‑style JSON (supports hnsw) :contentReference[oaicite:5]{index=5}
-        client.collections.create_from_dict(class_schema)
-        print(f"✅ Created 'Image' collection (dim={embedding_dim})")
-    else:
-        print("ℹ️ Collection 'Image' already exists")
-
-
-def batch_process_images(
-    directory_path: str,
-    client: weaviate.WeaviateClient,
-    embedder,
-    batch_size: int = 32,
-) -> None:
-    """Scan for images, embed in batches, and upload to Weaviate."""
-    # Collect image file paths
-    p = Path(directory_path)
-    supported = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp"}
-    files = [f for f in p.rglob("*") if f.suffix.lower() in supported]
-    print(f"Found {len(files)} images")
-
-    # Ensure the collection exists
-    ensure_collection_exists(client, embedder.get_embedding_dimension())
-
-    # Insert in batches
-    for i in range(0, len(files), batch_size):
-        batch_files = files[i : i + batch_size]
-        objs = []
-        print(f"→ Batch {i//batch_size+1}/{(len(files)-1)//batch_size+1}")
-        for path in tqdm(batch_files):
-            vec = embedder.get_embedding(path)
-            if vec is None:
-                continue
-            objs.append(
-                {
-                    "properties": {
-                        "filename": path.name,
-                        "path": str(path.relative_to(p)),
-                        "metadata": get_image_metadata(path),
-                    },
-                    "vector": vec,
-                }
-            )
-
-        # Process objects in batch with Weaviate v4 API
-        image_collection = client.collections.get("Image")
-        # Add objects one by one (no context manager in v4)
-        for o in objs:
-            image_collection.data.insert(properties=o["properties"], vector=o["vector"])
-        print(f"✔️ Inserted {len(objs)} objects")
+# Add repository root to sys.path for shared modules
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.embedder import DINOv2Embedder, embedding_dimension, resolve_model_name
+from common.inference import add_backend_arguments, print_parity
+from common.manifest import IndexManifest
+from common.metrics import add_metrics_arguments, start_metrics
+from common.patches import (
+    add_patch_arguments,
+    patch_options,
+    patch_vector_count,
+    with_patch_reranking,
+)
+from common.pipeline import index_images
+from common.quantization import add_compression_arguments
+from common.reduction import ReducedEmbedder, add_reduction_arguments, load_or_fit_reducer
+from common.regions import add_region_arguments, regions_from_args
+from common.reranking import with_reranking
+from common.scanner import add_scan_arguments, iter_image_paths
+from common.sharding import ShardedEmbedder
+from weaviate_store import QUANTIZERS, WeaviateImageDB
 
 
 def main():
@@ -129,16 +41,119 @@ def main():
         default="base",
     )
     parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument(
+        "--insert_batch_size",
+        type=int,
+        default=1000,
+        help="Objects imported (and recorded in the manifest) per chunk",
+    )
+    parser.add_argument(
+        "--request_size",
+        type=int,
+        default=0,
+        help="Objects per gRPC batch request; 0 sizes requests dynamically",
+    )
+    parser.add_argument(
+        "--concurrent_requests",
+        type=int,
+        default=2,
+        help="Batch requests in flight at once (with --request_size)",
+    )
+    parser.add_argument(
+        "--max_retries",
+        type=int,
+        default=3,
+        help="Retry attempts for objects rejected by the server",
+    )
     parser.add_argument(
         "--weaviate_url",
         default="http://localhost:8080",
         help="HTTP URL of your Weaviate instance",
     )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Worker processes embedding disjoint shards of the file list",
+    )
+    parser.add_argument(
+        "--threads_per_shard",
+        type=int,
+        default=None,
+        help="PyTorch threads per shard (default: CPUs split evenly across shards)",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        help="Directory for the persistent embedding cache",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="SQLite manifest for incremental indexing; only new or changed files are embedded",
+    )
+    add_scan_arguments(parser)
+    add_region_arguments(parser)
+    add_backend_arguments(parser)
+    add_compression_arguments(parser, dtypes=tuple(QUANTIZERS))
+    add_reduction_arguments(parser)
+    add_patch_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args()
+    # Per-stage timings (scan ... flush), failures and images/sec
+    metrics = start_metrics(args)
 
     # Initialize embedder (device selection printed internally)
-    embedder = DINOv2Embedder(model_size=args.model_size)
-    print(f"Using device: {embedder.device}")
+    model_name = resolve_model_name(args.model_size)
+    embedder_kwargs = dict(
+        model_name=model_name,
+        cache_dir=args.cache_dir,
+        backend=args.backend,
+        onnx_path=args.onnx_path,
+        **patch_options(args),
+    )
+    embedder = None
+    if args.check_parity or args.shards <= 1:
+        embedder = DINOv2Embedder(**embedder_kwargs)
+    # Stream image file paths; embedding starts while the tree is still being listed
+    p = Path(args.directory)
+    files = iter_image_paths(
+        args.directory,
+        file_list=args.file_list,
+        workers=args.scan_workers,
+        check_signatures=args.check_signatures,
+    )
+    if args.check_parity or (args.reduction and not os.path.exists(args.reduction)):
+        # Parity samples the scan and a reduction is fitted on a sample of all of it
+        files = list(files)
+    if args.check_parity:
+        print_parity(embedder.check_parity(files[:16]))
+    if args.shards > 1:
+        # Each shard process loads its own model copy; this process only writes
+        del embedder
+        embedder = ShardedEmbedder(
+            DINOv2Embedder,
+            embedder_kwargs,
+            num_shards=args.shards,
+            threads_per_shard=args.threads_per_shard,
+            embedding_dim=embedding_dimension(model_name),
+        )
+    dim = embedding_dimension(model_name)
+    model_key = model_name
+    if args.reduction:
+        # Applied the same way by image_search.py and search_server.py --reduction
+        reducer = load_or_fit_reducer(
+            args.reduction,
+            embedder,
+            files,
+            args.reduced_dim,
+            method=args.reduction_method,
+            sample_size=args.reduction_sample,
+            batch_size=args.batch_size,
+        )
+        embedder = ReducedEmbedder(embedder, reducer)
+        dim = reducer.output_dim
+        model_key = f"{model_name}+{reducer.fingerprint}"
 
     # Instantiate v4 client (synchronous, default) :contentReference[oaicite:7]{index=7}
     client = weaviate.WeaviateClient(
@@ -148,11 +163,47 @@ def main():
         skip_init_checks=True,
     )
     client.connect()
+    store = WeaviateImageDB(
+        client,
+        dim,
+        root=p,
+        request_size=args.request_size,
+        concurrent_requests=args.concurrent_requests,
+        max_retries=args.max_retries,
+        dtype=args.store_dtype,
+    )
+    store = with_reranking(store, args.rerank_dir, dim, args.rerank_factor)
+    # The [CLS] vectors go to Weaviate, the pooled patch vectors to the local sidecar
+    store = with_patch_reranking(
+        store,
+        args.patch_dir,
+        dim,
+        patch_vector_count(args.patch_pooling, args.patch_vectors),
+        args.patch_factor,
+        args.patch_dtype,
+    )
 
+    manifest = IndexManifest(args.manifest, model_key) if args.manifest else None
     try:
-        batch_process_images(args.directory, client, embedder, args.batch_size)
+        # Same embed -> upsert pipeline as the Milvus and local stores
+        index_images(
+            files,
+            embedder,
+            store,
+            manifest=manifest,
+            root=p,
+            batch_size=args.batch_size,
+            insert_batch_size=args.insert_batch_size,
+            # Read from the same in-memory copy as the pixels: one open per image
+            with_metadata=True,
+            # Annotated regions are cropped from the same decode and batched with the images
+            regions=regions_from_args(args, root=p),
+        )
     finally:
-        client.close()
+        if manifest is not None:
+            manifest.close()
+        store.close()
+        metrics.close()
 
 
 if __name__ == "__main__":
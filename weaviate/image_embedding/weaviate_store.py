@@ -0,0 +1,410 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import weaviate
+from weaviate.classes.config import Reconfigure
+from weaviate.classes.query import Filter, MetadataQuery
+from weaviate.util import generate_uuid5
+
+# Add repository root to sys.path for shared modules
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.metrics import METRICS
+from common.vector_store import FILTER_FIELDS, RANGE_FILTERS, VectorStore, check_filters
+
+# Vector storage dtypes Weaviate offers as HNSW compression: scalar quantization
+# (one byte per dimension) and binary quantization (one bit per dimension).
+# Compressed vectors are held in memory; Weaviate keeps the float32 vectors on
+# disk and rescores the candidates with them.
+QUANTIZERS = {"float32": None, "int8": "sq", "binary": "bq"}
+
+
+def ensure_collection_exists(
+    client: weaviate.WeaviateClient,
+    embedding_dim: int,
+    collection_name: str = "Image",
+    hnsw_params: dict = None,
+    dtype: str = "float32",
+) -> None:
+    """
+    Ensure that the image collection exists; if not, create it with:
+      - no vectorizer (vectors provided by us),
+      - cosine hnsw index with optimized parameters (overridable),
+      - int8 or binary compression of the in-memory vectors (see QUANTIZERS),
+      - filename, path, metadata properties; path is filterable and tokenized
+        as one field, so a prefix filter matches whole paths rather than the
+        words between slashes,
+      - top-level width, height and format copies of the metadata with
+        filterable (and for the sizes, range) indexes; nested properties
+        cannot be filtered on.
+    """
+    if dtype not in QUANTIZERS:
+        raise ValueError(f"Weaviate stores {sorted(QUANTIZERS)} vectors, not '{dtype}'")
+
+    # List all existing collections
+    existing = client.collections.list_all()
+    if collection_name not in existing:
+        quantizer = QUANTIZERS[dtype]
+        if quantizer is not None:
+            hnsw_params = {quantizer: {"enabled": True}, **(hnsw_params or {})}
+        class_schema = {
+            "class": collection_name,
+            "vectorizer": "none",
+            "vectorIndexType": "hnsw",
+            "vectorIndexConfig": {
+                "distance": "cosine",
+                "ef": 200,
+                "efConstruction": 128,
+                "maxConnections": 16,
+                "vectorCacheMaxObjects": 1000000,
+                **(hnsw_params or {}),
+            },
+            "properties": [
+                {
+                    "name": "filename",
+                    "dataType": ["text"],  # list, not set
+                },
+                {
+                    "name": "path",
+                    "dataType": ["text"],  # list, not set
+                    "tokenization": "field",  # path_prefix filters match the whole value
+                    "indexFilterable": True,
+                },
+                {
+                    "name": "width",
+                    "dataType": ["int"],
+                    "indexFilterable": True,
+                    "indexRangeFilters": True,
+                },
+                {
+                    "name": "height",
+                    "dataType": ["int"],
+                    "indexFilterable": True,
+                    "indexRangeFilters": True,
+                },
+                {
+                    "name": "format",
+                    "dataType": ["text"],
+                    "tokenization": "field",  # exact match on the whole value
+                    "indexFilterable": True,
+                    "indexSearchable": False,
+                },
+                {
+                    "name": "metadata",
+                    "dataType": ["object"],  # list, not set
+                    "nestedProperties": [  # list, not set
+                        {"name": "width", "dataType": ["int"]},
+                        {"name": "height", "dataType": ["int"]},
+                        {"name": "format", "dataType": ["text"]},
+                        {"name": "mode", "dataType": ["text"]},
+                        {"name": "size_kb", "dataType": ["number"]},
+                        {"name": "orientation", "dataType": ["int"]},
+                        {"name": "datetime", "dataType": ["text"]},
+                        {"name": "camera_make", "dataType": ["text"]},
+                        {"name": "camera_model", "dataType": ["text"]},
+                    ],
+                },
+            ],
+        }
+        # Create via v3‑style JSON (supports hnsw) :contentReference[oaicite:5]{index=5}
+        client.collections.create_from_dict(class_schema)
+        print(f"✅ Created '{collection_name}' collection (dim={embedding_dim}, {dtype})")
+    else:
+        print(f"ℹ️ Collection '{collection_name}' already exists")
+
+
+def field_tokenized(collection, name: str) -> bool:
+    """Whether a text property is tokenized as one whole field.
+
+    Collections created before `path` was given field tokenization split it
+    into words at every "/", so a `like` filter on it cannot match a prefix.
+    """
+    for prop in collection.config.get().properties:
+        if prop.name == name:
+            return getattr(prop.tokenization, "value", prop.tokenization) == "field"
+    return False
+
+
+def like_prefix(prefix: str) -> str:
+    """Like pattern matching strings that start with `prefix` literally.
+
+    Weaviate has no escape for its `*` and `?` wildcards, so prefixes
+    containing them are rejected rather than matched too broadly.
+    """
+    wildcards = sorted({char for char in prefix if char in "*?"})
+    if wildcards:
+        raise ValueError(f"path_prefix cannot contain {wildcards} with Weaviate: {prefix!r}")
+    return prefix + "*"
+
+
+def image_uuid(image_path) -> str:
+    """Deterministic object UUID of an image file, from its absolute path.
+
+    Not from the stored (root-relative) path: two indexed directories with
+    the same layout would otherwise overwrite each other's objects.
+    """
+    return generate_uuid5(os.path.abspath(str(image_path)))
+
+
+def insert_objects(
+    image_collection,
+    objs: list,
+    request_size: int = 0,
+    concurrent_requests: int = 2,
+    max_retries: int = 3,
+) -> list:
+    """Bulk-import objects through the gRPC batcher, retrying failed objects.
+
+    Objects carry deterministic UUIDs, so a retried or re-run import upserts
+    instead of duplicating.
+
+    Args:
+        image_collection: Weaviate collection handle
+        objs: Dicts with "properties", "vector" and "uuid"
+        request_size: Objects per batch request; 0 lets the client size
+            requests dynamically from server load
+        concurrent_requests: Requests in flight at once (fixed-size batching)
+        max_retries: Extra attempts for objects the server rejected
+
+    Returns:
+        list: Objects that still failed after all retries
+    """
+    pending = objs
+    for attempt in range(max_retries + 1):
+        if attempt:
+            print(f"↻ Retrying {len(pending)} failed objects (attempt {attempt}/{max_retries})")
+            time.sleep(2 ** (attempt - 1))
+
+        batcher = (
+            image_collection.batch.fixed_size(
+                batch_size=request_size, concurrent_requests=concurrent_requests
+            )
+            if request_size > 0
+            else image_collection.batch.dynamic()
+        )
+        with batcher as batch:
+            for o in pending:
+                batch.add_object(
+                    properties=o["properties"], vector=o["vector"], uuid=o["uuid"]
+                )
+
+        errors = {
+            str(err.object_.uuid): err.message
+            for err in image_collection.batch.failed_objects
+        }
+        pending = [o for o in pending if o["uuid"] in errors]
+        if not pending:
+            return []
+
+    for o in pending:
+        print(f"⚠️ Failed to insert {o['properties']['path']}: {errors[o['uuid']]}")
+    return pending
+
+
+class WeaviateImageDB(VectorStore):
+    """Weaviate image collection implementing the VectorStore interface.
+
+    Paths are stored relative to `root` (when given), so results stay short
+    and readable; object UUIDs are derived from the absolute path of each
+    file, which makes every insert an upsert while several roots can share
+    one collection.
+    """
+
+    def __init__(
+        self,
+        client: weaviate.WeaviateClient,
+        embedding_dim: int,
+        collection_name: str = "Image",
+        root: str = None,
+        hnsw_params: dict = None,
+        request_size: int = 0,
+        concurrent_requests: int = 2,
+        max_retries: int = 3,
+        concurrent_queries: int = 8,
+        dtype: str = "float32",
+    ):
+        """
+        Open (creating if needed) a Weaviate image collection.
+
+        Args:
+            client: Connected Weaviate client; closed by `close`
+            embedding_dim: Vector dimension of a new collection
+            collection_name: Collection to use
+            root: Directory that indexed paths are stored relative to
+            hnsw_params: HNSW settings of a new collection, e.g. {"efConstruction": 256}
+            request_size: Objects per gRPC batch request; 0 sizes requests dynamically
+            concurrent_requests: Batch requests in flight at once (with request_size)
+            max_retries: Retry attempts for objects rejected by the server
+            concurrent_queries: Vector searches in flight at once in `search_batch`
+            dtype: In-memory vector storage of a new collection: "float32", "int8"
+                (scalar quantization) or "binary" (binary quantization)
+        """
+        self.client = client
+        self.root = Path(root) if root is not None else None
+        self.request_size = request_size
+        self.concurrent_requests = concurrent_requests
+        self.max_retries = max_retries
+
+        ensure_collection_exists(client, embedding_dim, collection_name, hnsw_params, dtype)
+        self.collection = client.collections.get(collection_name)
+
+        # Searches of a batch run concurrently over the client's gRPC channel,
+        # so throughput is not bound by one round-trip per query
+        self._executor = ThreadPoolExecutor(max_workers=concurrent_queries)
+        self._ef = None
+        self._path_filterable = None
+
+    def stored_path(self, image_path) -> str:
+        """Path as stored in the collection: relative to root when under it"""
+        if self.root is not None:
+            try:
+                return str(Path(image_path).relative_to(self.root))
+            except ValueError:
+                pass
+        return str(image_path)
+
+    def upsert(self, records, replace=True, flush=True):
+        """Bulk-import records; deterministic UUIDs make `replace` implicit"""
+        objs = []
+        for record in records:
+            path = self.stored_path(record["image_path"])
+            properties = {"filename": Path(path).name, "path": path}
+            if record.get("metadata"):
+                properties["metadata"] = record["metadata"]
+                # Filterable copies of the fields searches can be restricted by
+                for name in FILTER_FIELDS:
+                    if record["metadata"].get(name) is not None:
+                        properties[name] = record["metadata"][name]
+            objs.append(
+                {
+                    "properties": properties,
+                    "vector": np.asarray(record["vector"], dtype=np.float32).tolist(),
+                    "uuid": image_uuid(record["image_path"]),
+                    "file": record["image_path"],
+                }
+            )
+
+        failed = insert_objects(
+            self.collection,
+            objs,
+            self.request_size,
+            self.concurrent_requests,
+            self.max_retries,
+        )
+        print(f"✔️ Inserted {len(objs) - len(failed)} objects ({len(failed)} failed)")
+        return [o["file"] for o in failed]
+
+    def delete_by_paths(self, image_paths, verbose=True):
+        """Delete the objects stored for the given image paths."""
+        uuids = [image_uuid(path) for path in image_paths]
+        for i in range(0, len(uuids), 1000):
+            self.collection.data.delete_many(
+                where=Filter.by_id().contains_any(uuids[i : i + 1000])
+            )
+        if uuids and verbose:
+            print(f"🗑️ Deleted {len(uuids)} stale objects")
+
+    def count(self):
+        """Number of stored objects"""
+        return self.collection.aggregate.over_all(total_count=True).total_count
+
+    def iter_vectors(self, batch_size=1000):
+        """Stream every stored vector with its path, through the cursor API"""
+        paths, vectors = [], []
+        for obj in self.collection.iterator(
+            include_vector=True, return_properties=["path"], cache_size=batch_size
+        ):
+            vector = obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector
+            paths.append(obj.properties["path"])
+            vectors.append(vector)
+            if len(paths) >= batch_size:
+                yield paths, np.asarray(vectors, dtype=np.float32)
+                paths, vectors = [], []
+        if paths:
+            yield paths, np.asarray(vectors, dtype=np.float32)
+
+    def _filter(self, filters):
+        """Translate store-independent filters into a Weaviate filter"""
+        filters = check_filters(filters)
+        conditions = []
+        if filters.get("path_prefix"):
+            if self._path_filterable is None:
+                self._path_filterable = field_tokenized(self.collection, "path")
+            if not self._path_filterable:
+                raise ValueError(
+                    "path_prefix needs the 'path' property tokenized as a field; this collection "
+                    "was created with word tokenization, re-create it to filter by path"
+                )
+            conditions.append(Filter.by_property("path").like(like_prefix(filters["path_prefix"])))
+        if "format" in filters:
+            conditions.append(Filter.by_property("format").equal(filters["format"]))
+        for key, (field, comparison) in RANGE_FILTERS.items():
+            if key not in filters:
+                continue
+            prop = Filter.by_property(field)
+            if comparison == ">=":
+                conditions.append(prop.greater_or_equal(filters[key]))
+            else:
+                conditions.append(prop.less_or_equal(filters[key]))
+        if not conditions:
+            return None
+        weaviate_filter = conditions[0]
+        for condition in conditions[1:]:
+            weaviate_filter = weaviate_filter & condition
+        return weaviate_filter
+
+    def _search_one(self, query_embedding, top_k, weaviate_filter):
+        """Find the objects nearest to one embedding"""
+        response = self.collection.query.near_vector(
+            near_vector=np.asarray(query_embedding, dtype=np.float32).tolist(),
+            limit=top_k,
+            filters=weaviate_filter,
+            return_properties=["filename", "path", *FILTER_FIELDS],
+            return_metadata=MetadataQuery(distance=True),
+        )
+        return [
+            {
+                "image_path": obj.properties["path"],
+                # Weaviate reports cosine distance; return cosine similarity like the other stores
+                "distance": 1.0 - obj.metadata.distance,
+                # Plain ints and strings only, so results stay JSON-serializable
+                "metadata": {
+                    name: obj.properties[name]
+                    for name in FILTER_FIELDS
+                    if obj.properties.get(name) is not None
+                },
+            }
+            for obj in response.objects
+        ]
+
+    def search_batch(self, query_embeddings, top_k=5, filters=None, search_params=None):
+        """
+        Search for the nearest stored images of many queries, concurrently.
+
+        `search_params` {"ef": ...} is a collection setting in Weaviate: it is
+        applied to the collection (for all clients) when it changes.
+        """
+        weaviate_filter = self._filter(filters)
+        ef = (search_params or {}).get("ef")
+        if ef is not None and ef != self._ef:
+            self.collection.config.update(
+                vector_index_config=Reconfigure.VectorIndex.hnsw(ef=ef)
+            )
+            self._ef = ef
+        with METRICS.time("ann", len(query_embeddings)):
+            return list(
+                self._executor.map(
+                    lambda vector: self._search_one(vector, top_k, weaviate_filter),
+                    query_embeddings,
+                )
+            )
+
+    def close(self):
+        """Stop the search threads and close the client"""
+        self._executor.shutdown()
+        self.client.close()
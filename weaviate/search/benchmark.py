@@ -0,0 +1,139 @@
+import argparse
+import os
+import sys
+
+# Add parent directories (and repository root for shared modules) to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "image_embedding")
+)
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.ann_benchmark import (
+    add_benchmark_arguments,
+    load_vectors,
+    normalize,
+    run_sweep,
+    split_queries,
+    write_report,
+)
+from image_search import connect_client
+from weaviate_store import WeaviateImageDB
+
+
+def fetch_vectors(client, collection_name="Image"):
+    """Read every stored vector of a collection"""
+    vectors = []
+    for obj in client.collections.get(collection_name).iterator(include_vector=True):
+        vector = obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector
+        vectors.append(vector)
+    return normalize(vectors)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recall/latency benchmark of Weaviate HNSW settings"
+    )
+    add_benchmark_arguments(parser)
+    parser.add_argument(
+        "--weaviate_url", default="http://localhost:8080", help="Weaviate server URL"
+    )
+    parser.add_argument(
+        "--from_collection",
+        default=None,
+        help="Benchmark on the vectors stored in this collection (e.g. Image)",
+    )
+    parser.add_argument(
+        "--ef_construction",
+        type=int,
+        nargs="+",
+        default=[64, 128, 256],
+        help="efConstruction values to build",
+    )
+    parser.add_argument(
+        "--max_connections",
+        type=int,
+        nargs="+",
+        default=[16, 32],
+        help="maxConnections values to build",
+    )
+    parser.add_argument(
+        "--ef",
+        type=int,
+        nargs="+",
+        default=[16, 32, 64, 128, 200, 256, 512],
+        help="Search-time ef values to sweep for every build",
+    )
+    parser.add_argument(
+        "--collection",
+        default="AnnBenchmark",
+        help="Scratch collection created for the benchmark and deleted afterwards",
+    )
+    args = parser.parse_args()
+    if args.collection in ("Image", args.from_collection):
+        sys.exit("--collection must name a scratch collection, it is deleted afterwards")
+
+    client = connect_client(args.weaviate_url)
+
+    try:
+        if args.from_collection:
+            vectors = fetch_vectors(client, args.from_collection)
+            base, queries = split_queries(vectors, args.num_queries, seed=args.seed)
+            print(f"Loaded {len(vectors)} vectors from '{args.from_collection}'")
+        else:
+            base, queries = load_vectors(args)
+
+        store = None
+
+        def build(vectors, params):
+            # HNSW is built during import, so build time is the import time
+            nonlocal store
+            if client.collections.exists(args.collection):
+                client.collections.delete(args.collection)
+            store = WeaviateImageDB(
+                client, vectors.shape[1], args.collection, hnsw_params=params
+            )
+            for start in range(0, len(vectors), 10_000):
+                rows = range(start, min(start + 10_000, len(vectors)))
+                # The row index stands in for the path so results map back to ground truth
+                failed = store.upsert(
+                    [{"image_path": str(row), "vector": vectors[row]} for row in rows]
+                )
+                if failed:
+                    sys.exit(f"{len(failed)} vectors failed to import")
+
+        def search(query, top_k, search_params):
+            return [
+                int(result["image_path"])
+                for result in store.search(query, top_k, search_params=search_params)
+            ]
+
+        rows = run_sweep(
+            build,
+            search,
+            base,
+            queries,
+            builds=[
+                (
+                    f"efc{ef_construction}_m{max_connections}",
+                    {"efConstruction": ef_construction, "maxConnections": max_connections},
+                )
+                for ef_construction in args.ef_construction
+                for max_connections in args.max_connections
+            ],
+            # ef is a collection setting: the store applies it when it changes
+            searches=lambda params: [{"ef": ef} for ef in args.ef],
+            top_k=args.top_k,
+        )
+    finally:
+        if client.collections.exists(args.collection):
+            client.collections.delete(args.collection)
+        client.close()
+
+    if args.report:
+        write_report(rows, args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,36 @@ from pathlib import Path
 
 import weaviate
 
-# Add parent directory to sys.path for imports
+# Add parent directory (and repository root for shared modules) to sys.path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from image_embedding.dinov2_embedder import DINOv2Embedder
-
-
-def image_to_image_search(client, embedder, query_image_path, limit=5):
-    """Find similar images to a query image"""
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.batch_search import load_query_paths, reserve_stdout, write_jsonl
+from common.embedder import DINOv2Embedder
+from common.inference import add_backend_arguments, print_parity
+from common.metrics import add_metrics_arguments, start_metrics
+from common.patches import (
+    add_patch_arguments,
+    patch_options,
+    patch_vector_count,
+    with_patch_reranking,
+)
+from common.pipeline import search_images
+from common.quantization import add_compression_arguments
+from common.reduction import ReducedEmbedder, Reducer, add_reduction_arguments
+from common.regions import with_parents
+from common.reranking import with_reranking
+from common.vector_store import add_filter_arguments, filters_from_args
+from image_embedding.weaviate_store import QUANTIZERS, WeaviateImageDB
+
+
+def image_to_image_search(store, embedder, query_image_path, limit=5, filters=None):
+    """Find similar images to a query image
+
+    `filters` (e.g. {"format": "JPEG", "min_width": 1024}) restrict the vector
+    search itself, so up to `limit` matching images are returned.
+    """
     # Generate embedding for query image
     query_embedding = embedder.get_embedding(query_image_path)
 
@@ -19,33 +42,12 @@ def image_to_image_search(client, embedder, query_image_path, limit=5):
         print(f"Error: Could not generate embedding for {query_image_path}")
         return []
 
-    # Get the Image collection
-    image_collection = client.collections.get("Image")
-
     # Search in Weaviate
     try:
-        print("Trying search with simplified properties...")
-        response = image_collection.query.near_vector(
-            near_vector=query_embedding,
-            limit=limit,
-            return_properties=["filename", "path"],
-        )
-
-        # Process results with minimal metadata
-        image_results = []
-        for obj in response.objects:
-            image_results.append(
-                {
-                    "filename": obj.properties["filename"],
-                    "path": obj.properties["path"],
-                    "metadata": {},  # Empty metadata to avoid serialization issues
-                    "similarity": obj.metadata.certainty,
-                }
-            )
-
-        print("Search successful with simplified properties")
-        return image_results
-
+        return with_parents(store.search(query_embedding, top_k=limit, filters=filters))
+    except ValueError:
+        # Invalid filters are the caller's error, not a connection problem
+        raise
     except Exception as e:
         print(f"Error during search: {e}")
         print("Try restarting the Weaviate container if this issue persists")
@@ -61,11 +63,13 @@ def print_search_results(results, query_image):
     print(f"\nFound {len(results)} similar images to {query_image}:")
     print("-" * 50)
     for i, result in enumerate(results):
-        print(f"{i+1}. {result['filename']}")
-        print(f"   Path: {result['path']}")
+        print(f"{i+1}. {Path(result['image_path']).name}")
+        print(f"   Path: {result['image_path']}")
+        if "parent_image" in result:
+            print(f"   Region {result['region']} of {result['parent_image']}")
 
         # Safely print similarity score if available
-        similarity = result.get("similarity")
+        similarity = result.get("distance")
         if similarity is not None:
             print(f"   Similarity: {similarity:.4f}")
         else:
@@ -91,30 +95,10 @@ def print_search_results(results, query_image):
         print("-" * 50)
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Image similarity search with DINOv2")
-    parser.add_argument("query_image", help="Path to query image")
-    parser.add_argument(
-        "--model_size",
-        choices=["small", "base", "large", "giant"],
-        default="base",
-        help="DINOv2 model size",
-    )
-    parser.add_argument(
-        "--limit", type=int, default=5, help="Number of results to return"
-    )
-    parser.add_argument(
-        "--weaviate_url", default="http://localhost:8080", help="Weaviate server URL"
-    )
-
-    args = parser.parse_args()
-
-    # Initialize DINOv2 embedder
-    embedder = DINOv2Embedder(model_size=args.model_size)
-    print(f"Using device: {embedder.device}")
-
+def connect_client(weaviate_url):
+    """Connect to Weaviate over HTTP + gRPC, exiting with troubleshooting tips on failure"""
     # Connect to Weaviate using WeaviateClient with robust connection settings
-    print(f"Trying to connect to Weaviate at {args.weaviate_url}")
+    print(f"Trying to connect to Weaviate at {weaviate_url}")
 
     # Ensure Docker containers are running
     print("Tip: Make sure Weaviate container is running with proper port mapping:")
@@ -124,7 +108,7 @@ def main():
     try:
         # Try with explicit gRPC settings
         connection_params = weaviate.connect.ConnectionParams.from_url(
-            url=args.weaviate_url, grpc_port=50051
+            url=weaviate_url, grpc_port=50051
         )
 
         client = weaviate.WeaviateClient(
@@ -148,13 +132,129 @@ def main():
         print("=======================================")
         sys.exit(1)
 
-    # Search for similar images
-    results = image_to_image_search(client, embedder, args.query_image, args.limit)
+    return client
 
-    # Print results
-    print_search_results(results, args.query_image)
 
-    client.close()
+def main():
+    parser = argparse.ArgumentParser(description="Image similarity search with DINOv2")
+    parser.add_argument(
+        "query_image",
+        help="Query image, directory of query images, or text file listing one image per line",
+    )
+    parser.add_argument(
+        "--model_size",
+        choices=["small", "base", "large", "giant"],
+        default="base",
+        help="DINOv2 model size",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=5, help="Number of results to return"
+    )
+    parser.add_argument(
+        "--weaviate_url", default="http://localhost:8080", help="Weaviate server URL"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        help="Directory for the persistent embedding cache",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Write one JSON line per query to this file ('-' for stdout)",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=32, help="Query images per forward pass"
+    )
+    parser.add_argument(
+        "--concurrent_queries",
+        type=int,
+        default=8,
+        help="Number of vector searches in flight at once",
+    )
+
+    add_backend_arguments(parser)
+    add_compression_arguments(parser, dtypes=tuple(QUANTIZERS))
+    add_reduction_arguments(parser, fit=False)
+    add_patch_arguments(parser)
+    add_filter_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    # With "--output -" the results own stdout; everything else goes to stderr
+    results_output = reserve_stdout(args.output)
+    # Per-stage timings (embed, ann, fetch) and failures
+    metrics = start_metrics(args)
+    filters = filters_from_args(args)
+    query_paths = load_query_paths(args.query_image)
+
+    # Initialize DINOv2 embedder
+    embedder = DINOv2Embedder(
+        model_name=args.model_size,
+        cache_dir=args.cache_dir,
+        backend=args.backend,
+        onnx_path=args.onnx_path,
+        **patch_options(args),
+    )
+    if args.check_parity:
+        print_parity(embedder.check_parity(query_paths[:16]))
+    if args.reduction:
+        # The reduction the collection was indexed with
+        embedder = ReducedEmbedder(embedder, Reducer.load(args.reduction))
+
+    store = WeaviateImageDB(
+        connect_client(args.weaviate_url),
+        embedder.get_embedding_dimension(),
+        concurrent_queries=args.concurrent_queries,
+        dtype=args.store_dtype,
+    )
+    store = with_reranking(
+        store, args.rerank_dir, embedder.get_embedding_dimension(), args.rerank_factor
+    )
+    # Queries carry their pooled patch vectors; candidates are reranked by MaxSim
+    store = with_patch_reranking(
+        store,
+        args.patch_dir,
+        embedder.get_embedding_dimension(),
+        patch_vector_count(args.patch_pooling, args.patch_vectors),
+        args.patch_factor,
+        args.patch_dtype,
+    )
+
+    try:
+        if len(query_paths) == 1 and not args.output:
+            # Search for similar images
+            results = image_to_image_search(
+                store, embedder, query_paths[0], args.limit, filters=filters
+            )
+
+            # Print results
+            print_search_results(results, query_paths[0])
+        else:
+            # Queries are embedded in batches; each batch's searches run concurrently
+            matches = search_images(
+                query_paths,
+                embedder,
+                store,
+                top_k=args.limit,
+                batch_size=args.batch_size,
+                search_batch_size=args.concurrent_queries * 4,
+                filters=filters,
+            )
+            if args.output:
+                written = write_jsonl(
+                    ({"query": path, "results": results} for path, results in matches),
+                    results_output,
+                )
+                print(
+                    f"Wrote results for {written}/{len(query_paths)} queries to {args.output}",
+                    file=sys.stderr,
+                )
+            else:
+                for path, results in matches:
+                    print_search_results(results, path)
+    finally:
+        store.close()
+        metrics.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+
+# Add parent directory (and repository root for shared modules) to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.dedup import add_dedup_arguments, run_dedup
+from common.embedder import embedding_dimension, resolve_model_name
+from common.quantization import add_compression_arguments
+from common.reduction import Reducer, add_reduction_arguments
+from common.reranking import with_reranking
+from image_embedding.weaviate_store import QUANTIZERS, WeaviateImageDB
+from image_search import connect_client
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Near-duplicate groups and k-means clusters over an indexed collection"
+    )
+    parser.add_argument(
+        "--model_size",
+        choices=["small", "base", "large", "giant"],
+        default="base",
+        help="DINOv2 model size the collection was processed with",
+    )
+    parser.add_argument(
+        "--weaviate_url", default="http://localhost:8080", help="Weaviate server URL"
+    )
+    parser.add_argument(
+        "--collection", default="Image", help="Collection to deduplicate"
+    )
+    add_dedup_arguments(parser)
+    add_compression_arguments(parser, dtypes=tuple(QUANTIZERS))
+    add_reduction_arguments(parser, fit=False)
+    args = parser.parse_args()
+
+    if args.reduction:
+        dim = Reducer.load(args.reduction).output_dim
+    else:
+        dim = embedding_dimension(resolve_model_name(args.model_size))
+
+    store = WeaviateImageDB(
+        connect_client(args.weaviate_url),
+        dim,
+        collection_name=args.collection,
+        dtype=args.store_dtype,
+    )
+    # With --rerank_dir the export reads the local float32 copy instead of the server
+    store = with_reranking(store, args.rerank_dir, dim, args.rerank_factor)
+    try:
+        run_dedup(store, args)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
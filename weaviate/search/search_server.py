@@ -0,0 +1,128 @@
+import argparse
+import os
+import sys
+
+# Add parent directory (and repository root for shared modules) to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.embedder import DINOv2Embedder
+from common.inference import add_backend_arguments
+from common.metrics import add_metrics_arguments, start_metrics
+from common.patches import (
+    add_patch_arguments,
+    patch_options,
+    patch_vector_count,
+    with_patch_reranking,
+)
+from common.quantization import add_compression_arguments
+from common.reduction import ReducedEmbedder, Reducer, add_reduction_arguments
+from common.reranking import with_reranking
+from common.search_server import serve
+from image_embedding.weaviate_store import QUANTIZERS, WeaviateImageDB
+from image_search import connect_client
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Resident DINOv2 image search server backed by Weaviate"
+    )
+    parser.add_argument(
+        "--model_size",
+        choices=["small", "base", "large", "giant"],
+        default="base",
+        help="DINOv2 model size",
+    )
+    parser.add_argument(
+        "--weaviate_url", default="http://localhost:8080", help="Weaviate server URL"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        help="Directory for the persistent embedding cache",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind")
+    parser.add_argument(
+        "--socket", default=None, help="Serve on this Unix socket instead of TCP"
+    )
+    parser.add_argument(
+        "--max_batch_size", type=int, default=32, help="Maximum queries per forward pass"
+    )
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=5.0,
+        help="Maximum time a query waits to be batched with others",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=5, help="Default number of results per query"
+    )
+    parser.add_argument(
+        "--path_root",
+        default=None,
+        help="Allow JSON path queries for images under this directory (default: image bytes only)",
+    )
+    add_backend_arguments(parser)
+    add_compression_arguments(parser, dtypes=tuple(QUANTIZERS))
+    add_reduction_arguments(parser, fit=False)
+    add_patch_arguments(parser)
+    # The server answers GET /metrics itself
+    add_metrics_arguments(parser, port=False)
+    args = parser.parse_args()
+    metrics = start_metrics(args)
+
+    # Load the model and connect once; every request reuses them
+    embedder = DINOv2Embedder(
+        model_name=args.model_size,
+        cache_dir=args.cache_dir,
+        backend=args.backend,
+        onnx_path=args.onnx_path,
+        **patch_options(args),
+    )
+    if args.check_parity:
+        print("--check_parity needs sample images; run it with image_search.py")
+    if args.reduction:
+        # The reduction the collection was indexed with
+        embedder = ReducedEmbedder(embedder, Reducer.load(args.reduction))
+
+    store = WeaviateImageDB(
+        connect_client(args.weaviate_url),
+        embedder.get_embedding_dimension(),
+        dtype=args.store_dtype,
+    )
+    store = with_reranking(
+        store, args.rerank_dir, embedder.get_embedding_dimension(), args.rerank_factor
+    )
+    # Queries carry their pooled patch vectors; candidates are reranked by MaxSim
+    store = with_patch_reranking(
+        store,
+        args.patch_dir,
+        embedder.get_embedding_dimension(),
+        patch_vector_count(args.patch_pooling, args.patch_vectors),
+        args.patch_factor,
+        args.patch_dtype,
+    )
+
+    try:
+        serve(
+            embedder.get_embeddings,
+            lambda vector, limit, filters: store.search(
+                vector, top_k=limit, filters=filters
+            ),
+            host=args.host,
+            port=args.port,
+            socket_path=args.socket,
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+            default_top_k=args.limit,
+            path_root=args.path_root,
+        )
+    finally:
+        store.close()
+        metrics.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
 import os
+import sys
 from pathlib import Path
 
 from PIL import Image
 
+# Add repository root to sys.path for shared modules
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.image_metadata import read_image_metadata
+from common.scanner import scan_images
+
 
 def is_valid_image(file_path):
     """Check if a file is a valid image"""
@@ -21,27 +29,24 @@ def is_valid_image(file_path):
         return False
 
 
-def scan_image_directory(directory_path, recursive=True):
+def scan_image_directory(directory_path, recursive=True, workers=16):
     """Scan a directory for images
 
+    Files are kept when their leading bytes are an image signature, which is
+    much cheaper than `is_valid_image`'s full verify on large or remote trees.
+
     Args:
         directory_path: Path to scan
         recursive: Whether to scan subdirectories
+        workers: Threads listing directories and reading file headers
 
     Returns:
         list: List of valid image paths
     """
-    directory = Path(directory_path)
-
-    if recursive:
-        all_files = list(directory.glob("**/*"))
-    else:
-        all_files = list(directory.glob("*"))
-
-    # Filter for valid images
-    image_files = [f for f in all_files if is_valid_image(f)]
-
-    return image_files
+    paths = scan_images(
+        directory_path, workers=workers, check_signatures=True, recursive=recursive
+    )
+    return [Path(path) for path in paths]
 
 
 def get_image_stats(image_path):
@@ -54,17 +59,16 @@ def get_image_stats(image_path):
         dict: Dictionary of image stats
     """
     try:
-        img = Image.open(image_path)
+        # One open and one stat; only the header is parsed
+        metadata = read_image_metadata(image_path)
 
         stats = {
             "filename": Path(image_path).name,
             "path": str(image_path),
-            "width": img.width,
-            "height": img.height,
-            "format": img.format,
-            "mode": img.mode,
-            "size_kb": os.path.getsize(image_path) / 1024,
-            "aspect_ratio": img.width / img.height if img.height > 0 else 0,
+            **metadata,
+            "aspect_ratio": (
+                metadata["width"] / metadata["height"] if metadata["height"] > 0 else 0
+            ),
         }
 
         return stats